@@ -0,0 +1,210 @@
+"""
+Accuracy regression harness of the slicing engines.
+
+Every engine slices the parts of the repository, and the contour of every layer is compared with the exact section of
+the mesh at the same height (GeometryImport.exact_section). Both contours are resampled densely by arc length and the
+distances are looked up in KD-trees, which gives the Hausdorff distance and the mean deviation of the engine contour
+from the section. The sampling is seeded, so a run is repeatable and its results are compared with the golden results
+stored in accuracy_golden.json: a change of an engine that moves the contours by more than the tolerance fails the run.
+
+    python AccuracyHarness.py             # compare with the golden results, exit code 1 on drift
+    python AccuracyHarness.py --update    # store the current results as the golden results
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from Geometry4 import GeometryImport
+from PathResampling import resample_rings
+
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'accuracy_golden.json')
+DEFAULT_PARTS = ('Part2.stl', 'NewConeCirc.STL', 'FromRP.STL')
+DEFAULT_ENGINES = ('alpha', 'raster')
+DEFAULT_SETTINGS = {'number_sampling_points': 100_000, 'layer_height': 2.0, 'alpha_value': 0.2, 'seed': 0,
+                    'spacing': 0.05}
+# Allowed growth of the Hausdorff distance and of the mean deviation of a part over the golden results in mm
+DEFAULT_TOLERANCE = {'hausdorff': 0.25, 'mean': 0.05}
+
+
+def exterior_rings(contours: np.ndarray) -> np.ndarray:
+    """
+    Keeps the rings of a stacked contour array that do not lie inside another ring of the same layer. The alpha shape
+    and raster engines only trace the exterior rings, while the exact section also contains the holes; the orientation
+    cannot tell them apart on meshes with inward normals.
+
+    :param contours: np.ndarray, (n, k) array of the stacked closed rings of one layer.
+    :return: np.ndarray, (m, k) array of the exterior rings.
+    """
+    import shapely
+
+    ids = GeometryImport.ring_ids(contours[:, :3])
+    rings = [np.flatnonzero(ids == ring) for ring in np.unique(ids)]
+    rings = [ring for ring in rings if len(ring) > 3]
+    if len(rings) < 2:
+        return contours[np.concatenate(rings)] if rings else contours[:0]
+    polygons = shapely.polygons([contours[ring, :2] for ring in rings])
+    inside = [any(shapely.contains(other, shapely.point_on_surface(polygon)) for other in polygons
+                  if other is not polygon) for polygon in polygons]
+    return contours[np.concatenate([ring for ring, hole in zip(rings, inside) if not hole])]
+
+
+def deviation(contours: np.ndarray, reference: np.ndarray, spacing: float = 0.05) -> dict:
+    """
+    Measures how far the contour of a layer is from a reference contour. Both are resampled every spacing mm along
+    their rings, so the distances between the samples approximate the distances between the curves to spacing / 2.
+
+    :param contours: np.ndarray, (n, k) array of the stacked closed rings of the engine, k >= 3.
+    :param reference: np.ndarray, (m, k) array of the stacked closed rings of the reference.
+    :param spacing: float, distance between the samples in mm.
+    :return: dict, 'hausdorff' the symmetric Hausdorff distance and 'mean' the mean distance of the engine contour
+        from the reference in mm.
+    """
+    from scipy.spatial import cKDTree
+
+    samples = [resample_rings(ring[:, :3], GeometryImport.ring_ids(ring[:, :3]), spacing=spacing)[0][:, :2]
+               for ring in (contours, reference)]
+    to_reference, _ = cKDTree(samples[1]).query(samples[0])
+    to_contours, _ = cKDTree(samples[0]).query(samples[1])
+    return {'hausdorff': float(max(to_reference.max(), to_contours.max())), 'mean': float(to_reference.mean())}
+
+
+def measure(filepath: str, engine: str, settings=None, processes=None) -> dict:
+    """
+    Slices a part with an engine and compares every layer with the exact section at the height of the layer.
+
+    :param filepath: str, path of the stl file.
+    :param engine: str, slicing engine, see GeometryImport.parallel_generate_sequential_contour_points.
+    :param settings: dict, overrides of DEFAULT_SETTINGS.
+    :param processes: int, number of processes of the shared worker pool.
+    :return: dict, 'seconds' of the slicing, 'layers' and 'missing_layers' (layers of the section that the engine
+        has no contour for), the largest 'hausdorff' distance, the 'mean' deviation over the layers and the
+        'hausdorff' distance of every layer as 'layer_hausdorff'.
+    """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    g = GeometryImport(filepath, number_sampling_points=settings['number_sampling_points'], seed=settings['seed'])
+    start = time.perf_counter()
+    contours = g.parallel_generate_sequential_contour_points(alpha_value=settings['alpha_value'],
+                                                             layer_height=settings['layer_height'],
+                                                             with_normals=True, processes=processes, engine=engine)
+    seconds = time.perf_counter() - start
+
+    triangles, face_normals = g.load_triangles()
+    # The layers of the exact engine, cut in the middle of every band of the mesh
+    z_layers = np.arange(triangles[:, :, 2].min(), triangles[:, :, 2].max(), settings['layer_height'])
+    z_layers = z_layers + settings['layer_height'] / 2
+    engine_z = np.unique(contours[:, 2])
+    layer_hausdorff, layer_mean, missing = [], [], 0
+    for z_layer in z_layers:
+        # The other engines place a contour in the middle of the band of sampled points, which is slightly off the
+        # middle of the band of the mesh; the section is cut at the height of the engine contour
+        nearest = engine_z[np.argmin(np.abs(engine_z - z_layer))] if len(engine_z) else np.inf
+        matched = abs(nearest - z_layer) < settings['layer_height'] / 2
+        reference = exterior_rings(GeometryImport.exact_section(triangles, face_normals,
+                                                                nearest if matched else z_layer))
+        if len(reference) == 0:
+            continue
+        if not matched:
+            missing += 1
+            continue
+        result = deviation(contours[contours[:, 2] == nearest], reference, spacing=settings['spacing'])
+        layer_hausdorff.append(result['hausdorff'])
+        layer_mean.append(result['mean'])
+
+    return {'seconds': seconds, 'layers': len(layer_hausdorff), 'missing_layers': missing,
+            'hausdorff': max(layer_hausdorff, default=0.0), 'mean': float(np.mean(layer_mean)) if layer_mean else 0.0,
+            'layer_hausdorff': [round(value, 4) for value in layer_hausdorff]}
+
+
+def run(parts=DEFAULT_PARTS, engines=DEFAULT_ENGINES, settings=None, processes=None) -> dict:
+    """
+    Measures every engine on every part.
+
+    :return: dict, the result of measure by part name and engine.
+    """
+    results = {}
+    for part in parts:
+        results[os.path.basename(part)] = {engine: measure(part, engine, settings, processes) for engine in engines}
+    return results
+
+
+def compare(results: dict, golden: dict, tolerance=None) -> list[str]:
+    """
+    Compares results with the golden results.
+
+    :param results: dict, results as returned by run.
+    :param golden: dict, golden results in the same layout.
+    :param tolerance: dict, overrides of DEFAULT_TOLERANCE.
+    :return: list, a message for every part and engine that drifted beyond the tolerance or has no golden result.
+    """
+    tolerance = {**DEFAULT_TOLERANCE, **(tolerance or {})}
+    drift = []
+    for part, engines in results.items():
+        for engine, result in engines.items():
+            expected = golden.get(part, {}).get(engine)
+            if expected is None:
+                drift.append(f'{part} {engine}: no golden result, run with --update')
+                continue
+            for metric in ('hausdorff', 'mean'):
+                if result[metric] > expected[metric] + tolerance[metric]:
+                    drift.append(f'{part} {engine}: {metric} {result[metric]:.3f} mm, golden '
+                                 f'{expected[metric]:.3f} mm + {tolerance[metric]} mm')
+            if result['missing_layers'] > expected['missing_layers']:
+                drift.append(f"{part} {engine}: {result['missing_layers']} layers without contour, golden "
+                             f"{expected['missing_layers']}")
+    return drift
+
+
+def print_results(results: dict) -> None:
+    """
+    Prints the accuracy and speed of every engine on every part.
+    """
+    for part, engines in results.items():
+        for engine, result in engines.items():
+            print(f"{part} {engine}: {result['seconds']:.2f} s, {result['layers']} layers, deviation from the exact "
+                  f"section: largest {result['hausdorff']:.3f} mm, mean {result['mean']:.3f} mm, "
+                  f"{result['missing_layers']} layers without contour")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Compare the slicing engines with exact mesh sections.')
+    parser.add_argument('parts', nargs='*', default=list(DEFAULT_PARTS))
+    parser.add_argument('--engines', nargs='+', default=list(DEFAULT_ENGINES))
+    parser.add_argument('--golden', default=GOLDEN_FILE)
+    parser.add_argument('--update', action='store_true', help='store the results as the golden results')
+    parser.add_argument('-p', '--processes', type=int, default=None, help='processes of the shared worker pool')
+    args = parser.parse_args(argv)
+
+    results = run(args.parts, args.engines, processes=args.processes)
+    print("================")
+    print_results(results)
+
+    golden = {}
+    if os.path.exists(args.golden):
+        with open(args.golden) as file:
+            golden = json.load(file)
+    if args.update:
+        for part, engines in results.items():
+            golden.setdefault(part, {}).update(engines)
+        golden['settings'] = DEFAULT_SETTINGS
+        with open(args.golden, 'w') as file:
+            json.dump(golden, file, indent=1, sort_keys=True)
+        print(f"Stored the golden results in {args.golden}")
+        return 0
+
+    if golden.get('settings', DEFAULT_SETTINGS) != DEFAULT_SETTINGS:
+        print(f"The golden results were computed with {golden['settings']}, run with --update")
+        return 1
+    drift = compare(results, golden)
+    for message in drift:
+        print(f"    Drift: {message}")
+    print(f"{len(drift)} engines drifted beyond the tolerance" if drift else "No drift beyond the tolerance")
+    return 1 if drift else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+Command line entry point to generate toolpaths and RAPID modules for a whole directory (or a manifest) of STL parts.
+
+Every combination of part and parameter set is a job. The jobs run through a bounded queue and all of them share the
+worker pool of Geometry4, so the pool is started only once for the whole batch. The state of every finished job is
+recorded in batch_state.json in the output directory: jobs whose outputs are up to date are skipped and a batch that
+was interrupted continues where it stopped when it is started again.
+
+    python BatchProcessor.py parts/ -o toolpaths/ --params params.json
+
+The manifest is a JSON list of {"stl": path, "params": {...}} entries, the parameter file a JSON list of parameter sets,
+e.g. [{"layer_height": 0.5, "alpha_value": 0.2}, {"layer_height": 0.25, "mode": "spiral"}]. A set with a "cusp_height"
+uses adaptive layer heights up to its layer_height, see LayerSchedule, and an "engine" selects the slicing engine
+('alpha', 'exact' or 'raster'). "optimise_travel": true orders the islands of every layer and the start points of the
+rings to shorten the air moves, see IslandOrdering, and a "tool_radius" moves the contours to the centre of the
+ball of the forming tool along the surface normals, on its "tool_side" ('outside' or 'inside'). A set with a "wobj"
+[x, y, z, q1, q2, q3, q4] places the part in the work object of the robot: the targets are then checked with the
+inverse kinematics of the IRB 4600 and get its configuration data, and the numbers of unreachable and wrist singular
+targets are recorded in the batch state. Every job also records the cycle time predicted for its RAPID module with
+the speed and zone data of its set, see CycleTime.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from CycleTime import estimate_cycle_time
+from Geometry4 import GeometryImport, get_worker_pool
+from RAPIDCodeGenerator import RAPIDGenerator
+from RobotKinematics import IRB4600
+from ToolpathFormat import write_toolpath
+
+STATE_FILE = 'batch_state.json'
+DEFAULT_PARAMS = {'alpha_value': 0.2, 'layer_height': 0.5, 'mode': 'layered', 'points_per_layer': 200,
+                  'number_sampling_points': 500_000, 'smoothing': 2, 'speed': 'v100', 'zone': 'z1'}
+
+
+class BatchProcessor:
+
+    def __init__(self, output_dir: str, jobs: int = 2, processes=None) -> None:
+        """
+        Initializes a BatchProcessor object.
+
+        :param output_dir: str, directory the toolpaths, RAPID modules and the batch state are written to.
+        :param jobs: int, number of parts processed at the same time. The queue holds at most twice as many jobs.
+        :param processes: int, number of processes of the shared worker pool. Defaults to the number of cores.
+        """
+        self.output_dir = output_dir
+        self.jobs = jobs
+        self.processes = processes
+        self.state_path = os.path.join(output_dir, STATE_FILE)
+        self._state_lock = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+        self.state = self._load_state()
+
+    def _load_state(self) -> dict:
+        if not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path) as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError):
+            print(f"Ignoring unreadable batch state {self.state_path}")
+            return {}
+
+    def _save_state(self) -> None:
+        temporary = self.state_path + '.part'
+        with open(temporary, 'w') as file:
+            json.dump(self.state, file, indent=2)
+        os.replace(temporary, self.state_path)
+
+    @staticmethod
+    def make_jobs(stl_files, parameter_sets) -> list[dict]:
+        """
+        Combines every part with every parameter set.
+
+        :param stl_files: list, paths of the STL files.
+        :param parameter_sets: list, dicts of parameters overriding DEFAULT_PARAMS.
+        :return: list, job dicts with the keys 'id', 'stl' and 'params'.
+        """
+        jobs = []
+        for stl in stl_files:
+            for parameters in parameter_sets:
+                params = {**DEFAULT_PARAMS, **parameters}
+                digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:10]
+                stem = os.path.splitext(os.path.basename(stl))[0].replace(' ', '_').replace(',', '')
+                jobs.append({'id': f'{stem}_{digest}', 'stl': stl, 'params': params})
+        return jobs
+
+    def outputs(self, job: dict) -> tuple[str, str]:
+        """
+        :return: tuple, paths of the toolpath file and of the RAPID module of a job.
+        """
+        base = os.path.join(self.output_dir, job['id'])
+        return base + '.tp', base + '.mod'
+
+    def is_up_to_date(self, job: dict) -> bool:
+        """
+        A job is up to date when it finished before, its outputs exist, and neither the parameters nor the STL file
+        (size and modification time) changed since.
+        """
+        record = self.state.get(job['id'])
+        if record is None or record.get('status') != 'done':
+            return False
+        if not all(os.path.exists(path) for path in self.outputs(job)):
+            return False
+        stat = os.stat(job['stl'])
+        return (record['params'] == job['params'] and record['stl_size'] == stat.st_size and
+                record['stl_mtime'] == stat.st_mtime)
+
+    def run_job(self, job: dict) -> dict:
+        """
+        Slices one part and writes its toolpath and RAPID module.
+
+        :param job: dict, job as returned by make_jobs.
+        :return: dict, the record stored in the batch state.
+        """
+        params = job['params']
+        stat = os.stat(job['stl'])
+        start = time.perf_counter()
+
+        g = GeometryImport(filepath=job['stl'], number_sampling_points=params['number_sampling_points'],
+                           voxel_size=params.get('voxel_size'))
+        toolpath = self.toolpath(g, params, self.processes)
+        rotation, module, reach = self.program(g, toolpath, params)
+
+        toolpath_path, module_path = self.outputs(job)
+        write_toolpath(toolpath_path, np.column_stack((toolpath, rotation)))
+        with open(module_path + '.part', 'w') as file:
+            file.write(module)
+        os.replace(module_path + '.part', module_path)
+
+        return {'status': 'done', 'stl': job['stl'], 'params': params, 'stl_size': stat.st_size,
+                'stl_mtime': stat.st_mtime, 'targets': len(toolpath), 'layers': len(np.unique(toolpath[:, 2])),
+                'seconds': time.perf_counter() - start, **reach}
+
+    @staticmethod
+    def toolpath(g: GeometryImport, params: dict, processes=None) -> np.ndarray:
+        """
+        Slices a part with the parameters of a job.
+
+        :param g: GeometryImport, the part.
+        :param params: dict, job parameters, see DEFAULT_PARAMS.
+        :param processes: int, number of processes of the shared worker pool.
+        :return: np.ndarray, (n, 6) array of the targets and their surface normals.
+        """
+        return g.parallel_generate_sequential_contour_points(alpha_value=params['alpha_value'],
+                                                             layer_height=params['layer_height'],
+                                                             with_normals=True, mode=params['mode'],
+                                                             points_per_layer=params['points_per_layer'],
+                                                             processes=processes,
+                                                             cusp_height=params.get('cusp_height'),
+                                                             engine=params.get('engine', 'alpha'),
+                                                             optimise_travel=params.get('optimise_travel', False),
+                                                             tool_radius=params.get('tool_radius'),
+                                                             tool_side=params.get('tool_side', 'outside'))
+
+    @staticmethod
+    def program(g: GeometryImport, toolpath: np.ndarray, params: dict) -> tuple[np.ndarray, str, dict]:
+        """
+        Orients the tool along a toolpath and generates its RAPID module.
+
+        :param g: GeometryImport, the part the toolpath was generated from.
+        :param toolpath: np.ndarray, (n, 6) array of the targets and their surface normals.
+        :param params: dict, job parameters, see DEFAULT_PARAMS.
+        :return: tuple, (n, 4) quaternions of the targets, the module text and a dict of the figures recorded with
+            the job: the predicted cycle time in seconds (see CycleTime.py) and the reachability counts if the
+            parameters place the part in a work object.
+        """
+        rotation = g.rot_T_ROB1(toolpath[:, :3], toolpath[:, 3:], smoothing=params['smoothing'])
+        # The fine points default to the ends of the layers, or the end of a spiral path
+        cycle_time = estimate_cycle_time(toolpath[:, :3], rotation, params['speed'], params['zone'])['total']
+        reach = {'cycle_time': round(cycle_time, 1)}
+        configuration = np.array([0, 0, 0, 0])
+        if params.get('wobj') is not None:
+            robot = IRB4600(wobj=(params['wobj'][:3], params['wobj'][3:]))
+            ring_ids = None if params['mode'] == 'spiral' else g.ring_ids(toolpath[:, :3])
+            check = robot.check_path(toolpath[:, :3], rotation, ring_ids=ring_ids)
+            configuration = check['confdata']
+            reach |= {'cfx': check['cfx'], 'unreachable': int(np.count_nonzero(~check['reachable'])),
+                      'singular': int(np.count_nonzero(check['singular']))}
+        module = RAPIDGenerator(speed=params['speed'], zone=params['zone']).MoveL(toolpath[:, :3], rotation=rotation,
+                                                                                 configuration=configuration)
+        return rotation, module, reach
+
+    def _run_and_record(self, job: dict) -> dict:
+        try:
+            record = self.run_job(job)
+        except Exception as error:
+            traceback.print_exc()
+            record = {'status': 'failed', 'stl': job['stl'], 'params': job['params'], 'error': repr(error)}
+        with self._state_lock:
+            self.state[job['id']] = record
+            self._save_state()
+        print(f"[{record['status']}] {job['id']}")
+        return record
+
+    def run(self, jobs: list[dict]) -> dict:
+        """
+        Runs all the jobs that are not up to date through a bounded queue and prints a throughput summary.
+
+        :param jobs: list, jobs as returned by make_jobs.
+        :return: dict, the summary.
+        """
+        start = time.perf_counter()
+        pending = [job for job in jobs if not self.is_up_to_date(job)]
+        skipped = len(jobs) - len(pending)
+        print(f"{len(jobs)} jobs, {skipped} up to date, {len(pending)} to run")
+
+        # Start the shared pool before the job threads use it
+        get_worker_pool(self.processes)
+        slots = threading.BoundedSemaphore(2 * self.jobs)
+        records = []
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = []
+            for job in pending:
+                slots.acquire()
+                future = executor.submit(self._run_and_record, job)
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+            records = [future.result() for future in futures]
+
+        wall = time.perf_counter() - start
+        done = [record for record in records if record['status'] == 'done']
+        summary = {'jobs': len(jobs), 'skipped': skipped, 'done': len(done), 'failed': len(records) - len(done),
+                   'targets': sum(record['targets'] for record in done),
+                   'layers': sum(record['layers'] for record in done), 'seconds': wall}
+        print("================")
+        print(f"Processed {summary['done']} parts ({summary['failed']} failed, {skipped} skipped) in {wall:.1f} s")
+        if done and wall > 0:
+            print(f"Throughput: {3600 * len(done) / wall:.1f} parts/h, {summary['layers'] / wall:.1f} layers/s, "
+                  f"{summary['targets'] / wall:.0f} targets/s")
+        return summary
+
+
+def find_parts(source: str) -> list[tuple[str, dict]]:
+    """
+    Lists the parts of a directory, or the parts of a manifest together with their own parameters.
+
+    :param source: str, a directory of STL files or a JSON manifest.
+    :return: list, tuples of the STL path and a dict of part specific parameters.
+    """
+    if os.path.isdir(source):
+        files = sorted(set(glob.glob(os.path.join(source, '*.stl')) + glob.glob(os.path.join(source, '*.STL'))))
+        return [(file, {}) for file in files]
+    with open(source) as file:
+        manifest = json.load(file)
+    base = os.path.dirname(os.path.abspath(source))
+    return [(os.path.join(base, entry['stl']), entry.get('params', {})) for entry in manifest]
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description='Generate toolpaths and RAPID modules for a batch of STL parts.')
+    parser.add_argument('source', help='directory of STL files or JSON manifest')
+    parser.add_argument('-o', '--output', default='toolpaths', help='output directory')
+    parser.add_argument('--params', help='JSON file with a list of parameter sets')
+    parser.add_argument('-j', '--jobs', type=int, default=2, help='number of parts processed at the same time')
+    parser.add_argument('-p', '--processes', type=int, default=None, help='processes of the shared worker pool')
+    args = parser.parse_args(argv)
+
+    parameter_sets = [{}]
+    if args.params:
+        with open(args.params) as file:
+            parameter_sets = json.load(file)
+
+    jobs = []
+    for stl, part_params in find_parts(args.source):
+        jobs.extend(BatchProcessor.make_jobs([stl], [{**params, **part_params} for params in parameter_sets]))
+    return BatchProcessor(args.output, jobs=args.jobs, processes=args.processes).run(jobs)
+
+
+if __name__ == "__main__":
+    main()
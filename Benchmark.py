@@ -0,0 +1,469 @@
+"""
+Benchmarks of the toolpath generation. Every benchmark runs in fresh interpreters where start up cost matters, so the
+numbers include the import time a user or a spawned worker actually pays.
+
+    python Benchmark.py --part FromRP.STL --points 100000
+"""
+
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ('matplotlib', 'pandas', 'trimesh', 'scipy', 'shapely', 'pygeos', 'sklearn')
+
+
+def _run_python(code: str) -> str:
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+
+def _loaded_heavy_modules() -> list[str]:
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+def cold_start_import(module: str = 'Geometry4', repeat: int = 3) -> dict:
+    """
+    Measures the time a fresh interpreter needs to import a module and which heavy dependencies it loads.
+
+    :param module: str, name of the module.
+    :param repeat: int, number of fresh interpreters; the fastest run is reported.
+    :return: dict, import time in seconds and the heavy modules loaded by the import.
+    """
+    code = (f"import sys, time; start = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - start); "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    times, loaded = [], ''
+    for _ in range(repeat):
+        seconds, loaded = (_run_python(code).split('\n') + [''])[:2]
+        times.append(float(seconds))
+    return {'seconds': min(times), 'heavy_modules': [name for name in loaded.split(',') if name]}
+
+
+def _worker_ready(_):
+    import os
+    start = time.perf_counter()
+    import Geometry4  # noqa: F401
+    return os.getpid(), time.perf_counter() - start, _loaded_heavy_modules()
+
+
+def worker_spawn(processes: int = 2) -> dict:
+    """
+    Measures how long a spawn based pool needs until every worker has imported the slicing core, which is what the
+    shared pool of Geometry4 pays once per worker.
+
+    :param processes: int, number of worker processes.
+    :return: dict, total start up time, the import time of every worker and the heavy modules loaded by the workers.
+    """
+    context = multiprocessing.get_context('spawn')
+    start = time.perf_counter()
+    with context.Pool(processes) as pool:
+        results = pool.map(_worker_ready, range(processes), chunksize=1)
+        seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'worker_import_seconds': [result[1] for result in results],
+            'heavy_modules': sorted({name for result in results for name in result[2]})}
+
+
+def headless_slicing(filepath: str, number_sampling_points: int, layer_height: float, alpha_value: float) -> dict:
+    """
+    Slices a part in a fresh interpreter without plotting and checks that neither matplotlib nor pandas got imported.
+
+    :return: dict, slicing time in seconds, number of contour points and the heavy modules that were loaded.
+    """
+    code = (f"import sys, time\n"
+            f"from Geometry4 import GeometryImport\n"
+            f"start = time.perf_counter()\n"
+            f"g = GeometryImport({filepath!r}, number_sampling_points={number_sampling_points})\n"
+            f"contours = g.parallel_generate_sequential_contour_points(alpha_value={alpha_value}, "
+            f"layer_height={layer_height})\n"
+            f"print(time.perf_counter() - start)\n"
+            f"print(len(contours))\n"
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n")
+    lines = _run_python(code).split('\n')
+    seconds, points, loaded = lines[-3:]
+    loaded = [name for name in loaded.split(',') if name]
+    if 'matplotlib' in loaded or 'pandas' in loaded:
+        raise AssertionError(f'Headless slicing imported {loaded}')
+    return {'seconds': float(seconds), 'contour_points': int(points), 'heavy_modules': loaded}
+
+
+def point_store_memory(filepath: str, number_sampling_points: int = 500_000) -> dict:
+    """
+    Compares the peak memory of sampling and centring a point cloud the way get_points used to (trimesh sampling,
+    separate x/y/z copies, shifted copies and a column stack) with the PointStore in float64 and float32. The mesh
+    itself is loaded before the measurement starts.
+
+    :return: dict, peak bytes measured with tracemalloc for every variant and the peak estimated by the store.
+    """
+    import tracemalloc
+
+    import numpy as np
+    import trimesh
+
+    from PointStore import PointStore
+
+    mesh = trimesh.load_mesh(filepath)
+    mesh.triangles, mesh.face_normals, mesh.area_faces  # cached properties, not part of the measurement
+
+    def legacy():
+        pointcloud, face_index = trimesh.sample.sample_surface(mesh, number_sampling_points)
+        normals = np.asarray(mesh.face_normals[face_index])
+        x, y, z = np.array(pointcloud[:, 0]), np.array(pointcloud[:, 1]), np.array(pointcloud[:, 2])
+        x, y, z = x - (x.max() + x.min()) / 2, y - (y.max() + y.min()) / 2, z - (z.max() + z.min()) / 2
+        return np.column_stack((x, y, z)), normals
+
+    def lean():
+        # Buffers of 24 bytes per point plus as much again for the temporaries of the sampling chunks
+        store = PointStore.from_mesh(mesh, number_sampling_points, dtype=np.float32,
+                                     memory_budget=48 * number_sampling_points)
+        store.center()
+        return store
+
+    results = {}
+    for name, sample in (('legacy', legacy),
+                         ('float64', lambda: PointStore.from_mesh(mesh, number_sampling_points).center()),
+                         ('float32', lean)):
+        tracemalloc.start()
+        sample()
+        results[name] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    results['float32_estimated'] = lean().estimated_peak_bytes
+    return results
+
+
+def _best_time(function, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def kernel_backends(n_points: int = 50_000, repeat: int = 5, seed: int = 0) -> dict:
+    """
+    Runs every kernel of Kernels on the same random input with all the available backends and times them, see
+    tests/test_kernels.py for the agreement of the backends. The first call of a compiled kernel (compilation or
+    loading from the cache) is not timed.
+
+    :param n_points: int, number of points of the band the kernels work on.
+    :param repeat: int, number of runs of every kernel; the fastest run is reported.
+    :param seed: int, seed of the random input.
+    :return: dict, seconds of every kernel by backend.
+    """
+    import numpy as np
+    from scipy.spatial import Delaunay
+
+    import Kernels
+
+    rng = np.random.default_rng(seed)
+    points = rng.random((n_points, 2)) * 100.0
+    simplices = Delaunay(points).simplices
+    z_sorted = np.sort(rng.random(20 * n_points) * 100.0)
+    z_low = np.arange(0.0, 100.0, 0.1)
+    ring = rng.permutation(n_points)
+    path = rng.random((min(n_points, 2_000), 2))
+
+    kernels = {'circumradius_filter': lambda backend: Kernels.circumradius_filter(points, simplices, 0.5, backend),
+               'chain_segments': lambda backend: Kernels.chain_segments(ring, np.roll(ring, -1), backend),
+               'nearest_neighbour_order': lambda backend: Kernels.nearest_neighbour_order(path, 0, backend),
+               'band_bounds': lambda backend: Kernels.band_bounds(z_sorted, z_low, z_low + 0.1, True, backend)}
+    results = {}
+    for name, kernel in kernels.items():
+        results[name] = {}
+        for backend in Kernels.available_backends():
+            kernel(backend)
+            results[name][backend] = _best_time(lambda: kernel(backend), repeat)
+    return results
+
+
+def alpha_prefilter(filepath: str, number_sampling_points: int, layer_height: float, alpha_value: float,
+                    n_layers: int = 5) -> dict:
+    """
+    Compares the alpha shape of evenly spread layers of a part with and without the grid prefilter of alpha_shape: the
+    number of points that reach the Delaunay triangulation, the time and the Hausdorff distance between the exterior
+    rings.
+
+    :return: dict, totals of the points and seconds of both variants and the largest Hausdorff distance.
+    """
+    import numpy as np
+    from shapely.geometry import Polygon
+
+    from Geometry4 import GeometryImport
+
+    points, _ = GeometryImport(filepath, number_sampling_points=number_sampling_points).sample_surface()
+    z_values = np.linspace(points[:, 2].min(), points[:, 2].max() - layer_height, n_layers)
+    result = {'points': 0, 'kept': 0, 'seconds': 0.0, 'prefiltered_seconds': 0.0, 'hausdorff': 0.0}
+    for z in z_values:
+        band = points[(points[:, 2] >= z) & (points[:, 2] < z + layer_height), :2]
+        shapes = []
+        for prefilter, key in ((False, 'seconds'), (True, 'prefiltered_seconds')):
+            start = time.perf_counter()
+            shapes.append(GeometryImport.alpha_shape(band, alpha_value, prefilter=prefilter))
+            result[key] += time.perf_counter() - start
+        result['points'] += len(band)
+        result['kept'] += len(GeometryImport.grid_prefilter(band, alpha_value))
+        exteriors = [Polygon(max(getattr(shape, 'geoms', [shape]), key=lambda part: part.area).exterior)
+                     for shape in shapes]
+        result['hausdorff'] = max(result['hausdorff'], exteriors[0].hausdorff_distance(exteriors[1]))
+    return result
+
+
+def raster_engine(filepath: str, number_sampling_points: int, layer_height: float, alpha_value: float,
+                  n_layers: int = 5, resolutions=(4, 8, 16, 32)) -> dict:
+    """
+    Compares the raster engine at several resolutions with the alpha shape engine on evenly spread layers of a part.
+    Both are measured against the exact section of the mesh in the middle of every band with the metrics of
+    AccuracyHarness.deviation.
+
+    :param resolutions: tuple, pixels per alpha radius of the raster runs.
+    :return: dict, seconds, largest Hausdorff distance and mean deviation of every engine.
+    """
+    import numpy as np
+
+    from AccuracyHarness import deviation, exterior_rings
+    from Geometry4 import GeometryImport
+
+    g = GeometryImport(filepath, number_sampling_points=number_sampling_points)
+    points, normals = g.sample_surface()
+    triangles, face_normals = g.load_triangles()
+    engines = {'alpha': lambda band, band_normals, z: GeometryImport._layer_contours(band, band_normals, z,
+                                                                                     alpha_value)}
+    for resolution in resolutions:
+        engines[f'raster {resolution}'] = (lambda band, band_normals, z, resolution=resolution:
+                                           GeometryImport.raster_section(band, band_normals, z, alpha_value,
+                                                                         pixels_per_radius=resolution))
+    result = {name: {'seconds': 0.0, 'hausdorff': 0.0, 'mean': 0.0} for name in engines}
+
+    z_values = np.linspace(points[:, 2].min(), points[:, 2].max() - layer_height, n_layers)
+    for z in z_values:
+        in_band = (points[:, 2] >= z) & (points[:, 2] < z + layer_height)
+        z_layer = z + layer_height / 2
+        exact = exterior_rings(GeometryImport.exact_section(triangles, face_normals, z_layer))
+        for name, engine in engines.items():
+            start = time.perf_counter()
+            contours = engine(points[in_band, :2], normals[in_band], z_layer)
+            result[name]['seconds'] += time.perf_counter() - start
+            layer = deviation(contours, exact)
+            result[name]['hausdorff'] = max(result[name]['hausdorff'], layer['hausdorff'])
+            result[name]['mean'] += layer['mean'] / n_layers
+    return result
+
+
+def island_ordering(filepath: str, layer_height: float, processes=None) -> dict:
+    """
+    Measures the air travel of the exact section contours of a part before and after IslandOrdering.optimise_travel.
+
+    :return: dict, number of rings and layers, air travel before and after in mm and the seconds of the optimisation.
+    """
+    import numpy as np
+
+    from Geometry4 import GeometryImport
+    from IslandOrdering import optimise_travel
+    from PathResampling import contour_ring_ids
+
+    g = GeometryImport(filepath, number_sampling_points=1000)
+    contours = g.parallel_generate_sequential_contour_points(layer_height=layer_height, with_normals=True,
+                                                             processes=processes, engine='exact')
+    start = time.perf_counter()
+    _, travel = optimise_travel(contours)
+    return {'rings': len(np.unique(contour_ring_ids(contours))), 'layers': len(np.unique(contours[:, 2])),
+            'before': travel['before'], 'after': travel['after'], 'seconds': time.perf_counter() - start}
+
+
+def tool_compensation(filepath: str, layer_height: float, tool_radius: float = 5.0, processes=None) -> dict:
+    """
+    Times the tool radius compensation of the exact section contours of a part along their normals, batched on the
+    worker pool and in one process, against buffering every ring as its own shapely polygon in a Python loop.
+
+    :return: dict, number of layers and rings and the seconds of the pool, single process and loop versions.
+    """
+    import numpy as np
+    import shapely
+
+    from Geometry4 import GeometryImport
+    from PathResampling import contour_ring_ids, ring_bounds
+
+    g = GeometryImport(filepath, number_sampling_points=1000)
+    contours = g.parallel_generate_sequential_contour_points(layer_height=layer_height, with_normals=True,
+                                                             processes=processes, engine='exact')
+    start = time.perf_counter()
+    g.compensate_tool_radius(contours, tool_radius, processes=processes)
+    pool_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    GeometryImport.offset_contours_along_normals(contours, tool_radius)
+    single_seconds = time.perf_counter() - start
+
+    starts, counts = ring_bounds(contour_ring_ids(contours))
+    start = time.perf_counter()
+    for lower, count in zip(starts, counts):
+        if count >= 4:
+            shapely.Polygon(contours[lower:lower + count, :2]).buffer(tool_radius)
+    loop_seconds = time.perf_counter() - start
+    return {'layers': len(np.unique(contours[:, 2])), 'rings': len(starts), 'pool_seconds': pool_seconds,
+            'single_seconds': single_seconds, 'loop_seconds': loop_seconds}
+
+
+def point_cloud_import(filepath: str, layer_height: float, alpha_value: float, n_points: int = 2_000_000,
+                       voxel_size: float = 0.2, n_layers: int = 5) -> dict:
+    """
+    Writes points sampled on a part as a binary PLY file with normals and as an ASCII XYZ file without, streams both
+    through PointCloudImport and measures the alpha shape contours of the downsampled clouds against the exact section
+    of the mesh with the metrics of AccuracyHarness.deviation.
+
+    :param n_points: int, number of points of the written clouds.
+    :param voxel_size: float, edge length of the voxels in mm.
+    :return: dict, for every format the file bytes, the peak bytes measured with tracemalloc while it is read, the
+        seconds, the number of points kept and the largest Hausdorff distance and mean deviation of the contours.
+    """
+    import tempfile
+    import tracemalloc
+
+    import numpy as np
+    import trimesh
+
+    from AccuracyHarness import deviation, exterior_rings
+    from Geometry4 import GeometryImport
+    from PointStore import PointStore
+
+    store = PointStore.from_mesh(trimesh.load_mesh(filepath), n_points, dtype=np.float32, seed=0)
+    triangles, face_normals = GeometryImport(filepath).load_triangles()
+    result = {}
+    with tempfile.TemporaryDirectory() as directory:
+        ply = os.path.join(directory, 'scan.ply')
+        with open(ply, 'wb') as file:
+            file.write((f'ply\nformat binary_little_endian 1.0\nelement vertex {n_points}\n' +
+                        ''.join(f'property float {name}\n' for name in ('x', 'y', 'z', 'nx', 'ny', 'nz')) +
+                        'end_header\n').encode('ascii'))
+            np.hstack((store.points, store.normals)).astype('<f4').tofile(file)
+        xyz = os.path.join(directory, 'scan.xyz')
+        np.savetxt(xyz, store.points, fmt='%.4f')
+
+        for name, path in (('binary ply', ply), ('ascii xyz', xyz)):
+            g = GeometryImport(path, voxel_size=voxel_size)
+            start = time.perf_counter()
+            points, normals = g.sample_surface()
+            seconds = time.perf_counter() - start
+            # tracemalloc slows the reading down, the peak is measured in a second run
+            tracemalloc.start()
+            g.sample_surface()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            hausdorff, mean = 0.0, 0.0
+            for z in np.linspace(points[:, 2].min(), points[:, 2].max() - layer_height, n_layers):
+                in_band = (points[:, 2] >= z) & (points[:, 2] < z + layer_height)
+                z_layer = z + layer_height / 2
+                contours = GeometryImport._layer_contours(points[in_band, :2], normals[in_band], z_layer, alpha_value)
+                layer = deviation(contours, exterior_rings(GeometryImport.exact_section(triangles, face_normals,
+                                                                                        z_layer)))
+                hausdorff, mean = max(hausdorff, layer['hausdorff']), mean + layer['mean'] / n_layers
+            result[name] = {'file_bytes': os.path.getsize(path), 'peak_bytes': peak, 'seconds': seconds,
+                            'points': len(points), 'hausdorff': hausdorff, 'mean': mean}
+    return result
+
+
+def cycle_time_sweep(filepath: str, layer_height: float, processes=None) -> dict:
+    """
+    Times CycleTime.sweep over every predefined speed and zone data on the oriented exact section contours of a part.
+
+    :return: dict, number of targets, number of combinations, the seconds of the sweep and the totals of v100 with
+        fine points and with z1.
+    """
+    from CycleTime import SPEEDDATA, ZONEDATA, sweep
+    from Geometry4 import GeometryImport
+
+    g = GeometryImport(filepath, number_sampling_points=1000)
+    contours = g.parallel_generate_sequential_contour_points(layer_height=layer_height, with_normals=True,
+                                                             processes=processes, engine='exact')
+    rotation = g.rot_T_ROB1(contours[:, :3], contours[:, 3:], smoothing=2)
+    start = time.perf_counter()
+    totals = sweep(contours[:, :3], rotation, SPEEDDATA, ZONEDATA)
+    return {'targets': len(contours), 'combinations': len(totals), 'seconds': time.perf_counter() - start,
+            'fine': totals[('v100', 'fine')], 'z1': totals[('v100', 'z1')]}
+
+
+def main(argv=None) -> None:
+    from AccuracyHarness import print_results, run as accuracy_run
+
+    parser = argparse.ArgumentParser(description='Benchmarks of the toolpath generation.')
+    parser.add_argument('--part', default='FromRP.STL')
+    parser.add_argument('--points', type=int, default=100_000, help='number of sampling points')
+    parser.add_argument('--layer-height', type=float, default=0.5)
+    parser.add_argument('--alpha', type=float, default=0.2)
+    parser.add_argument('--processes', type=int, default=2)
+    args = parser.parse_args(argv)
+
+    print("================ Start up")
+    result = cold_start_import('Geometry4')
+    print(f"import Geometry4: {result['seconds'] * 1000:.0f} ms, heavy modules: {result['heavy_modules']}")
+    result = cold_start_import('GeometryPlotting')
+    print(f"import GeometryPlotting: {result['seconds'] * 1000:.0f} ms, heavy modules: {result['heavy_modules']}")
+    result = worker_spawn(args.processes)
+    print(f"spawn pool of {args.processes}: {result['seconds'] * 1000:.0f} ms, worker imports "
+          f"{[round(seconds * 1000) for seconds in result['worker_import_seconds']]} ms, "
+          f"heavy modules: {result['heavy_modules']}")
+
+    print("================ Point store")
+    result = point_store_memory(args.part, 500_000)
+    print(f"peak memory at 500k points: legacy {result['legacy'] / 2 ** 20:.1f} MiB, "
+          f"float64 {result['float64'] / 2 ** 20:.1f} MiB, float32 {result['float32'] / 2 ** 20:.1f} MiB "
+          f"(estimated {result['float32_estimated'] / 2 ** 20:.1f} MiB), "
+          f"reduction {result['legacy'] / result['float32']:.1f}x")
+
+    print("================ Kernels")
+    for name, seconds in kernel_backends().items():
+        timings = ', '.join(f'{backend} {value * 1000:.2f} ms' for backend, value in seconds.items())
+        speedup = f", {seconds['numpy'] / seconds['numba']:.1f}x" if 'numba' in seconds else ''
+        print(f"{name}: {timings}{speedup}")
+
+    print("================ Alpha shape prefilter")
+    result = alpha_prefilter(args.part, 500_000, args.layer_height, args.alpha)
+    print(f"Delaunay input {result['points']} -> {result['kept']} points "
+          f"({result['points'] / max(result['kept'], 1):.1f}x), alpha shapes {result['seconds']:.2f} s -> "
+          f"{result['prefiltered_seconds']:.2f} s, largest contour deviation {result['hausdorff']:.3f} mm")
+
+    print("================ Raster engine")
+    for name, values in raster_engine(args.part, 500_000, args.layer_height, args.alpha).items():
+        print(f"{name}: {values['seconds']:.2f} s, deviation from the exact section: largest "
+              f"{values['hausdorff']:.3f} mm, mean {values['mean']:.3f} mm")
+
+    print("================ Accuracy")
+    # The accuracy and speed of the engines at the settings of the golden results, see AccuracyHarness.py
+    print_results(accuracy_run([args.part], engines=('alpha', 'raster', 'exact'), processes=args.processes))
+
+    print("================ Island ordering")
+    # Surf.stl is an open surface, its layers are open chains that can only be entered at their ends
+    for part in (args.part, 'Surf.stl'):
+        result = island_ordering(part, args.layer_height, args.processes)
+        print(f"{part}: {result['rings']} rings in {result['layers']} layers, air travel {result['before']:.0f} mm -> "
+              f"{result['after']:.0f} mm ({result['seconds']:.2f} s)")
+
+    print("================ Tool radius compensation")
+    result = tool_compensation('Surf.stl', args.layer_height / 2, processes=args.processes)
+    print(f"Surf.stl: {result['rings']} rings in {result['layers']} layers offset by 5 mm in "
+          f"{result['pool_seconds']:.2f} s on the pool, {result['single_seconds']:.2f} s in one process, per polygon "
+          f"loop without nesting and cleanup {result['loop_seconds']:.2f} s")
+
+    print("================ Cycle time")
+    result = cycle_time_sweep(args.part, args.layer_height, args.processes)
+    print(f"{args.part}: {result['combinations']} speed and zone combinations of {result['targets']} targets in "
+          f"{result['seconds']:.2f} s ({result['seconds'] / result['combinations'] * 1000:.1f} ms each), v100 fine "
+          f"{result['fine']:.0f} s, v100 z1 {result['z1']:.0f} s")
+
+    print("================ Point cloud import")
+    for name, values in point_cloud_import(args.part, args.layer_height, args.alpha).items():
+        print(f"{name}: {values['file_bytes'] / 2 ** 20:.0f} MiB read in {values['seconds']:.2f} s with a peak of "
+              f"{values['peak_bytes'] / 2 ** 20:.0f} MiB, {values['points']} points kept, deviation from the exact "
+              f"section: largest {values['hausdorff']:.3f} mm, mean {values['mean']:.3f} mm")
+
+    print("================ Slicing")
+    result = headless_slicing(args.part, args.points, args.layer_height, args.alpha)
+    print(f"headless slicing of {args.part}: {result['seconds']:.2f} s, {result['contour_points']} contour points, "
+          f"heavy modules: {result['heavy_modules']}")
+
+
+if __name__ == "__main__":
+    main()
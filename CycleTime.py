@@ -0,0 +1,245 @@
+"""
+Offline estimate of the cycle time of a generated toolpath, so that layer heights, alpha values and speed and zone data
+can be compared without running the program on the robot.
+
+The program of RAPIDGenerator moves linearly through every target with one speeddata and one zonedata and stops at the
+fine points. The estimate follows the same path in one vectorized pass over all targets:
+
+- every segment runs at the TCP speed of the speeddata, or slower if its reorientation would exceed the orientation
+  speed;
+- at a zone point the TCP rounds the corner within the zone, which the controller shrinks to half of the shorter
+  neighbouring segment, at the speed the lateral acceleration allows on the corner radius;
+- at a fine point the TCP stops and settles;
+- between these speeds the TCP accelerates and decelerates at a constant rate (trapezoidal profiles), found for the
+  whole path with a forward and a backward pass of np.minimum.accumulate;
+- the controller executes at most one move instruction every min_move_time seconds.
+
+The accelerations, the settling time and the instruction rate depend on the robot and its load. The defaults are a
+starting point to be fitted against a cycle recorded with Telemetry.py.
+
+    python CycleTime.py output/FromRP.tp --speed v50 v100 v200 --zone fine z1 z5
+"""
+
+import argparse
+import itertools
+
+import numpy as np
+
+from PathResampling import path_layers
+from RAPIDCodeGenerator import RAPIDGenerator
+
+# Predefined speeddata: TCP speed in mm/s and orientation speed in degrees/s
+SPEEDDATA = {f'v{v}': (float(v), 500.0) for v in (5, 10, 20, 30, 40, 50, 60, 80, 100, 150, 200, 300, 400, 500, 600,
+                                                  800, 1000, 1500, 2000, 2500, 3000, 4000, 5000, 6000, 7000)}
+# Predefined zonedata: radius of the TCP zone in mm, 0 for fine points
+ZONEDATA = {'fine': 0.0, 'z0': 0.3, **{f'z{z}': float(z) for z in (1, 5, 10, 15, 20, 30, 40, 50, 60, 80, 100, 150,
+                                                                   200)}}
+ACCELERATION = 2000.0
+LATERAL_ACCELERATION = 1000.0
+FINE_DELAY = 0.05
+MIN_MOVE_TIME = 0.004
+
+
+def speeddata(speed) -> tuple[float, float]:
+    """
+    :param speed: str, name of a predefined speeddata ('v100') or a custom TCP speed ('v120'), or a tuple of the TCP
+        speed in mm/s and the orientation speed in degrees/s.
+    :return: tuple, the TCP speed and the orientation speed.
+    """
+    if not isinstance(speed, str):
+        return float(speed[0]), float(speed[1])
+    if speed in SPEEDDATA:
+        return SPEEDDATA[speed]
+    try:
+        return float(speed.lstrip('v')), 500.0
+    except ValueError:
+        raise ValueError(f"Unknown speeddata '{speed}'.") from None
+
+
+def zonedata(zone) -> float:
+    """
+    :param zone: str, name of a predefined zonedata ('z1', 'fine') or a custom zone ('z3'), or the zone radius in mm.
+    :return: float, the radius of the TCP zone in mm.
+    """
+    if not isinstance(zone, str):
+        return float(zone)
+    if zone in ZONEDATA:
+        return ZONEDATA[zone]
+    try:
+        return float(zone.lstrip('z'))
+    except ValueError:
+        raise ValueError(f"Unknown zonedata '{zone}'.") from None
+
+
+def rotation_angles(rotation: np.ndarray) -> np.ndarray:
+    """
+    :param rotation: np.ndarray, (n, 4) array of the quaternions of the targets.
+    :return: np.ndarray, (n - 1,) array of the reorientation of every segment in degrees.
+    """
+    q = np.asarray(rotation, dtype=float)
+    q = q / np.linalg.norm(q, axis=1, keepdims=True)
+    dot = np.abs(np.einsum('ij,ij->i', q[:-1], q[1:]))
+    return np.degrees(2 * np.arccos(np.clip(dot, 0.0, 1.0)))
+
+
+def junction_speeds(segment_speeds: np.ndarray, lengths: np.ndarray, corner_speeds: np.ndarray,
+                    acceleration: float) -> np.ndarray:
+    """
+    Limits the speed at every target so that the TCP can reach it from the previous target and stop in time for the
+    next ones at the given acceleration. The recursion v[i]^2 <= v[i - 1]^2 + 2 a L[i - 1] over all targets is the
+    running minimum of v[k]^2 - 2 a s[k] along the arc length s, and the same backwards.
+
+    :param segment_speeds: np.ndarray, (n - 1,) array of the highest speed of every segment.
+    :param lengths: np.ndarray, (n - 1,) array of the segment lengths.
+    :param corner_speeds: np.ndarray, (n,) array of the highest speed at every target, 0 at the fine points.
+    :param acceleration: float, acceleration and deceleration of the TCP in mm/s^2.
+    :return: np.ndarray, (n,) array of the speeds at the targets.
+    """
+    limit = np.minimum(corner_speeds, np.minimum(np.append(segment_speeds, 0), np.insert(segment_speeds, 0, 0)))
+    arc = np.insert(np.cumsum(lengths), 0, 0.0)
+    squared = limit ** 2
+    forward = 2 * acceleration * arc + np.minimum.accumulate(squared - 2 * acceleration * arc)
+    backward = -2 * acceleration * arc + np.minimum.accumulate((squared + 2 * acceleration * arc)[::-1])[::-1]
+    return np.sqrt(np.maximum(np.minimum(forward, backward), 0.0))
+
+
+def segment_times(lengths: np.ndarray, segment_speeds: np.ndarray, entry: np.ndarray, exit: np.ndarray,
+                  acceleration: float) -> np.ndarray:
+    """
+    Times of trapezoidal (or triangular, if the segment is too short to reach its speed) speed profiles.
+
+    :param lengths: np.ndarray, (m,) array of the segment lengths.
+    :param segment_speeds: np.ndarray, (m,) array of the highest speed of every segment.
+    :param entry: np.ndarray, (m,) array of the speed at the start of every segment.
+    :param exit: np.ndarray, (m,) array of the speed at the end of every segment.
+    :param acceleration: float, acceleration and deceleration in mm/s^2.
+    :return: np.ndarray, (m,) array of the seconds of every segment.
+    """
+    peak = np.minimum(segment_speeds, np.sqrt((2 * acceleration * lengths + entry ** 2 + exit ** 2) / 2))
+    ramps = (2 * peak ** 2 - entry ** 2 - exit ** 2) / (2 * acceleration)
+    cruise = np.maximum(lengths - ramps, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        times = (2 * peak - entry - exit) / acceleration + np.where(peak > 0, cruise / peak, 0.0)
+    return times
+
+
+def estimate_cycle_time(translation: np.ndarray, rotation=None, speed='v100', zone='z1', stops=None, layers=None,
+                        acceleration: float = ACCELERATION, lateral_acceleration: float = LATERAL_ACCELERATION,
+                        fine_delay: float = FINE_DELAY, min_move_time: float = MIN_MOVE_TIME) -> dict:
+    """
+    Estimates how long the RAPID program of a toolpath runs, see the module docstring for the motion model.
+
+    :param translation: np.ndarray, (n, 3) array of the x, y and z coordinates of the targets.
+    :param rotation: np.ndarray, (n, 4) array of the quaternions of the targets, or None to ignore the reorientation.
+    :param speed: speeddata of every move, see speeddata.
+    :param zone: zonedata of every move that does not end in a fine point, see zonedata.
+    :param stops: np.ndarray, (n,) boolean mask of the fine points. Defaults to the last target of every layer, or the
+        last target of a spiral path, like RAPIDGenerator.MoveL.
+    :param layers: np.ndarray, (n,) array of the layer index of every target. Defaults to the layers of the path, or
+        the turns of a spiral path, see PathResampling.path_layers.
+    :param acceleration: float, acceleration and deceleration of the TCP along the path in mm/s^2.
+    :param lateral_acceleration: float, acceleration of the TCP across the path in the corner zones in mm/s^2.
+    :param fine_delay: float, seconds the robot settles in every fine point.
+    :param min_move_time: float, shortest time of a move instruction in seconds.
+    :return: dict, the 'total' seconds, the seconds of every layer ('layers'), of every segment ('segments'), the
+        path 'length' in mm, the number of 'fine_points' and the 'mean_speed' in mm/s.
+    """
+    translation = np.asarray(translation, dtype=float)[:, :3]
+    n = len(translation)
+    if stops is None:
+        stops = RAPIDGenerator.layer_stops(translation)
+    stops = np.asarray(stops, dtype=bool).copy()
+    if layers is None:
+        layers = path_layers(translation)
+    layers = np.asarray(layers, dtype=int)
+    if n < 2:
+        return {'total': fine_delay * n, 'layers': np.full(layers.max(initial=-1) + 1, fine_delay),
+                'segments': np.empty(0), 'length': 0.0, 'fine_points': n, 'mean_speed': 0.0}
+    tcp_speed, orientation_speed = speeddata(speed)
+    zone_radius = zonedata(zone)
+    # The robot starts from rest
+    stops[0] = stops[-1] = True
+    if zone_radius == 0:
+        # zone='fine' turns every target into a fine point
+        stops[:] = True
+
+    steps = np.diff(translation, axis=0)
+    lengths = np.linalg.norm(steps, axis=1)
+    segment_speeds = np.full(n - 1, tcp_speed)
+    angles = np.zeros(n - 1) if rotation is None else rotation_angles(rotation)
+    turning = angles > 0
+    segment_speeds[turning] = np.minimum(tcp_speed, orientation_speed * lengths[turning] / angles[turning])
+
+    # Corner of every zone point: the zone shrinks to half the shorter neighbouring segment, the TCP follows an arc
+    # tangent to both segments at the zone radius from the corner
+    radius = np.minimum(zone_radius, np.minimum(lengths[:-1], lengths[1:]) / 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cosine = np.einsum('ij,ij->i', steps[:-1], steps[1:]) / (lengths[:-1] * lengths[1:])
+    turn = np.arccos(np.clip(np.nan_to_num(cosine, nan=-1.0), -1.0, 1.0))
+    with np.errstate(divide='ignore'):
+        arc_radius = np.where(turn > 1e-9, radius / np.tan(turn / 2), np.inf)
+    corner_speeds = np.full(n, np.inf)
+    corner_speeds[1:-1] = np.sqrt(lateral_acceleration * arc_radius)
+    corner_speeds[stops] = 0.0
+    # The arc cuts the corner short, half of the saving on either segment
+    with np.errstate(invalid='ignore'):
+        saving = np.where(stops[1:-1] | (turn <= 1e-9), 0.0, 2 * radius - arc_radius * turn) / 2
+    path_lengths = lengths - np.append(saving, 0.0) - np.insert(saving, 0, 0.0)
+
+    speeds = junction_speeds(segment_speeds, path_lengths, corner_speeds, acceleration)
+    times = segment_times(path_lengths, segment_speeds, speeds[:-1], speeds[1:], acceleration)
+    times = np.maximum(times, min_move_time)
+    if rotation is not None:
+        times = np.maximum(times, angles / orientation_speed)
+
+    # A move belongs to the layer of its target, the settling to the layer of the fine point
+    n_layers = layers.max() + 1
+    per_layer = (np.bincount(layers[1:], weights=times, minlength=n_layers) +
+                 np.bincount(layers, weights=stops * fine_delay, minlength=n_layers))
+    total = float(per_layer.sum())
+    return {'total': total, 'layers': per_layer, 'segments': times, 'length': float(path_lengths.sum()),
+            'fine_points': int(np.count_nonzero(stops)), 'mean_speed': float(path_lengths.sum()) / total}
+
+
+def sweep(translation: np.ndarray, rotation=None, speeds=('v100',), zones=('z1',), stops=None, **kwargs) -> dict:
+    """
+    Estimates the cycle time of a toolpath for every combination of speed and zone data.
+
+    :param speeds: iterable of speeddata, see speeddata.
+    :param zones: iterable of zonedata, see zonedata.
+    :param kwargs: further arguments of estimate_cycle_time.
+    :return: dict, the total seconds of every (speed, zone) combination.
+    """
+    return {(speed, zone): estimate_cycle_time(translation, rotation, speed, zone, stops, **kwargs)['total']
+            for speed, zone in itertools.product(speeds, zones)}
+
+
+def main(argv=None) -> dict:
+    from ToolpathFormat import read_toolpath
+
+    parser = argparse.ArgumentParser(description='Estimate the cycle time of a toolpath written by BatchProcessor.')
+    parser.add_argument('filepath', help='toolpath file (.tp), x y z, normals and quaternions per target')
+    parser.add_argument('--speed', nargs='+', default=['v100'])
+    parser.add_argument('--zone', nargs='+', default=['z1'])
+    parser.add_argument('--acceleration', type=float, default=ACCELERATION)
+    parser.add_argument('--lateral-acceleration', type=float, default=LATERAL_ACCELERATION)
+    parser.add_argument('--fine-delay', type=float, default=FINE_DELAY)
+    parser.add_argument('--min-move-time', type=float, default=MIN_MOVE_TIME)
+    args = parser.parse_args(argv)
+
+    toolpath = read_toolpath(args.filepath)
+    rotation = toolpath[:, 6:10] if toolpath.shape[1] >= 10 else None
+    settings = {'acceleration': args.acceleration, 'lateral_acceleration': args.lateral_acceleration,
+                'fine_delay': args.fine_delay, 'min_move_time': args.min_move_time}
+    first = estimate_cycle_time(toolpath[:, :3], rotation, args.speed[0], args.zone[0], **settings)
+    print(f"{len(toolpath)} targets, {first['length']:.0f} mm, {first['fine_points']} fine points in "
+          f"{len(first['layers'])} layers")
+    print(f"{args.speed[0]} {args.zone[0]}: layers {first['layers'].min():.1f} s to {first['layers'].max():.1f} s")
+    totals = sweep(toolpath[:, :3], rotation, args.speed, args.zone, **settings)
+    for (speed, zone), total in totals.items():
+        print(f"{speed:>6} {zone:>5}: {total:9.1f} s ({total / 60:.1f} min)")
+    return totals
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,101 @@
 """
 Developing a GUI for interacting with the user to get a filename and generate ABB robot paths for double sided
 incrementally fomring (DSIF) of a composite sheet.
+
+The toolpath is drawn over the surface as one PolyData with a polyline cell per ring, or a single polyline for a
+spiral path, and the layer index as scalar. The layer range sliders only change the range of a threshold (or, for a
+spiral, a clip) filter whose output is copied into the mesh of the one toolpath actor, so scrubbing through the layers
+never rebuilds an actor, and a right click picks the nearest target from a KD-tree of the toolpath.
 """
 
 import sys
 import os
 
+import numpy as np
+
 os.environ["QT_API"] = "pyqt5"
-from qtpy import QtWidgets
+from qtpy import QtCore, QtWidgets
 import pyvista as pv
 from pyvistaqt import QtInteractor, MainWindow
 
+from PathResampling import contour_ring_ids, is_spiral_path, path_layers, ring_bounds
+
+
+def toolpath_polydata(toolpath: np.ndarray) -> pv.PolyData:
+    """
+    Builds the PolyData of a toolpath: one polyline cell per closed ring, or a single polyline for a spiral path, and
+    the layer (or turn) index of every point and cell, see PathResampling.path_layers.
+
+    :param toolpath: np.ndarray, (n, k) array of the stacked closed rings of the layers or of a spiral path, k >= 3,
+        e.g. from GeometryImport.parallel_generate_sequential_contour_points or a toolpath file of BatchProcessor.
+    :return: pv.PolyData, the toolpath with the point and cell array 'layer' and the field 'spiral'.
+    """
+    points = np.ascontiguousarray(toolpath[:, :3], dtype=float)
+    layers = path_layers(points)
+    spiral = is_spiral_path(points)
+    if spiral:
+        starts, counts = np.array([0]), np.array([len(points)])
+    else:
+        starts, counts = ring_bounds(contour_ring_ids(toolpath))
+    # The connectivity of all cells at once: the point count of every cell in front of its point indices
+    lines = np.insert(np.arange(len(points)), starts, counts)
+    polydata = pv.PolyData(points, lines=lines)
+    polydata.point_data['layer'] = layers
+    polydata.cell_data['layer'] = layers[starts]
+    polydata.field_data['spiral'] = [spiral]
+    return polydata
+
+
+def visible_layers(polydata: pv.PolyData, lowest: int, highest: int) -> pv.DataSet:
+    """
+    Cuts a toolpath from toolpath_polydata down to the layers lowest to highest. The rings of a layered path are
+    whole cells and are thresholded; the single polyline of a spiral path is clipped halfway between the turns.
+
+    :param polydata: pv.PolyData, the toolpath, see toolpath_polydata.
+    :param lowest: int, index of the lowest layer shown.
+    :param highest: int, index of the highest layer shown.
+    :return: pv.DataSet, the visible part of the toolpath.
+    """
+    if not polydata.field_data['spiral'][0]:
+        return polydata.threshold((lowest, highest), scalars='layer', preference='cell')
+    above = polydata.clip_scalar(scalars='layer', invert=False, value=lowest - 0.5)
+    return above.clip_scalar(scalars='layer', invert=True, value=highest + 0.5)
+
+
+class SlicingWorker(QtCore.QThread):
+
+    sliced = QtCore.Signal(object)
+    failed = QtCore.Signal(str)
+
+    def __init__(self, filepath: str, layer_height: float, alpha_value: float, parent=None):
+        """
+        Slices a part off the GUI thread, on a running slicing service (SlicingService.py) if there is one and in this
+        process otherwise.
+        """
+        super().__init__(parent)
+        self.filepath = filepath
+        self.params = {'layer_height': layer_height, 'alpha_value': alpha_value}
+
+    def run(self):
+        from SlicingClient import SlicingClient
+
+        try:
+            client = SlicingClient()
+            try:
+                client.health()
+            except OSError:
+                client = None
+            if client is not None:
+                toolpath = client.slice(self.filepath, self.params)
+            else:
+                from Geometry4 import GeometryImport
+
+                toolpath = GeometryImport(self.filepath).parallel_generate_sequential_contour_points(
+                    with_normals=True, **self.params)
+            self.sliced.emit(toolpath)
+        except Exception as error:
+            self.failed.emit(repr(error))
+
 
 class MyMainWindow(MainWindow):
 
@@ -45,9 +130,54 @@ class MyMainWindow(MainWindow):
         # Add the button to the horizontal layout
         button_layout.addWidget(self.add_surface_button)
 
+        # Slicing parameters and the buttons to generate or load a toolpath
+        self.layer_height_box = QtWidgets.QDoubleSpinBox(self.plot_frame)
+        self.layer_height_box.setRange(0.05, 5.0)
+        self.layer_height_box.setSingleStep(0.05)
+        self.layer_height_box.setValue(0.5)
+        self.layer_height_box.setPrefix('Layer ')
+        self.alpha_box = QtWidgets.QDoubleSpinBox(self.plot_frame)
+        self.alpha_box.setRange(0.01, 1.0)
+        self.alpha_box.setSingleStep(0.05)
+        self.alpha_box.setValue(0.2)
+        self.alpha_box.setPrefix('Alpha ')
+        self.generate_button = QtWidgets.QPushButton('Generate Toolpath', self.plot_frame)
+        self.generate_button.setEnabled(False)
+        self.generate_button.clicked.connect(self.generate_toolpath)
+        self.load_toolpath_button = QtWidgets.QPushButton('Load Toolpath', self.plot_frame)
+        self.load_toolpath_button.clicked.connect(self.load_toolpath)
+        for widget in (self.layer_height_box, self.alpha_box, self.generate_button, self.load_toolpath_button):
+            button_layout.addWidget(widget)
+
         # Add the horizontal layout to the main layout
         vlayout.addLayout(button_layout)
 
+        # Sliders of the lowest and highest layer shown and the picked target
+        layer_layout = QtWidgets.QHBoxLayout()
+        self.layer_label = QtWidgets.QLabel('Layers', self.plot_frame)
+        self.lowest_layer_slider = QtWidgets.QSlider(QtCore.Qt.Horizontal, self.plot_frame)
+        self.highest_layer_slider = QtWidgets.QSlider(QtCore.Qt.Horizontal, self.plot_frame)
+        for slider in (self.lowest_layer_slider, self.highest_layer_slider):
+            slider.setEnabled(False)
+            slider.valueChanged.connect(self.update_layers)
+            layer_layout.addWidget(slider)
+        layer_layout.insertWidget(0, self.layer_label)
+        vlayout.addLayout(layer_layout)
+        self.target_label = QtWidgets.QLabel('Right click a point of the toolpath to inspect its target',
+                                             self.plot_frame)
+        vlayout.addWidget(self.target_label)
+
+        self.surface_path = None
+        self.toolpath = None
+        self.toolpath_mesh = None
+        self.visible_toolpath = None
+        self.toolpath_actor = None
+        self.target_tree = None
+        self.target_layers = None
+        self.target_marker = None
+        self.slicing_worker = None
+        self.plotter.track_click_position(callback=self.pick_target, side='right')
+
         # Set the layout of the main window
         self.setCentralWidget(self.plot_frame)
 
@@ -60,6 +190,10 @@ class MyMainWindow(MainWindow):
         file_path, _ = file_dialog.getOpenFileName(self, 'Open STL File', '', 'STL Files (*.stl)')
         if file_path:
             surface = pv.read(file_path)
+            # GeometryImport centres the toolpath on the bounding box of the part, the surface is shifted the same way
+            surface.translate(-np.array(surface.center), inplace=True)
+            self.surface_path = file_path
+            self.generate_button.setEnabled(True)
             self.plotter.add_mesh(surface, color='grey')  # Set the mesh color to grey
             self.plotter.renderer.background_color = [0.7, 0.7, 1.0]  # R, G, B
             self.plotter.add_axes(line_width=3, shaft_length=0.8, cone_radius=0.3, ambient=0.5, tip_length=0.4,
@@ -68,6 +202,102 @@ class MyMainWindow(MainWindow):
             # self.plotter.add_axes(axis_labels_size=2.0)  # Double the size
             self.plotter.reset_camera()
 
+    def generate_toolpath(self):
+        """ Slice the surface in a worker thread and show the toolpath when it is done """
+        if self.surface_path is None or self.slicing_worker is not None:
+            return
+        self.generate_button.setEnabled(False)
+        self.target_label.setText('Slicing ' + os.path.basename(self.surface_path))
+        self.slicing_worker = SlicingWorker(self.surface_path, self.layer_height_box.value(), self.alpha_box.value(),
+                                            self)
+        self.slicing_worker.sliced.connect(self.show_toolpath)
+        self.slicing_worker.failed.connect(lambda error: self.target_label.setText('Slicing failed: ' + error))
+        self.slicing_worker.finished.connect(self._slicing_finished)
+        self.slicing_worker.start()
+
+    def _slicing_finished(self):
+        self.slicing_worker = None
+        self.generate_button.setEnabled(self.surface_path is not None)
+
+    def load_toolpath(self):
+        """ Show a toolpath file written by BatchProcessor """
+        from ToolpathFormat import read_toolpath
+
+        file_path, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Open Toolpath File', '', 'Toolpath Files (*.tp)')
+        if file_path:
+            self.show_toolpath(read_toolpath(file_path))
+
+    def show_toolpath(self, toolpath):
+        """ Replace the toolpath overlay, colored by layer, and the KD-tree used for picking """
+        from scipy.spatial import cKDTree
+
+        if len(toolpath) == 0:
+            self.target_label.setText('The toolpath is empty')
+            return
+        self.toolpath = np.asarray(toolpath)
+        self.toolpath_mesh = toolpath_polydata(self.toolpath)
+        self.target_layers = np.asarray(self.toolpath_mesh.point_data['layer'])
+        self.target_tree = cKDTree(self.toolpath[:, :3])
+        n_layers = int(self.target_layers[-1]) + 1
+
+        if self.toolpath_actor is not None:
+            self.plotter.remove_actor(self.toolpath_actor)
+        self.visible_toolpath = visible_layers(self.toolpath_mesh, 0, n_layers - 1)
+        self.toolpath_actor = self.plotter.add_mesh(self.visible_toolpath, scalars='layer', cmap='viridis',
+                                                    clim=[0, max(n_layers - 1, 1)], line_width=2,
+                                                    scalar_bar_args={'title': 'Layer'})
+        for slider, value in ((self.lowest_layer_slider, 0), (self.highest_layer_slider, n_layers - 1)):
+            slider.blockSignals(True)
+            slider.setRange(0, n_layers - 1)
+            slider.setValue(value)
+            slider.setEnabled(True)
+            slider.blockSignals(False)
+        self.layer_label.setText(f'Layers 1 to {n_layers} of {n_layers}')
+        self.target_label.setText(f'{len(self.toolpath)} targets in {n_layers} layers')
+        self.plotter.reset_camera()
+
+    def update_layers(self):
+        """ Show the layers between the two sliders by moving the threshold, the actor stays the same """
+        if self.toolpath_mesh is None:
+            return
+        lowest = min(self.lowest_layer_slider.value(), self.highest_layer_slider.value())
+        highest = max(self.lowest_layer_slider.value(), self.highest_layer_slider.value())
+        self.visible_toolpath.copy_from(visible_layers(self.toolpath_mesh, lowest, highest))
+        self.layer_label.setText(f'Layers {lowest + 1} to {highest + 1} of {self.highest_layer_slider.maximum() + 1}')
+        self.plotter.render()
+
+    def pick_target(self, position):
+        """ Highlight the visible target nearest to the clicked position and show its coordinates and normal """
+        if self.target_tree is None:
+            return
+        lowest = min(self.lowest_layer_slider.value(), self.highest_layer_slider.value())
+        highest = max(self.lowest_layer_slider.value(), self.highest_layer_slider.value())
+        # The nearest targets may lie in hidden layers, the nearest visible one among a few candidates is picked
+        k = min(32, len(self.toolpath))
+        _, candidates = self.target_tree.query(np.asarray(position, dtype=float), k=k)
+        candidates = np.atleast_1d(candidates)
+        layers = self.target_layers[candidates]
+        visible = candidates[(layers >= lowest) & (layers <= highest)]
+        if len(visible) == 0:
+            visible = np.flatnonzero((self.target_layers >= lowest) & (self.target_layers <= highest))
+            if len(visible) == 0:
+                return
+            visible = visible[[np.argmin(np.linalg.norm(self.toolpath[visible, :3] - position, axis=1))]]
+        index = int(visible[0])
+        target = self.toolpath[index]
+        if self.target_marker is None:
+            self.target_marker = pv.PolyData(target[None, :3].copy())
+            self.plotter.add_mesh(self.target_marker, color='red', point_size=12, render_points_as_spheres=True,
+                                  pickable=False)
+        else:
+            self.target_marker.points = target[None, :3].copy()
+        text = (f'Target {index + 1} in layer {self.target_layers[index] + 1}: '
+                f'x {target[0]:.3f}, y {target[1]:.3f}, z {target[2]:.3f}')
+        if len(target) >= 6:
+            text += f', normal ({target[3]:.3f}, {target[4]:.3f}, {target[5]:.3f})'
+        self.target_label.setText(text)
+        self.plotter.render()
+
 
 if __name__ == '__main__':
     app = QtWidgets.QApplication(sys.argv)
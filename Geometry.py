@@ -9,8 +9,11 @@ import math
 import matplotlib.pyplot as plt
 import numpy as np
 import trimesh
-from scipy.spatial import distance
-from sklearn.cluster import KMeans
+from scipy.spatial import ConvexHull
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+from Kernels import band_bounds, nearest_neighbour_order
+from PathResampling import close_rings, contour_ring_ids, resample_rings, ring_bounds, roll_rings
 
 
 class GeometryImport:
@@ -89,9 +92,9 @@ class GeometryImport:
         y = np.array(y)
         z = np.array(z)
 
-        mid_x = (max(x) + min(x)) / 2
-        mid_y = (max(y) + min(y)) / 2
-        mid_z = (max(z) + min(z)) / 2
+        mid_x = (np.max(x) + np.min(x)) / 2
+        mid_y = (np.max(y) + np.min(y)) / 2
+        mid_z = (np.max(z) + np.min(z)) / 2
 
         x = x - mid_x
         y = y - mid_y
@@ -99,41 +102,83 @@ class GeometryImport:
 
         return x, y, z
 
-    def layer_part(self) -> np.ndarray:
+    def layer_part(self, resampling='kmeans', point_spacing=None, alpha_value=0.1) -> np.ndarray:
         """
         This function layers the imported geometry in the z direction specified by a layer height, projects the x,y
-        points of neighboring region of +/- 0.2mm on current z_layer height onto the current z-plane and then applies
-        the ConvexHull algorithm of the SciPy library to get a outer contour of the current layer. The coordinates of
-        the outer contour along with the current layer height can sequenced and then sent to the RAPID Code generator.
+        points of neighboring region of +/- 0.18mm on current z_layer height onto the current z-plane and resamples
+        them to a small number of points per layer with KMeans. The resampled points of every layer are sequenced and
+        can then be sent to the RAPID Code generator.
+
+        The bands of all the layers are selected at once from the points sorted by z. With resampling='minibatch' or
+        'warm' every layer after the first is seeded with the centroids of the previous layer, since adjacent layers
+        are nearly identical, and fitted with MiniBatchKMeans or a single run of KMeans respectively. With
+        resampling='perimeter' no clustering is done at all: the contour of every band is traced by the raster engine
+        of Geometry4.GeometryImport and its rings are resampled to points equally spaced by arc length, all layers in
+        one call, so the points lie on the contour, concave parts and islands included.
 
         Parameters
         ----------
+            resampling : str
+                'kmeans' for a fresh Elkan KMeans per layer, 'minibatch' for a warm started MiniBatchKMeans, 'warm'
+                for a KMeans seeded with the centroids of the previous layer or 'perimeter' for uniform resampling of
+                the contour.
+            point_spacing : float
+                Approximate distance in mm between the resampled points. The number of points of every layer is
+                then taken from the perimeter of the convex hull of its band (of its contour with 'perimeter'). None
+                keeps 55 points per layer.
+            alpha_value : float
+                Alpha value of the contour of every band: gaps and concave corners narrower than 1 / alpha_value mm are
+                bridged. Used by 'perimeter' only.
 
         Returns
         -------
             layered_array: ndarray
                 A ndarray consisting of the x,y,z coordinates of the layered part.
         """
+        if resampling not in ('kmeans', 'minibatch', 'warm', 'perimeter'):
+            raise ValueError(f"Unknown resampling '{resampling}', expected 'kmeans', 'minibatch', 'warm' or "
+                             f"'perimeter'.")
 
         x, y, z = self.get_points()
         height_each_layer = 1
-        number_of_layers = (max(z) - min(z)) / height_each_layer
+        number_of_layers = (np.max(z) - np.min(z)) / height_each_layer
+
+        z_int = np.linspace(np.min(z), np.max(z), math.floor(number_of_layers))
+        lower, upper = self.layer_bands(z, z_int, 0.18)
+        order = np.argsort(z, kind='stable')
+        data_sorted = np.column_stack((x[order], y[order]))
+
+        num_resampled_points = 55
+        if resampling == 'perimeter':
+            return self.resample_perimeters(data_sorted, lower, upper, z_int, num_resampled_points, point_spacing,
+                                            alpha_value)
+
+        counts = np.full(len(z_int), num_resampled_points)
+        if point_spacing is not None:
+            perimeters = np.array([self.hull_perimeter(data_sorted[lower[i]:upper[i]]) for i in range(len(z_int))])
+            counts = np.maximum(np.rint(perimeters / point_spacing).astype(int), 4)
 
-        z_int = np.linspace(min(z), max(z), math.floor(number_of_layers))
         global_selected_points = []
-        for z_lay in z_int:
-            x_r, y_r, z_r = [], [], []
-            for i in range(len(x)):
-                if z[i] - 0.18 < z_lay < z[i] + 0.18:
-                    x_r.append(x[i])
-                    y_r.append(y[i])
-                    z_r.append(z_lay)
-
-            data = np.vstack((x_r, y_r)).T
-            num_resampled_points = 55
-            kmeans = KMeans(n_clusters=num_resampled_points, random_state=0, n_init='auto', algorithm='elkan')
+        previous = None
+        for i, z_lay in enumerate(z_int):
+            data = data_sorted[lower[i]:upper[i]]
+            n_clusters = min(counts[i], len(data))
+            if n_clusters == 0:
+                continue
+
+            init = 'k-means++'
+            if resampling != 'kmeans' and previous is not None:
+                init = self.warm_start_centroids(previous, n_clusters)
+            if resampling == 'minibatch':
+                kmeans = MiniBatchKMeans(n_clusters=n_clusters, init=init, n_init=1, random_state=0,
+                                         batch_size=1024)
+            elif resampling == 'warm' and previous is not None:
+                kmeans = KMeans(n_clusters=n_clusters, init=init, n_init=1, random_state=0)
+            else:
+                kmeans = KMeans(n_clusters=n_clusters, random_state=0, n_init='auto', algorithm='elkan')
             kmeans.fit(data)
             resampled = kmeans.cluster_centers_
+            previous = resampled
             # data = np.vstack((x_r, y_r)).T
             # hull = ConvexHull(data)
             # resampled = data[hull.vertices]
@@ -150,6 +195,132 @@ class GeometryImport:
 
         return layered_array
 
+    @staticmethod
+    def resample_perimeters(data_sorted, lower, upper, z_int, num_resampled_points, point_spacing,
+                            alpha_value=0.1) -> np.ndarray:
+        """
+        Resamples the contour of the band of every layer to points equally spaced by arc length. The contour is traced
+        by Geometry4.GeometryImport.raster_section, which closes the thin band of points of a wall and returns its
+        exterior rings sequenced counterclockwise. All the rings of all layers are resampled in a single call of
+        resample_rings and then started at the point in quadrant 1 closest to y=0, like sequence_points does. Every
+        ring is closed by repeating its first point.
+
+        Parameters
+        ----------
+            data_sorted : ndarray
+                x,y coordinates of all the points sorted by z.
+            lower, upper : ndarray
+                Index ranges of the bands in data_sorted, see layer_bands.
+            z_int : ndarray
+                Heights of the layers.
+            num_resampled_points : int
+                Number of points of every layer, used if point_spacing is None.
+            point_spacing : float
+                Distance in mm between the resampled points.
+            alpha_value : float
+                Alpha value of the contour of every band, see raster_section.
+
+        Returns
+        -------
+            layered_array: ndarray
+                A ndarray consisting of the x,y,z coordinates of the layered part.
+        """
+        from Geometry4 import GeometryImport as SlicingEngine
+
+        rings, layers = [], []
+        for i in range(len(z_int)):
+            data = data_sorted[lower[i]:upper[i]]
+            if len(data) < 3:
+                continue
+            contour = SlicingEngine.raster_section(data, np.zeros((len(data), 3)), 0.0, alpha_value)
+            ids = contour_ring_ids(contour)
+            starts, counts = ring_bounds(ids)
+            for start, count in zip(starts, counts):
+                # Without the closing point
+                if count >= 4:
+                    rings.append(contour[start:start + count - 1, :2])
+                    layers.append(i)
+        if not rings:
+            return np.empty((0, 3))
+
+        layers = np.asarray(layers)
+        ring_ids = np.repeat(np.arange(len(rings)), [len(ring) for ring in rings])
+        coordinates = np.vstack(rings)
+        coordinates = np.column_stack((coordinates, np.zeros(len(coordinates))))
+        if point_spacing is None:
+            resampled, ring = resample_rings(coordinates, ring_ids, n_points=num_resampled_points)
+        else:
+            resampled, ring = resample_rings(coordinates, ring_ids, spacing=point_spacing)
+
+        starts, _ = ring_bounds(ring)
+        quadrant_1 = (resampled[:, 0] > 0) & (resampled[:, 1] > 0)
+        score = np.where(quadrant_1, np.abs(resampled[:, 1]), np.inf)
+        first = np.lexsort((score, ring))[starts] - starts
+        resampled = roll_rings(resampled, ring, first)
+        resampled, ring = close_rings(resampled, ring)
+        resampled[:, 2] = z_int[layers[ring]]
+        return resampled
+
+    @staticmethod
+    def layer_bands(z, z_layers, half_width) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Selects the band of points around every layer height in one pass. A point belongs to the band of z_lay if
+        z - half_width < z_lay < z + half_width. The bands are returned as index ranges into the points sorted by z
+        (np.argsort(z, kind='stable')).
+
+        Parameters
+        ----------
+            z : ndarray
+                z-coordinates of all the points.
+            z_layers : ndarray
+                Heights of the layers.
+            half_width : float
+                Half of the band width.
+
+        Returns
+        -------
+            A tuple of two ndarrays holding the start and the end index of every band in the sorted points.
+        """
+        z_sorted = np.sort(z, kind='stable')
+        z_layers = np.asarray(z_layers, dtype=float)
+        return band_bounds(z_sorted, z_layers - half_width, z_layers + half_width, include_low=False)
+
+    @staticmethod
+    def hull_perimeter(data) -> float:
+        """
+        Perimeter of the convex hull of the x,y points of a band, 0 if the band has fewer than 3 points.
+        """
+        if len(data) < 3:
+            return 0.0
+        hull = ConvexHull(data)
+        # For 2 dimensional input the 'area' of a ConvexHull is its perimeter
+        return hull.area
+
+    @staticmethod
+    def warm_start_centroids(previous, n_clusters) -> np.ndarray:
+        """
+        Builds the initial centroids of a layer from the centroids of the previous layer. The previous centroids are
+        ordered by their angle around the origin and resampled by arc length to the requested number of clusters, so
+        the seed also works when the cluster count changes from one layer to the next.
+
+        Parameters
+        ----------
+            previous : ndarray
+                Centroids of the previous layer, shape (k, 2).
+            n_clusters : int
+                Number of clusters of the current layer.
+
+        Returns
+        -------
+            A ndarray of shape (n_clusters, 2).
+        """
+        if len(previous) == n_clusters:
+            return previous
+        ring = previous[np.argsort(np.arctan2(previous[:, 1], previous[:, 0]))]
+        ring = np.column_stack((ring, np.zeros(len(ring))))
+        resampled, _ = resample_rings(ring, np.zeros(len(ring), dtype=int), n_clusters)
+        return resampled[:, :2]
+
     def points_visualization(self) -> None:
         """
         This function of the GeometryImport class extracts the ndarray of the layered part by calling the function
@@ -283,9 +454,11 @@ class GeometryImport:
     @staticmethod
     def rot_T_ROB1(coordinates):
         """
-        Determines rotation array for the end effector
+        Determines rotation array for the end effector. The KMeans centroids of layer_part carry no surface normal, so
+        the fixed orientation [0, 0, 1, 0] is used for every target; see Geometry4.GeometryImport.rot_T_ROB1 for the
+        normal based orientation.
         :param coordinates:
-        :return:
+        :return: np.ndarray, (n, 4) array of quaternions.
         """
 
         leng = len(coordinates[:, 0])
@@ -296,7 +469,7 @@ class GeometryImport:
         q4 = np.full((leng, 1), 0)
         q = np.column_stack((q1, q2, q3, q4))
 
-        print(q)
+        return q
 
     @staticmethod
     def sequence_points(x, y) -> tuple[np.ndarray, np.ndarray]:
@@ -326,20 +499,10 @@ class GeometryImport:
 
         start_point = nearest_coordinate
 
-        current_point = start_point
-        connected_points = [start_point]  # Include the start point at the beginning
-        remaining_points = list(coordinates)  # Keep all points in the remaining_points list
-
-        while len(remaining_points) > 0:  # At least 2 points are needed for the loop
-            distances = [distance.euclidean(current_point, point) for point in remaining_points]
-            nearest_index = np.argmin(distances)
-            nearest_point = remaining_points[nearest_index]
-            remaining_points.pop(nearest_index)
-            connected_points.append(nearest_point)
-            current_point = nearest_point
-
-        # Convert the connected points to a NumPy array
-        connected_points = np.array(connected_points)
+        # Greedy nearest neighbour path through all the points from the start point, which is included at the
+        # beginning, see Kernels.nearest_neighbour_order
+        order = nearest_neighbour_order(coordinates, np.argmax(np.all(coordinates == start_point, axis=1)))
+        connected_points = np.vstack((start_point, coordinates[order]))
 
         # Create a scatter plot of the points
         x_arranged = connected_points[:, 0]
@@ -1,10 +1,13 @@
 import numpy as np
 import trimesh
 import matplotlib.pyplot as plt
-from scipy.spatial import Delaunay, distance
+from scipy.spatial import Delaunay
 from shapely.geometry import Polygon, MultiPoint
 from shapely.ops import unary_union
 
+from Kernels import circumradius_filter, nearest_neighbour_order
+from LayerSchedule import mesh_layers
+
 
 class GeometryImport:
 
@@ -51,9 +54,9 @@ class GeometryImport:
         y = np.array(y)
         z = np.array(z)
 
-        mid_x = (max(x) + min(x)) / 2
-        mid_y = (max(y) + min(y)) / 2
-        mid_z = (max(z) + min(z)) / 2
+        mid_x = (np.max(x) + np.min(x)) / 2
+        mid_y = (np.max(y) + np.min(y)) / 2
+        mid_z = (np.max(z) + np.min(z)) / 2
 
         x = x - mid_x
         y = y - mid_y
@@ -91,28 +94,23 @@ class GeometryImport:
         if len(points) < 4:
             return MultiPoint(list(points)).convex_hull
         tri = Delaunay(points)
-        triangles = points[tri.simplices]
-        a = ((triangles[:, 0, 0] - triangles[:, 1, 0]) ** 2 + (triangles[:, 0, 1] - triangles[:, 1, 1]) ** 2) ** 0.5
-        b = ((triangles[:, 1, 0] - triangles[:, 2, 0]) ** 2 + (triangles[:, 1, 1] - triangles[:, 2, 1]) ** 2) ** 0.5
-        c = ((triangles[:, 2, 0] - triangles[:, 0, 0]) ** 2 + (triangles[:, 2, 1] - triangles[:, 0, 1]) ** 2) ** 0.5
-        s = (a + b + c) / 2.0
-        areas = (s*(s-a)*(s-b)*(s-c)) ** 0.5
-        circum_r = a * b * c / (4.0 * areas)
-        filters = circum_r < 1.0 / alpha
-        triangles = triangles[filters]
+        # Triangles with a circumradius below 1 / alpha, see Kernels.circumradius_filter
+        triangles = points[tri.simplices[circumradius_filter(points, tri.simplices, alpha)]]
         if len(triangles) == 0:
             return MultiPoint(list(points)).convex_hull
         polygons = [Polygon(triangle) for triangle in triangles]
         result = unary_union(polygons)
         return result
 
-    def generate_sequential_contour_points(self, alpha_value=0.5, layer_height=1.0) -> np.ndarray:
+    def generate_sequential_contour_points(self, alpha_value=0.5, layer_height=1.0, cusp_height=None) -> np.ndarray:
         """
         Generates the sequential contour points of the geometry.
 
         Parameters:
         alpha_value (float): The alpha value for the alpha shape function to generate concave hulls.
         layer_height (float): The height of each layer in the z direction.
+        cusp_height (float): If given, the layer heights adapt to the slope of the surface so that the step left on
+            the surface stays below this height, see LayerSchedule. layer_height is then the highest layer.
 
         Returns:
         ndarray: An array containing the sequential contour points.
@@ -124,14 +122,20 @@ class GeometryImport:
         z_max = np.max(points[:, 2])
         all_contour_points = []
 
-        for z in np.arange(z_min, z_max, layer_height):
-            layer = points[(points[:, 2] >= z) & (points[:, 2] < z + layer_height)]
+        if cusp_height is None:
+            z_values = np.arange(z_min, z_max, layer_height)
+            heights = np.full(len(z_values), layer_height)
+        else:
+            z_values, heights = mesh_layers(self.filename, z_min, z_max, cusp_height, layer_height)
+
+        for z, height in zip(z_values, heights):
+            layer = points[(points[:, 2] >= z) & (points[:, 2] < z + height)]
             if len(layer) == 0:
                 continue
             concave_hull = self.alpha_shape(layer[:, :2], alpha=alpha_value)
             if concave_hull.is_empty:
                 continue
-            z_layer = z + layer_height / 2.0
+            z_layer = z + height / 2.0
             if concave_hull.geom_type == 'Polygon':
                 x, y = concave_hull.exterior.xy
                 x_seq, y_seq = self.sequence_points(x, y)
@@ -166,18 +170,9 @@ class GeometryImport:
         if len(first) > 0:
             nearest_coordinate = first[np.argmin(np.abs(first[:, 1]))]
         start_point = nearest_coordinate
-        current_point = start_point
-        connected_points = [start_point]
-        remaining_points = list(coordinates)
-
-        while len(remaining_points) > 0:
-            distances = [distance.euclidean(current_point, point) for point in remaining_points]
-            nearest_index = np.argmin(distances)
-            nearest_point = remaining_points[nearest_index]
-            remaining_points.pop(nearest_index)
-            connected_points.append(nearest_point)
-            current_point = nearest_point
-        connected_points = np.array(connected_points)
+        # Greedy nearest neighbour path through all the points, see Kernels.nearest_neighbour_order
+        order = nearest_neighbour_order(coordinates, np.argmax(np.all(coordinates == start_point, axis=1)))
+        connected_points = np.vstack((start_point, coordinates[order]))
         x_arranged = connected_points[:, 0]
         y_arranged = connected_points[:, 1]
 
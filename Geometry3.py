@@ -6,6 +6,9 @@ from scipy.spatial import Delaunay
 from shapely.geometry import Polygon, MultiPoint
 from shapely.wkb import loads
 
+from Kernels import circumradius_filter
+from LayerSchedule import mesh_layers
+
 
 class GeometryImport:
 
@@ -27,9 +30,9 @@ class GeometryImport:
         y = np.array(y)
         z = np.array(z)
 
-        mid_x = (max(x) + min(x)) / 2
-        mid_y = (max(y) + min(y)) / 2
-        mid_z = (max(z) + min(z)) / 2
+        mid_x = (np.max(x) + np.min(x)) / 2
+        mid_y = (np.max(y) + np.min(y)) / 2
+        mid_z = (np.max(z) + np.min(z)) / 2
 
         x = x - mid_x
         y = y - mid_y
@@ -58,15 +61,8 @@ class GeometryImport:
         if len(points) < 4:
             return MultiPoint(list(points)).convex_hull
         tri = Delaunay(points)
-        triangles = points[tri.simplices]
-        a = ((triangles[:, 0, 0] - triangles[:, 1, 0]) ** 2 + (triangles[:, 0, 1] - triangles[:, 1, 1]) ** 2) ** 0.5
-        b = ((triangles[:, 1, 0] - triangles[:, 2, 0]) ** 2 + (triangles[:, 1, 1] - triangles[:, 2, 1]) ** 2) ** 0.5
-        c = ((triangles[:, 2, 0] - triangles[:, 0, 0]) ** 2 + (triangles[:, 2, 1] - triangles[:, 0, 1]) ** 2) ** 0.5
-        s = (a + b + c) / 2.0
-        areas = (s * (s - a) * (s - b) * (s - c)) ** 0.5
-        circum_r = a * b * c / (4.0 * areas)
-        filters = circum_r < 1.0 / alpha
-        triangles = triangles[filters]
+        # Triangles with a circumradius below 1 / alpha, see Kernels.circumradius_filter
+        triangles = points[tri.simplices[circumradius_filter(points, tri.simplices, alpha)]]
         if len(triangles) == 0:
             return MultiPoint(list(points)).convex_hull
         polygons = [pygeos.polygons(triangle) for triangle in triangles]
@@ -78,7 +74,16 @@ class GeometryImport:
 
         return loads(pygeos.to_wkb(pygeos.union_all(polygons)))
 
-    def generate_sequential_contour_points(self, alpha_value=0.5, layer_height=1.0) -> np.ndarray:
+    def generate_sequential_contour_points(self, alpha_value=0.5, layer_height=1.0, cusp_height=None) -> np.ndarray:
+        """
+        Layers the part in the z direction and returns the contour points of every layer.
+
+        :param alpha_value: float, alpha value for the alpha shape of every layer.
+        :param layer_height: float, height of each layer in the z direction.
+        :param cusp_height: float, if given the layer heights adapt to the slope of the surface so that the step left
+            on the surface stays below this height, see LayerSchedule. layer_height is then the highest layer.
+        :return: np.ndarray, (n, 3) array of the contour points.
+        """
         x, y, z = self.get_points()
         points = np.column_stack((x, y, z))
 
@@ -86,14 +91,20 @@ class GeometryImport:
         z_max = np.max(points[:, 2])
         all_contour_points = []
 
-        for z in np.arange(z_min, z_max, layer_height):
-            layer = points[(points[:, 2] >= z) & (points[:, 2] < z + layer_height)]
+        if cusp_height is None:
+            z_values = np.arange(z_min, z_max, layer_height)
+            heights = np.full(len(z_values), layer_height)
+        else:
+            z_values, heights = mesh_layers(self.filename, z_min, z_max, cusp_height, layer_height)
+
+        for z, height in zip(z_values, heights):
+            layer = points[(points[:, 2] >= z) & (points[:, 2] < z + height)]
             if len(layer) == 0:
                 continue
             concave_hull = self.alpha_shape(layer[:, :2], alpha=alpha_value)
             if concave_hull.is_empty:
                 continue
-            z_layer = z + layer_height / 2.0
+            z_layer = z + height / 2.0
             if concave_hull.geom_type == 'Polygon':
                 x, y = concave_hull.exterior.xy
                 contour_points = np.column_stack((x, y, np.full_like(x, z_layer)))
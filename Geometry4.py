@@ -1,30 +1,169 @@
-import matplotlib.pyplot as plt
+"""
+Slicing core of the toolpath generation. Only numpy is imported at module load; trimesh, scipy, shapely and pygeos are
+imported at first use and the plotting and Excel export live in GeometryPlotting, so that the worker processes of the
+shared pool (which re-import this module under spawn) and headless runs never load matplotlib or pandas.
+"""
+
 import numpy as np
-import pandas as pd
-import pygeos
-import trimesh
-from scipy.spatial import Delaunay
-from shapely.geometry import MultiPoint, Polygon
-from shapely.wkb import loads
 import multiprocessing
+import multiprocessing.pool
+import atexit
+import os
+import time
+
+from Kernels import band_bounds, chain_segments, circumradius_filter
+from PathResampling import contour_ring_ids, resample_rings, ring_bounds, ring_perimeters
+from PointStore import PointStore
+
+
+def _marching_squares_table() -> np.ndarray:
+    """
+    Segments of every marching squares case as (start edge, end edge) pairs with the inside on the left, -1 where a
+    case has fewer than two segments. Cases 16 to 31 are the saddle cases with an inside centre.
+    """
+    table = np.full((32, 2, 2), -1, dtype=np.int64)
+    for case in range(32):
+        inside = [(case >> corner) & 1 for corner in range(4)]
+        # Walking around the cell counterclockwise, a line leaves the inside on the left on its start edge
+        starts = [edge for edge in range(4) if inside[edge] and not inside[(edge + 1) % 4]]
+        ends = [edge for edge in range(4) if not inside[edge] and inside[(edge + 1) % 4]]
+        if len(starts) == 1:
+            table[case, 0] = starts[0], ends[0]
+        elif len(starts) == 2:
+            # Separate corners turn back to the previous edge, a connected centre runs on to the next one
+            step = 1 if case >= 16 else -1
+            for slot, edge in enumerate(starts):
+                table[case, slot] = edge, (edge + step) % 4
+    return table
+
+
+_MARCHING_SQUARES = _marching_squares_table()
+
+# Worker pool shared by all GeometryImport objects, created on first use and kept warm between calls and parts
+_worker_pool = None
+_worker_pool_size = 0
+
+
+def get_worker_pool(processes=None) -> tuple[multiprocessing.pool.Pool, int]:
+    """
+    Returns the shared worker pool, creating it on first use or when a different number of processes is requested.
+
+    :param processes: int, number of worker processes. Defaults to the number of cores.
+    :return: tuple, the pool and its number of processes.
+    """
+    global _worker_pool, _worker_pool_size
+    processes = processes or multiprocessing.cpu_count()
+    if _worker_pool is None or _worker_pool_size != processes:
+        close_worker_pool()
+        _worker_pool = multiprocessing.Pool(processes)
+        _worker_pool_size = processes
+    return _worker_pool, _worker_pool_size
+
+
+def close_worker_pool() -> None:
+    """
+    Shuts the shared worker pool down. It is registered to run at interpreter exit.
+    """
+    global _worker_pool, _worker_pool_size
+    if _worker_pool is not None:
+        _worker_pool.close()
+        _worker_pool.join()
+        _worker_pool = None
+        _worker_pool_size = 0
 
-# Add a way to sort the final list of coordinates using the z coordinate and then store the sorted array in a separate
-# np array
+
+atexit.register(close_worker_pool)
 
 
 class GeometryImport:
 
-    def __init__(self, filepath: str) -> None:
+    def __init__(self, filepath: str, number_sampling_points: int = 500_000, dtype=np.float64,
+                 memory_budget=None, seed=None, voxel_size=None) -> None:
+        """
+        :param filepath: str, path of the stl file, or of a scanned point cloud (PLY, XYZ, CSV), see PointCloudImport.
+        :param number_sampling_points: int, number of points sampled on the surface of the part, unused for a point
+            cloud.
+        :param dtype: numpy dtype, precision of the sampled points, np.float32 halves their memory.
+        :param memory_budget: int, maximum number of bytes of the point store, see PointStore. None means no limit.
+        :param seed: int, seed of the surface sampling, for repeatable runs.
+        :param voxel_size: float, edge length in mm of the voxels a point cloud is downsampled to. Defaults to
+            PointCloudImport.DEFAULT_VOXEL_SIZE.
+        """
         self.filename = filepath
+        self.number_sampling_points = number_sampling_points
+        self.dtype = dtype
+        self.memory_budget = memory_budget
+        self.seed = seed
+        self.voxel_size = voxel_size
+        self.point_store = None
+        # Called as progress(layers done, layers) after every batch of layers the worker pool finishes
+        self.progress = None
 
-    def get_points(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    def sample_surface(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Samples points on the surface of the imported part and keeps the normal of the face every point was sampled
+        from, so that the orientation of the tool can be derived from the surface later on.
+
+        :return: tuple, (N, 3) array of the points shifted to the origin and (N, 3) array of the unit face normals.
+        """
+        if self.is_point_cloud():
+            return self.load_point_cloud()
+
+        import trimesh
 
         mesh = trimesh.load_mesh(self.filename)
-        number_sampling_points = 500_000
-        pointcloud, _ = trimesh.sample.sample_surface(mesh, number_sampling_points)
+        # The points are sampled chunk by chunk straight into one buffer and centred in place;
+        # point_store.estimated_peak_bytes estimates the memory used, Benchmark.point_store_memory measures it
+        self.point_store = PointStore.from_mesh(mesh, self.number_sampling_points, dtype=self.dtype,
+                                                memory_budget=self.memory_budget, seed=self.seed)
+        self.point_store.center()
+        return self.point_store.points, self.point_store.normals
+
+    def load_triangles(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Loads the triangles of the part, shifted like the sampled points so that the center of the bounding box is at
+        (0, 0, 0).
+
+        :return: tuple, (F, 3, 3) array of the triangle corners and (F, 3) array of the unit face normals.
+        """
+        if self.is_point_cloud():
+            raise ValueError(f"{self.filename} is a point cloud without triangles, the exact engine and adaptive "
+                             f"layers need a mesh.")
 
-        return self.shift_center(np.asarray(pointcloud[:, 0]), np.asarray(pointcloud[:, 1]), np.asarray(pointcloud[:, 2]
-                                                                                                        ))
+        import trimesh
+
+        mesh = trimesh.load_mesh(self.filename)
+        triangles = np.array(mesh.triangles, dtype=np.float64)
+        corners = triangles.reshape(-1, 3)
+        triangles -= (corners.min(axis=0) + corners.max(axis=0)) / 2
+        return triangles, np.asarray(mesh.face_normals, dtype=np.float64)
+
+    def is_point_cloud(self) -> bool:
+        from PointCloudImport import is_point_cloud
+
+        return is_point_cloud(self.filename)
+
+    def load_point_cloud(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Streams a scanned point cloud through a voxel grid instead of sampling a mesh, see PointCloudImport.
+
+        :return: tuple, (N, 3) array of the downsampled points shifted to the origin and (N, 3) array of their unit
+            normals, from the file or estimated from the neighbourhood of every point.
+        """
+        from PointCloudImport import DEFAULT_VOXEL_SIZE, load_point_cloud
+
+        points, normals = load_point_cloud(self.filename, voxel_size=self.voxel_size or DEFAULT_VOXEL_SIZE,
+                                           memory_budget=self.memory_budget)
+        self.point_store = PointStore(len(points), dtype=self.dtype)
+        self.point_store.points[:] = points
+        self.point_store.normals[:] = normals
+        self.point_store.center()
+        return self.point_store.points, self.point_store.normals
+
+    def get_points(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+
+        points, _ = self.sample_surface()
+        return points[:, 0], points[:, 1], points[:, 2]
 
     @staticmethod
     def shift_center(x, y, z) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
@@ -32,9 +171,9 @@ class GeometryImport:
         y = np.array(y)
         z = np.array(z)
 
-        mid_x = (max(x) + min(x)) / 2
-        mid_y = (max(y) + min(y)) / 2
-        mid_z = (max(z) + min(z)) / 2
+        mid_x = (np.max(x) + np.min(x)) / 2
+        mid_y = (np.max(y) + np.min(y)) / 2
+        mid_z = (np.max(z) + np.min(z)) / 2
 
         x = x - mid_x
         y = y - mid_y
@@ -43,160 +182,953 @@ class GeometryImport:
         return x, y, z
 
     def points_visualization(self) -> None:
-        common_array_x, common_array_y, common_array_z = self.get_points()
-        # common_array = np.vstack((common_array_x, common_array_y, common_array_z))
-        fig = plt.figure(figsize=(16, 9))
-        ax1 = plt.axes(projection='3d')
-        ax1.plot(common_array_x, common_array_y, common_array_z, marker='o', c='r')
-        ax1.set_xlim(-120, 120)
-        ax1.set_ylim(-120, 120)
-        ax1.set_zlim(-120, 120)
-        plt.show()
-
-    def alpha_shape(self, points: np.ndarray, alpha: float) -> Polygon:
+        """
+        Plots the sampled points of the part, see GeometryPlotting.points_visualization.
+        """
+        from GeometryPlotting import points_visualization
+        points_visualization(*self.get_points())
+
+    @staticmethod
+    def grid_prefilter(points: np.ndarray, alpha: float, cells_per_radius: int = 4, subdivisions: int = 16,
+                       stride: int = 2) -> np.ndarray:
+        """
+        Thins out the points of a band before the triangulation. The points are binned into a square grid whose cells
+        are 1 / (alpha * cells_per_radius) wide. Cells whose 8 neighbours are all occupied lie inside the shape: of
+        those only every stride-th cell in both directions keeps one point, which leaves no empty circle as large as
+        the alpha radius and therefore no false holes. The other cells keep one point per subcell of
+        1 / subdivisions of their width, fine enough to keep walls that are thinner than a cell in one piece, so the
+        contour moves by at most the subcell diagonal.
+
+        :param points: np.ndarray, (n, 2) array of the x and y coordinates of the points.
+        :param alpha: float, alpha value of the alpha shape.
+        :param cells_per_radius: int, number of cells per alpha radius 1 / alpha.
+        :param subdivisions: int, number of subcells per cell width along the contour.
+        :param stride: int, spacing in cells of the interior cells that keep a point, below cells_per_radius.
+        :return: np.ndarray, (m,) array of the indices of the kept points in ascending order.
+        """
+        scaled = (points - points.min(axis=0)) * (alpha * cells_per_radius)
+        cells = np.floor(scaled).astype(np.int64) + 1
+        # A margin of one empty row and column keeps the keys of the neighbours of the border cells unique
+        width = cells[:, 1].max() + 2
+        keys, first, cell = np.unique(cells[:, 0] * width + cells[:, 1], return_index=True, return_inverse=True)
+        cell = cell.ravel()
+
+        interior = np.ones(len(keys), dtype=bool)
+        for offset in (-width - 1, -width, -width + 1, -1, 1, width - 1, width, width + 1):
+            neighbour = np.minimum(np.searchsorted(keys, keys + offset), len(keys) - 1)
+            interior &= keys[neighbour] == keys + offset
+        lattice = (keys // width % stride == 0) & (keys % width % stride == 0)
+
+        subcells = np.floor(scaled * subdivisions).astype(np.int64)
+        _, first_in_subcell = np.unique(subcells[:, 0] * (subcells[:, 1].max() + 1) + subcells[:, 1],
+                                        return_index=True)
+        kept = np.zeros(len(points), dtype=bool)
+        kept[first_in_subcell] = True
+        kept &= ~interior[cell]
+        kept[first[interior & lattice]] = True
+        return np.flatnonzero(kept)
+
+    @staticmethod
+    def alpha_shape(points: np.ndarray, alpha: float, prefilter: bool = True) -> "Polygon":
         """
         Computes the alpha shape (concave hull) of a set of points.
 
         :param points: np.ndarray, array containing the x and y coordinates of points.
         :param alpha: float, alpha value to determine the alpha shape.
+        :param prefilter: bool, whether the points are thinned out with grid_prefilter before the triangulation.
         :return: Polygon, the computed alpha shape as a Shapely Polygon object.
         """
+        import pygeos
+        from scipy.spatial import Delaunay
+        from shapely.geometry import MultiPoint
+        from shapely.wkb import loads
+
+        if prefilter and len(points) >= 4:
+            points = points[GeometryImport.grid_prefilter(points, alpha)]
         if len(points) < 4:
             return MultiPoint(list(points)).convex_hull
         tri = Delaunay(points)
-        triangles = points[tri.simplices]
-        a = ((triangles[:, 0, 0] - triangles[:, 1, 0]) ** 2 + (triangles[:, 0, 1] - triangles[:, 1, 1]) ** 2) ** 0.5
-        b = ((triangles[:, 1, 0] - triangles[:, 2, 0]) ** 2 + (triangles[:, 1, 1] - triangles[:, 2, 1]) ** 2) ** 0.5
-        c = ((triangles[:, 2, 0] - triangles[:, 0, 0]) ** 2 + (triangles[:, 2, 1] - triangles[:, 0, 1]) ** 2) ** 0.5
-        s = (a + b + c) / 2.0
-        areas = (s * (s - a) * (s - b) * (s - c)) ** 0.5
-        circum_r = a * b * c / (4.0 * areas)
-        filters = circum_r < 1.0 / alpha
-        triangles = triangles[filters]
+        # Triangles with a circumradius below 1 / alpha, see Kernels.circumradius_filter
+        triangles = points[tri.simplices[circumradius_filter(points, tri.simplices, alpha)]]
         if len(triangles) == 0:
             return MultiPoint(list(points)).convex_hull
         polygons = [pygeos.polygons(triangle) for triangle in triangles]
 
         return loads(pygeos.to_wkb(pygeos.union_all(polygons)))
 
-    def parallel_generate_sequential_contour_points(self, alpha_value=0.5, layer_height=1.0) -> np.ndarray:
+    def parallel_generate_sequential_contour_points(self, alpha_value=0.5, layer_height=1.0,
+                                                    with_normals=False, mode='layered',
+                                                    points_per_layer=200, processes=None,
+                                                    engine='alpha', cusp_height=None,
+                                                    optimise_travel=False, tool_radius=None,
+                                                    tool_side='outside') -> np.ndarray:
+        """
+        Layers the part in the z direction on all the available cores and returns the contour points of every layer.
+
+        :param alpha_value: float, alpha value for the alpha shape of every layer.
+        :param layer_height: float, height of each layer in the z direction.
+        :param with_normals: bool, if True the surface normal of every contour point is appended as three extra
+            columns, i.e. the rows are [x, y, z, nx, ny, nz].
+        :param mode: str, 'layered' for one closed contour per layer or 'spiral' for one continuous helical path, see
+            spiral_toolpath.
+        :param points_per_layer: int, number of points of every turn of the helix in the 'spiral' mode.
+        :param processes: int, number of worker processes of the shared pool. Defaults to the number of cores.
+        :param engine: str, 'alpha' for the alpha shape of the points sampled in every band or 'exact' for the exact
+            section of the mesh in the middle of every band, see exact_section, or 'raster' for the outline of the
+            points of every band closed on an occupancy raster, see raster_section. The exact engine does not sample
+            the surface and ignores alpha_value.
+        :param cusp_height: float, if given the layer heights adapt to the slope of the surface so that the step
+            left on the surface stays below this height, see LayerSchedule. layer_height is then the highest layer.
+        :param optimise_travel: bool, if True the islands of every layer are ordered, all the rings are turned
+            counterclockwise and started next to the end of the previous ring to shorten the air moves, see
+            IslandOrdering. The 'spiral' mode follows a single ring per layer and is not affected.
+        :param tool_radius: float, if given the contours are moved to the centre of the ball of the forming tool
+            along the surface normals, in the plane of every layer, see compensate_tool_radius.
+        :param tool_side: str, 'outside' or 'inside', the side of the surface the tool is offset to.
+        :return: np.ndarray, (n, 3) or (n, 6) array of the contour points.
+        """
+        if mode not in ('layered', 'spiral'):
+            raise ValueError(f"Unknown toolpath mode '{mode}', expected 'layered' or 'spiral'.")
+        if engine not in ('alpha', 'exact', 'raster'):
+            raise ValueError(f"Unknown slicing engine '{engine}', expected 'alpha', 'exact' or 'raster'.")
+
+        if engine == 'exact':
+            triangles, face_normals = self.load_triangles()
+            z_min = triangles[:, :, 2].min()
+            z_max = triangles[:, :, 2].max()
+        else:
+            points, normals = self.sample_surface()
+            # Sorting the points by z once turns every layer into a contiguous slice of the point array
+            order = np.argsort(points[:, 2], kind='stable')
+            points = points[order]
+            normals = normals[order]
 
-        x, y, z = self.get_points()
-        points = np.column_stack((x, y, z))
+            z_min = points[0, 2]
+            z_max = points[-1, 2]
 
-        z_min = np.min(points[:, 2])
-        z_max = np.max(points[:, 2])
+        if cusp_height is None:
+            z_values = np.arange(z_min, z_max, layer_height)
+            heights = np.full(len(z_values), layer_height)
+        else:
+            from LayerSchedule import adaptive_layers
 
-        z_values = list(np.arange(z_min, z_max, layer_height))
-        z_values.append(z_max)
+            if engine != 'exact':
+                triangles, face_normals = self.load_triangles()
+            z_values, heights = adaptive_layers(triangles, face_normals, z_min, z_max, cusp_height, layer_height)
+            print(f"Adaptive layers: {len(z_values)} instead of {len(np.arange(z_min, z_max, layer_height))} at "
+                  f"{layer_height} mm or {len(np.arange(z_min, z_max, cusp_height))} at {cusp_height} mm")
         # Generating a list of z values where each layer will be generated
 
         print("Z_values list")
-        print(z_values)
-        n_processes = multiprocessing.cpu_count()
+        print(list(z_values))
+
+        if engine == 'exact':
+            results = self._schedule_sections(triangles, face_normals, z_values, heights, processes)
+        else:
+            results = self._schedule_layers(points, normals, z_values, heights, alpha_value, processes, engine=engine)
+        results = [results[layer] for layer in sorted(results) if len(results[layer])]
+        if not results:
+            raise ValueError(f"No layer of {self.filename} has a contour with the {engine} engine, check the height of "
+                             f"the part and the layer height, or the alpha value.")
+        contours = np.vstack(results)
+        if tool_radius:
+            contours = self.compensate_tool_radius(contours, tool_radius, side=tool_side, processes=processes)
+        if optimise_travel and mode == 'layered':
+            from IslandOrdering import optimise_travel as order_islands
+
+            contours, _ = order_islands(contours)
+        if mode == 'spiral':
+            contours = self.spiral_toolpath(contours, points_per_layer=points_per_layer)
+        if with_normals:
+            return contours
+        return contours[:, :3]
+
+    def parallel_generate_dsif_paths(self, alpha_value=0.5, layer_height=1.0, sheet_thickness=2.0,
+                                     tool_radius=5.0, engine='alpha',
+                                     cusp_height=None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Generates the synchronized paths of both robots for double sided incremental forming from a single slicing
+        run. The master path is the contour of the part as seen from above, the slave path is the same contour
+        offset below the sheet along the surface normal by the sheet thickness plus the tool radius, so both paths
+        have the same number of targets and can be paired target by target.
 
-        # Dividing z_values into nearly equal chunks for each process
-        chunks = [z_values[i::n_processes] for i in range(n_processes)]
+        :param alpha_value: float, alpha value for the alpha shape of every layer.
+        :param layer_height: float, height of each layer in the z direction.
+        :param sheet_thickness: float, thickness of the formed sheet.
+        :param tool_radius: float, radius of the forming tool of the slave robot.
+        :param engine: str, slicing engine, see parallel_generate_sequential_contour_points.
+        :param cusp_height: float, cusp height of adaptive layers, see parallel_generate_sequential_contour_points.
+        :return: tuple, (n, 3) master path, (n, 3) slave path and (n, 3) surface normals of the targets.
+        """
+        contours = self.parallel_generate_sequential_contour_points(alpha_value=alpha_value,
+                                                                    layer_height=layer_height, with_normals=True,
+                                                                    engine=engine, cusp_height=cusp_height)
+        master = contours[:, :3]
+        normals = contours[:, 3:]
+        slave = self.offset_along_normals(master, normals, -(sheet_thickness + tool_radius))
+        return master, slave, normals
 
-        with multiprocessing.Pool(n_processes) as pool:
-            args = [(self, chunks[i], alpha_value, layer_height, z_max) for i in range(n_processes)]
-            results = pool.map(self._generate_contours, args)
+    @staticmethod
+    def orient_normals(normals: np.ndarray, reference=(0.0, 0.0, 1.0)) -> np.ndarray:
+        """
+        Turns the normals of a whole path to the side of the sheet the tool forms from. The side is chosen once for
+        the path: all normals are flipped together if their sum points against the reference direction. Flipping
+        every normal by its own sign would give neighbouring targets on vertical or overhanging walls opposite sides.
 
-        return np.vstack(results)
+        :param normals: np.ndarray, (n, 3) array of the surface normals, consistently oriented, e.g. all outward.
+        :param reference: array_like, (3,) direction the tool side should face, +z for a tool above the sheet.
+        :return: np.ndarray, (n, 3) array of the unit normals on the chosen side.
+        """
+        unit = np.array(normals, dtype=float)
+        unit /= np.maximum(np.linalg.norm(unit, axis=1, keepdims=True), 1e-12)
+        if np.sum(unit @ np.asarray(reference, dtype=float)) < 0:
+            unit *= -1
+        return unit
 
     @staticmethod
-    def _generate_contours(args):
-        instance, z_values, alpha_value, layer_height, z_max = args
-        x, y, z = instance.get_points()
-        points = np.column_stack((x, y, z))
+    def offset_along_normals(coordinates: np.ndarray, normals: np.ndarray, distance: float,
+                             reference=(0.0, 0.0, 1.0)) -> np.ndarray:
+        """
+        Offsets every point of a path along its surface normal. The normals are turned to the side of the reference
+        direction first, see orient_normals, the same convention as rot_T_ROB1, so with the default a positive distance
+        moves the path above the sheet and a negative one below it.
+
+        :param coordinates: np.ndarray, (n, 3) array of the x, y and z coordinates of the path.
+        :param normals: np.ndarray, (n, 3) array of the surface normals of the points.
+        :param distance: float, signed offset distance.
+        :param reference: array_like, (3,) direction of the positive side, see orient_normals.
+        :return: np.ndarray, (n, 3) array of the offset path.
+        """
+        unit = GeometryImport.orient_normals(normals, reference)
+        return np.asarray(coordinates, dtype=float)[:, :3] + distance * unit
+
+    def compensate_tool_radius(self, contours: np.ndarray, tool_radius: float, side: str = 'outside',
+                               quad_segs: int = 8, processes=None, min_wall_angle: float = 10.0) -> np.ndarray:
+        """
+        Moves the contours of all layers from the surface to the centre of the ball of the forming tool. A ball that
+        touches the surface at p with the normal n has its centre at p + r n, on the surface offset by the radius. The
+        layers stay in their planes: every point is moved to the section of that offset surface with its layer plane,
+        r n_xy / |n_xy|^2 in the xy plane, see offset_contours_along_normals. On vertical walls this is the flat
+        offset by r, on a wall at 45 degrees it is 1.41 r. The loops of concave corners and the rings that turn inside
+        out are removed with the batched cleanup of offset_contours. The layers are split into groups of about equal
+        size and every group is offset in a single vectorized call on the shared worker pool.
+
+        Contours without normals are offset by r in the plane of every layer, which is only right for vertical walls.
+
+        :param contours: np.ndarray, (n, k) array of the stacked closed rings of the layers, k >= 3. With k >= 6 the
+            columns 3 to 5 are the surface normals.
+        :param tool_radius: float, radius of the ball of the forming tool.
+        :param side: str, 'outside' to move the tool to the side the surface normals point to (away from the material
+            of every layer without normals), 'inside' to the other side.
+        :param quad_segs: int, number of segments of a quarter circle at the convex corners.
+        :param processes: int, number of worker processes of the shared pool.
+        :param min_wall_angle: float, walls flatter than this angle in degrees are offset as if they had this angle,
+            as the section of the offset surface moves away to infinity on horizontal faces.
+        :return: np.ndarray, (m, k) array of the stacked closed rings of the offset layers.
+        """
+        if side not in ('outside', 'inside'):
+            raise ValueError(f"Unknown tool side '{side}', expected 'outside' or 'inside'.")
+        contours = np.asarray(contours, dtype=float)
+        if len(contours) == 0:
+            return contours
+        distance = tool_radius if side == 'outside' else -tool_radius
+        _, pool_size = get_worker_pool(processes)
+        if contours.shape[1] >= 6:
+            function = GeometryImport.offset_contours_along_normals
+            arguments = (distance, quad_segs, min_wall_angle)
+        else:
+            function = GeometryImport.offset_contours
+            arguments = (distance, quad_segs)
+
+        # Groups of whole layers with about the same number of points, a few per worker
+        layer_starts = np.flatnonzero(np.diff(contours[:, 2], prepend=np.nan) != 0)
+        n_groups = min(4 * pool_size, len(layer_starts))
+        group_starts = np.unique(layer_starts[np.searchsorted(layer_starts, np.linspace(0, len(contours),
+                                                                                          n_groups, endpoint=False))])
+        group_ends = np.append(group_starts[1:], len(contours))
+        tasks = {group: (function, (contours[lower:upper],) + arguments)
+                 for group, (lower, upper) in enumerate(zip(group_starts, group_ends))}
+        results = self._run_batches(tasks, (group_ends - group_starts).astype(float), processes)
+        offset = [results[group] for group in sorted(results) if len(results[group])]
+        return np.vstack(offset) if offset else np.empty((0, contours.shape[1]))
+
+    @staticmethod
+    def offset_contours_along_normals(contours: np.ndarray, distance: float, quad_segs: int = 8,
+                                      min_wall_angle: float = 10.0) -> np.ndarray:
+        """
+        Offsets the closed rings of any number of layers along their surface normals and keeps them in their layer
+        planes. A point p with the unit normal n goes to p + d n_xy / max(|n_xy|, sin(min_wall_angle))^2, the point
+        of the surface offset by d (p + d n, slid along the offset surface back to the plane of p).
+
+        The normal of a point of exact_section belongs to the segment that starts there, so every point is offset
+        with the normal of the segment before it and with its own one. At convex corners the two are joined by an
+        arc of normals, at concave corners the crossing offsets leave a loop. The loops and the rings that turned
+        inside out are removed by offset_contours with a zero distance.
+
+        :param contours: np.ndarray, (n, k) array of the stacked closed rings, k >= 6, the columns 3 to 5 are the
+            surface normals. Rings in the same plane z belong to the same layer.
+        :param distance: float, offset distance, positive along the normals.
+        :param quad_segs: int, number of segments of a quarter circle at the convex corners.
+        :param min_wall_angle: float, smallest wall angle in degrees, see compensate_tool_radius.
+        :return: np.ndarray, (m, k) array of the stacked closed rings of the offset layers, see offset_contours.
+        """
+        contours = np.asarray(contours, dtype=float)
+        ids = contour_ring_ids(contours)
+        starts, counts = ring_bounds(ids)
+        # The rings without the closing point, and the previous and next point of every point within its ring
+        keep = np.ones(len(contours), dtype=bool)
+        keep[starts + counts - 1] = False
+        keep &= (counts >= 4)[ids]
+        points, ids = contours[keep], np.unique(ids[keep], return_inverse=True)[1]
+        if len(points) == 0:
+            return np.empty((0, contours.shape[1]))
+        starts, counts = ring_bounds(ids)
+        position = np.arange(len(points)) - starts[ids]
+        previous = starts[ids] + (position - 1) % counts[ids]
+        following = starts[ids] + (position + 1) % counts[ids]
+
+        def offset(normals):
+            unit = normals / np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+            horizontal = np.maximum(np.linalg.norm(unit[:, :2], axis=1), np.sin(np.radians(min_wall_angle)))
+            return distance * unit[:, :2] / horizontal[:, None] ** 2
+
+        normals = points[:, 3:6]
+        before, after = offset(normals[previous]), offset(normals)
+        # A corner is convex if the offset of the segment before it ends behind the start of the offset of the next
+        # one, so that the offsets leave a gap instead of crossing
+        tangent = np.zeros_like(before)
+        for neighbour, sign in ((previous, 1.0), (following, -1.0)):
+            step = sign * (points[:, :2] - points[neighbour, :2])
+            tangent += step / np.maximum(np.linalg.norm(step, axis=1, keepdims=True), 1e-12)
+        convex = np.einsum('ij,ij->i', after - before, tangent) > 0
+        angle = np.abs(np.arctan2(before[:, 0] * after[:, 1] - before[:, 1] * after[:, 0],
+                                  np.einsum('ij,ij->i', before, after)))
+        # Corners below one step of the arc keep only the offset of the next segment, like the chords of a buffer
+        steps = np.round(angle / (np.pi / 2 / quad_segs)).astype(int)
+        steps[~convex] = np.minimum(steps[~convex], 1)
+
+        # Every point is repeated once per step of its arc, weights from the normal before to its own normal
+        source = np.repeat(np.arange(len(points)), steps + 1)
+        step = np.arange(len(source)) - np.repeat(np.cumsum(steps + 1) - steps - 1, steps + 1)
+        weight = np.divide(step, steps[source], out=np.ones(len(source)), where=steps[source] > 0)
+        # Spherical interpolation spaces the arc evenly, nearly parallel normals are interpolated linearly
+        unit = normals / np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+        omega = np.arccos(np.clip(np.einsum('ij,ij->i', unit[previous], unit), -1, 1))[source]
+        linear = np.sin(omega) < 1e-6
+        sine = np.where(linear, 1.0, np.sin(omega))
+        blended = (np.where(linear, 1 - weight, np.sin((1 - weight) * omega) / sine)[:, None] * unit[previous[source]]
+                   + np.where(linear, weight, np.sin(weight * omega) / sine)[:, None] * unit[source])
+        result = points[source].copy()
+        result[:, :2] += offset(blended)
+        result_ids = ids[source]
+
+        # Rings whose signed area changes its sign turned inside out and are dropped, the others are closed again
+        def signed_areas(xy, ring_ids, n_rings):
+            following_xy = np.roll(xy, -1, axis=0)
+            ring_starts = np.flatnonzero(np.diff(ring_ids, prepend=-1) != 0)
+            ring_ends = np.append(ring_starts[1:], len(xy)) - 1
+            following_xy[ring_ends] = xy[ring_starts]
+            cross = xy[:, 0] * following_xy[:, 1] - xy[:, 1] * following_xy[:, 0]
+            return np.bincount(ring_ids, weights=cross, minlength=n_rings) / 2
+
+        kept = (np.sign(signed_areas(points[:, :2], ids, len(starts)))
+                == np.sign(signed_areas(result[:, :2], result_ids, len(starts))))
+        result, result_ids = result[kept[result_ids]], result_ids[kept[result_ids]]
+        if len(result) == 0:
+            return np.empty((0, contours.shape[1]))
+        ring_starts = np.flatnonzero(np.diff(result_ids, prepend=-1) != 0)
+        ring_ends = np.append(ring_starts[1:], len(result))
+        result = np.insert(result, ring_ends, result[ring_starts], axis=0)
+        return GeometryImport.offset_contours(result, 0.0, quad_segs)
+
+    @staticmethod
+    def offset_contours(contours: np.ndarray, distance: float, quad_segs: int = 8) -> np.ndarray:
+        """
+        Offsets the closed rings of any number of layers in the xy plane with the array functions of shapely. The rings
+        of a layer are nested into polygons with holes by the even-odd rule, the polygons of every layer form one
+        multipolygon that is repaired with make_valid and buffered, all layers at once. The buffer removes the loops
+        of self-intersecting rings, merges islands that grow into each other and drops islands and holes that shrink
+        away. With a zero distance the multipolygons are only cleaned up by the buffer, which also drops the loops
+        that run against their ring, as offset_contours_along_normals leaves them at concave corners.
+
+        :param contours: np.ndarray, (n, k) array of the stacked closed rings, k >= 3. Rings in the same plane z belong
+            to the same layer.
+        :param distance: float, offset distance, positive to grow the material of every layer, negative to shrink it.
+        :param quad_segs: int, number of segments of a quarter circle at the convex corners.
+        :return: np.ndarray, (m, k) array of the stacked closed rings of the offset layers, exterior rings
+            counterclockwise and holes clockwise like exact_section. Further columns (e.g. normals) are taken from the
+            nearest point of the same layer.
+        """
+        import shapely
+
+        contours = np.asarray(contours, dtype=float)
+        ids = contour_ring_ids(contours)
+        starts, counts = ring_bounds(ids)
+        # A ring needs 3 distinct points
+        valid = (counts >= 4)[ids]
+        contours, ids = contours[valid], np.unique(ids[valid], return_inverse=True)[1]
+        if len(contours) == 0:
+            return np.empty((0, contours.shape[1]))
+        starts, _ = ring_bounds(ids)
+        layer_z, ring_layer = np.unique(contours[starts, 2], return_inverse=True)
+
+        rings = shapely.linearrings(contours[:, :2], indices=ids)
+        # The first point of a ring lies inside the rings that contain it: the nesting depth is the number of rings of
+        # the same layer that contain it, odd depths are holes of the containing ring one level up. For this test the
+        # layers are moved apart along x, so the tree never pairs rings of different layers
+        spacing = 2 * np.ptp(contours[:, 0]) + 1
+        shift = np.column_stack((ring_layer * spacing, np.zeros(len(starts))))
+        shifted = shapely.polygons(shapely.linearrings(contours[:, :2] + shift[ids], indices=ids))
+        inside, outside = shapely.STRtree(shifted).query(shapely.points(contours[starts, :2] + shift),
+                                                         predicate='within')
+        inside, outside = inside[inside != outside], outside[inside != outside]
+        depth = np.bincount(inside, minlength=len(rings))
+        hole = depth % 2 == 1
+        shell = np.arange(len(rings))
+        parent = depth[outside] == depth[inside] - 1
+        shell[inside[parent & hole[inside]]] = outside[parent & hole[inside]]
+
+        # The shell of a polygon comes first and the polygons of a layer are consecutive, as the indices of the
+        # shapely constructors require
+        order = np.lexsort((hole, shell, ring_layer[shell]))
+        first = np.diff(shell[order], prepend=-1) != 0
+        polygons = shapely.polygons(rings[order], indices=np.cumsum(first) - 1)
+        layers = shapely.multipolygons(polygons, indices=ring_layer[order][first])
+        # make_valid keeps the loops that run against their ring as holes, a zero buffer drops them
+        if distance:
+            layers = shapely.make_valid(layers)
+        offset = shapely.buffer(layers, distance, quad_segs=quad_segs)
+
+        parts, part_layer = shapely.get_parts(offset, return_index=True)
+        is_polygon = shapely.get_type_id(parts) == 3
+        parts, part_layer = parts[is_polygon], part_layer[is_polygon]
+        out_rings, ring_part = shapely.get_rings(parts, return_index=True)
+        exterior = np.diff(ring_part, prepend=-1) != 0
+        flip = shapely.is_ccw(out_rings) != exterior
+        out_rings[flip] = shapely.reverse(out_rings[flip])
+        xy, out_ids = shapely.get_coordinates(out_rings, return_index=True)
+        if len(xy) == 0:
+            return np.empty((0, contours.shape[1]))
+        z = layer_z[part_layer[ring_part[out_ids]]]
+        result = np.column_stack((xy, z))
+
+        if contours.shape[1] > 3:
+            from scipy.spatial import cKDTree
 
+            # The layer index as a third coordinate, spaced wider than any distance within a layer, keeps the lookup
+            # inside the layer
+            spacing = 2 * (np.linalg.norm(np.ptp(contours[:, :2], axis=0)) + abs(distance)) + 1
+            _, nearest = cKDTree(np.column_stack((contours[:, :2], ring_layer[ids] * spacing))).query(
+                np.column_stack((xy, part_layer[ring_part[out_ids]] * spacing)))
+            result = np.column_stack((result, contours[nearest, 3:]))
+        return result
+
+    def _schedule_layers(self, points, normals, z_values, layer_height, alpha_value, processes=None,
+                         engine='alpha') -> dict:
+        """
+        Distributes the layers of the alpha shape or raster engine over the shared worker pool. The cost of a layer is
+        estimated from the number of points in its band (n log n for the Delaunay triangulation, n plus the pixels of
+        the band for the raster). Only the points of a band are sent to the workers, never the whole GeometryImport
+        object.
+
+        :param points: np.ndarray, (N, 3) array of the points sorted by z.
+        :param normals: np.ndarray, (N, 3) array of the normals of the points.
+        :param z_values: np.ndarray, lower z value of every layer.
+        :param layer_height: float or np.ndarray, height of every layer.
+        :param alpha_value: float, alpha value for the alpha shape of every layer.
+        :param processes: int, number of worker processes of the shared pool.
+        :param engine: str, 'alpha' for _layer_contours or 'raster' for raster_section.
+        :return: dict, (m, 6) contour array of every non-empty layer by the index of its z value.
+        """
+        layer_height = np.broadcast_to(layer_height, np.shape(z_values))
+        lower, upper = band_bounds(points[:, 2], z_values, z_values + layer_height)
+        counts = upper - lower
+        if engine == 'raster':
+            function = GeometryImport.raster_section
+            extent = np.array([np.ptp(points[lower[layer]:upper[layer], :2], axis=0) if counts[layer] else (0.0, 0.0)
+                               for layer in range(len(counts))]).reshape(-1, 2)
+            # Pixels of 1 / (16 alpha), see raster_section
+            cost = counts + np.prod(extent * 16 * alpha_value + 36, axis=1)
+        else:
+            function = GeometryImport._layer_contours
+            cost = counts * np.log2(np.maximum(counts, 2))
+
+        tasks = {layer: (function,
+                         (points[lower[layer]:upper[layer], :2], normals[lower[layer]:upper[layer]],
+                          z_values[layer] + layer_height[layer] / 2, alpha_value))
+                 for layer in np.flatnonzero(counts > 0)}
+        return self._run_batches(tasks, cost, processes)
+
+    def _schedule_sections(self, triangles, face_normals, z_values, layer_height, processes=None) -> dict:
+        """
+        Distributes the layers of the exact section engine over the shared worker pool. Every layer is cut in the
+        middle of its band and only the triangles crossing that plane are sent to the workers; the cost of a layer is
+        the number of these triangles.
+
+        :param triangles: np.ndarray, (F, 3, 3) array of the triangle corners.
+        :param face_normals: np.ndarray, (F, 3) array of the unit face normals.
+        :param z_values: np.ndarray, lower z value of every layer.
+        :param layer_height: float or np.ndarray, height of every layer.
+        :param processes: int, number of worker processes of the shared pool.
+        :return: dict, (m, 6) contour array of every non-empty layer by the index of its z value.
+        """
+        z_planes = z_values + layer_height / 2
+        z_low = triangles[:, :, 2].min(axis=1)
+        z_high = triangles[:, :, 2].max(axis=1)
+        # Sorted by their lowest corner the candidates of a plane are a prefix of the triangles
+        order = np.argsort(z_low, kind='stable')
+        triangles, face_normals, z_low, z_high = triangles[order], face_normals[order], z_low[order], z_high[order]
+        prefix = np.searchsorted(z_low, z_planes, side='right')
+
+        tasks, cost = {}, np.zeros(len(z_values))
+        for layer, (z_plane, end) in enumerate(zip(z_planes, prefix)):
+            crossing = np.flatnonzero(z_high[:end] >= z_plane)
+            cost[layer] = len(crossing)
+            if len(crossing):
+                tasks[layer] = (GeometryImport.exact_section, (triangles[crossing], face_normals[crossing], z_plane))
+        return self._run_batches(tasks, cost, processes)
+
+    def _run_batches(self, tasks: dict, cost: np.ndarray, processes=None) -> dict:
+        """
+        Runs the layer tasks on the shared worker pool. The layers are handed out heaviest first and grouped into
+        batches of roughly equal cost, so that the wide layers at the base of a part do not all end up on one worker.
+
+        :param tasks: dict, (function, arguments) of every layer by the index of its z value.
+        :param cost: np.ndarray, estimated cost of every layer.
+        :param processes: int, number of worker processes of the shared pool.
+        :return: dict, the result of every layer by its index.
+        """
+        pool, pool_size = get_worker_pool(processes)
+        layers = np.array(sorted(tasks), dtype=int)
+        layers = layers[np.argsort(-cost[layers], kind='stable')]
+
+        # Batches of about a quarter of the fair share of one worker, heavy layers form batches of their own
+        target = cost[layers].sum() / (4 * pool_size) if len(layers) else 0
+        batches, batch, batch_cost = [], [], 0.0
+        for layer in layers:
+            batch.append((layer, *tasks[layer]))
+            batch_cost += cost[layer]
+            if batch_cost >= target:
+                batches.append(batch)
+                batch, batch_cost = [], 0.0
+        if batch:
+            batches.append(batch)
+
+        start = time.perf_counter()
+        contours, busy = {}, {}
+        for layer_contours, pid, elapsed in pool.imap_unordered(GeometryImport._slice_layers, batches):
+            contours.update(layer_contours)
+            busy[pid] = busy.get(pid, 0.0) + elapsed
+            if self.progress is not None:
+                self.progress(len(contours), len(layers))
+        wall = time.perf_counter() - start
+
+        self.worker_utilisation = {pid: busy_time / wall for pid, busy_time in busy.items()} if wall > 0 else {}
+        print(f"Sliced {len(layers)} layers in {len(batches)} batches on {pool_size} workers in {wall:.2f} s")
+        for pid, utilisation in sorted(self.worker_utilisation.items()):
+            print(f"    Worker {pid}: {utilisation:.0%} busy")
+
+        return contours
+
+    @staticmethod
+    def _slice_layers(batch):
+        """
+        Worker function of the shared pool: computes the contours of a batch of layers.
+
+        :param batch: list, tuples of (layer index, function, arguments) where the function returns the contour.
+        :return: tuple, dict of the (m, 6) contour arrays by layer index, process id and busy time in seconds.
+        """
+        start = time.perf_counter()
+        layer_contours = {}
+        for layer, function, arguments in batch:
+            layer_contours[layer] = function(*arguments)
+        return layer_contours, os.getpid(), time.perf_counter() - start
+
+    @staticmethod
+    def _layer_contours(layer_points, layer_normals, z_layer, alpha_value) -> np.ndarray:
+        """
+        Computes the closed exterior rings of the alpha shape of one layer together with the normals of their points.
+
+        :return: np.ndarray, (m, 6) array of [x, y, z, nx, ny, nz] rows, empty if the layer has no contour.
+        """
+        concave_hull = GeometryImport.alpha_shape(layer_points, alpha=alpha_value)
+        if concave_hull.is_empty:
+            return np.empty((0, 6))
+        if concave_hull.geom_type == 'Polygon':
+            polygons = [concave_hull]
+        elif concave_hull.geom_type == 'MultiPolygon':
+            polygons = list(concave_hull.geoms)
+        else:
+            return np.empty((0, 6))
+
+        from scipy.spatial import cKDTree
+
+        # The contour vertices are points of the layer, so their normals are looked up from the nearest point
+        layer_tree = cKDTree(layer_points)
         all_contour_points = []
+        for polygon in polygons:
+            x, y = polygon.exterior.xy
+            _, nearest = layer_tree.query(np.column_stack((x, y)))
+            all_contour_points.append(np.column_stack((x, y, np.full_like(x, z_layer), layer_normals[nearest])))
+        return np.vstack(all_contour_points)
 
-        for z in z_values:
-            if z == z_max:  # if it is the last/topmost layer
-                layer = []
-            else:
-                layer = points[(points[:, 2] >= z) & (points[:, 2] < z + layer_height)]
-            if len(layer) == 0:
-                continue
-            concave_hull = instance.alpha_shape(layer[:, :2], alpha=alpha_value)
-            if concave_hull.is_empty:
+    @staticmethod
+    def exact_section(triangles: np.ndarray, face_normals: np.ndarray, z_layer: float) -> np.ndarray:
+        """
+        Cuts a set of triangles with the plane z = z_layer and chains the cut segments into closed rings. The points
+        are the exact intersections of the mesh edges with the plane, so no sampling or alpha value is involved. The
+        section of an open surface also has open chains; they follow the rings and repeat their last point instead of
+        the first one, so PathResampling.contour_ring_ids tells them apart without adding a chord between their ends.
+
+        Every segment is directed so that the outward face normal points to its right, which makes outer rings
+        counterclockwise and holes clockwise seen from above. The crossing point of an edge is always interpolated from
+        its lower to its upper corner, so the two triangles sharing the edge produce bitwise equal points and the
+        segments chain up by their coordinates.
+
+        :param triangles: np.ndarray, (F, 3, 3) array of the triangle corners.
+        :param face_normals: np.ndarray, (F, 3) array of the unit face normals.
+        :param z_layer: float, z value of the plane.
+        :return: np.ndarray, (m, 6) array of [x, y, z, nx, ny, nz] rows of the rings and then the open chains, empty
+            if the plane misses the mesh.
+        """
+        triangles = np.asarray(triangles, dtype=np.float64)
+        distance = triangles[:, :, 2] - z_layer
+        # Corners on the plane count as above it, so every crossing triangle has exactly two crossing edges
+        above = distance >= 0
+        crossing = above.any(axis=1) & ~above.all(axis=1)
+        triangles, distance, above = triangles[crossing], distance[crossing], above[crossing]
+        normals = np.asarray(face_normals, dtype=np.float64)[crossing]
+        if len(triangles) == 0:
+            return np.empty((0, 6))
+
+        # The lone corner is the one on its own side of the plane, both of its edges cross the plane
+        lone = np.where(above.sum(axis=1) == 1, np.argmax(above, axis=1), np.argmin(above, axis=1))
+        rows = np.arange(len(triangles))
+        cut = []
+        for other in ((lone + 1) % 3, (lone + 2) % 3):
+            low = np.where(above[rows, lone], other, lone)
+            high = np.where(above[rows, lone], lone, other)
+            d_low, d_high = distance[rows, low], distance[rows, high]
+            fraction = -d_low / (d_high - d_low)
+            corner_low, corner_high = triangles[rows, low, :2], triangles[rows, high, :2]
+            cut.append(corner_low + fraction[:, None] * (corner_high - corner_low))
+        first, second = cut
+        # A triangle touching the plane with a single corner gives a zero length segment that would end its ring
+        proper = np.any(first != second, axis=1)
+        first, second, normals = first[proper], second[proper], normals[proper]
+        if len(first) == 0:
+            return np.empty((0, 6))
+
+        # Direct every segment so that the face normal points to its right
+        direction = second - first
+        flip = direction[:, 1] * normals[:, 0] - direction[:, 0] * normals[:, 1] < 0
+        first[flip], second[flip] = second[flip], first[flip]
+
+        nodes, node_ids = np.unique(np.vstack((first, second)), axis=0, return_inverse=True)
+        node_ids = node_ids.reshape(-1)
+        start, end = node_ids[:len(first)], node_ids[len(first):]
+        node_normals = np.zeros((len(nodes), 3))
+        node_normals[start] = normals
+
+        chains, closed = chain_segments(start, end)
+        rings = []
+        for chain, ring in sorted(zip(chains, closed), key=lambda item: not item[1]):
+            if not ring:
+                # The last node of an open chain starts no segment, it takes the normal of the segment ending there
+                node_normals[chain[-1]] = node_normals[chain[-2]]
+            chain = np.append(chain, chain[0] if ring else chain[-1])
+            rings.append(np.column_stack((nodes[chain], np.full(len(chain), z_layer), node_normals[chain])))
+        return np.vstack(rings) if rings else np.empty((0, 6))
+
+    @staticmethod
+    def raster_section(layer_points: np.ndarray, layer_normals: np.ndarray, z_layer: float, alpha_value: float,
+                       pixels_per_radius: int = 16) -> np.ndarray:
+        """
+        Computes the contour of one layer on an occupancy raster instead of a triangulation. The points are binned into
+        square pixels of 1 / (alpha_value * pixels_per_radius), the occupied pixels are closed with a disk of the alpha
+        radius and the outline of the closed region is traced with marching squares.
+
+        The closing of a point set with a disk of radius 1 / alpha is the region that no empty disk of that radius
+        reaches, the same region the alpha shape approximates with straight edges. Dilation and erosion are both
+        thresholds of Euclidean distance transforms, so a layer costs O(N + pixels) whatever the alpha radius. The
+        contour is interpolated on the distance field and lies within about one pixel of the closing of the points:
+        halving the pixel size halves the deviation and quadruples the raster.
+
+        :param layer_points: np.ndarray, (n, 2) array of the x and y coordinates of the points of the band.
+        :param layer_normals: np.ndarray, (n, 3) array of the normals of the points.
+        :param z_layer: float, z value of the contour.
+        :param alpha_value: float, alpha value that sets the radius of the closing.
+        :param pixels_per_radius: int, number of pixels per alpha radius.
+        :return: np.ndarray, (m, 6) array of [x, y, z, nx, ny, nz] rows of the closed exterior rings, empty if the
+            layer has no contour.
+        """
+        from scipy import ndimage
+        from scipy.spatial import cKDTree
+
+        if len(layer_points) == 0:
+            return np.empty((0, 6))
+        pixel = 1.0 / (alpha_value * pixels_per_radius)
+        # The margin keeps the dilated region away from the border of the raster, so every contour closes
+        margin = pixels_per_radius + 2
+        origin = layer_points.min(axis=0) - (margin + 0.5) * pixel
+        cells = np.floor((layer_points - origin) / pixel).astype(np.int64)
+        occupied = np.zeros(tuple(cells.max(axis=0) + margin + 1), dtype=bool)
+        occupied[cells[:, 0], cells[:, 1]] = True
+
+        dilated = ndimage.distance_transform_edt(~occupied) < pixels_per_radius
+        # Positive inside the closing, with its boundary at the level 0. The closing of points along a wall thinner
+        # than a pixel has no area, so the erosion stops half a pixel short: the contour then runs along the outer
+        # edges of the occupied pixels, and gaps of up to half an alpha radius between the points of a wall are bridged
+        field = ndimage.distance_transform_edt(dilated) - (pixels_per_radius - 0.5)
+        rings = GeometryImport.marching_squares(field, 0.0)
+
+        layer_tree = cKDTree(layer_points)
+        contours = []
+        for ring in rings:
+            # Holes are clockwise; like the alpha shape engine only the exterior rings are kept
+            if np.sum(ring[:, 0] * np.roll(ring[:, 1], -1) - np.roll(ring[:, 0], -1) * ring[:, 1]) <= 0:
                 continue
-            # z_layer = z + layer_height / 2.0
-            z_layer = z + layer_height/2
-            if concave_hull.geom_type == 'Polygon':
-                x, y = concave_hull.exterior.xy
-                contour_points = np.column_stack((x, y, np.full_like(x, z_layer)))
-                all_contour_points.append(contour_points)
-            elif concave_hull.geom_type == 'MultiPolygon':
-                for polygon in concave_hull:
-                    x, y = polygon.exterior.xy
-                    contour_points = np.column_stack((x, y, np.full_like(x, z_layer)))
-                    all_contour_points.append(contour_points)
-
-        if all_contour_points:
-            return np.vstack(all_contour_points)
-        else:
-            return np.array([])  # Return an empty array if no contour points are generated.
+            xy = origin + (np.vstack((ring, ring[:1])) + 0.5) * pixel
+            _, nearest = layer_tree.query(xy)
+            contours.append(np.column_stack((xy, np.full(len(xy), z_layer), layer_normals[nearest])))
+        return np.vstack(contours) if contours else np.empty((0, 6))
 
     @staticmethod
-    def plot_contours(data) -> None:
+    def marching_squares(field: np.ndarray, level: float = 0.0) -> list[np.ndarray]:
+        """
+        Traces the level lines of a 2D field in one vectorized pass over its cells. The crossing points are linearly
+        interpolated on the edges between the samples and chained into rings with Kernels.chain_segments. The region
+        above the level is always on the left, so outer rings are counterclockwise and holes clockwise when the first
+        index is x and the second y. Saddle cells are resolved with the mean of their four corners.
 
+        :param field: np.ndarray, (nx, ny) array of samples; the samples on the border should be below the level so
+            that every line closes.
+        :param level: float, value of the level lines.
+        :return: list, (r, 2) arrays of the fractional indices of every ring, without repeating the first point.
         """
-        Plot outer contours with changing colors for each unique z value along with a color bar.
+        nx, ny = field.shape
+        inside = field > level
+        corners = (inside[:-1, :-1], inside[1:, :-1], inside[1:, 1:], inside[:-1, 1:])
+        case = corners[0] + 2 * corners[1] + 4 * corners[2] + 8 * corners[3]
+        centre = (field[:-1, :-1] + field[1:, :-1] + field[1:, 1:] + field[:-1, 1:]) / 4 > level
+        i, j = np.nonzero((case > 0) & (case < 15))
+        pairs = _MARCHING_SQUARES[case[i, j] + 16 * centre[i, j]]
+
+        # Edge k of a cell runs from corner k to corner k + 1 counterclockwise; the edges along x are numbered first
+        n_x_edges = (nx - 1) * ny
+        edge_ids = np.column_stack((i * ny + j, n_x_edges + (i + 1) * (ny - 1) + j, i * ny + j + 1,
+                                    n_x_edges + i * (ny - 1) + j))
+        start, end = [], []
+        for slot in range(2):
+            valid = pairs[:, slot, 0] >= 0
+            rows = np.flatnonzero(valid)
+            start.append(edge_ids[rows, pairs[valid, slot, 0]])
+            end.append(edge_ids[rows, pairs[valid, slot, 1]])
+        start, end = np.concatenate(start), np.concatenate(end)
+        if len(start) == 0:
+            return []
+
+        edges, nodes = np.unique(np.concatenate((start, end)), return_inverse=True)
+        nodes = nodes.reshape(-1)
+        along_x = edges < n_x_edges
+        a_i = np.where(along_x, edges // ny, (edges - n_x_edges) // (ny - 1))
+        a_j = np.where(along_x, edges % ny, (edges - n_x_edges) % (ny - 1))
+        b_i, b_j = a_i + along_x, a_j + ~along_x
+        value_a, value_b = field[a_i, a_j], field[b_i, b_j]
+        fraction = (level - value_a) / (value_b - value_a)
+        points = np.column_stack((a_i + fraction * along_x, a_j + fraction * ~along_x))
+        chains, _ = chain_segments(nodes[:len(start)], nodes[len(start):])
+        return [points[ring] for ring in chains]
+
+    @staticmethod
+    def ring_ids(coordinates: np.ndarray) -> np.ndarray:
+        """
+        Assigns every point of a stacked contour array to the ring it belongs to, see PathResampling.contour_ring_ids.
+
+        :param coordinates: np.ndarray, (n, 3) array of the x, y and z coordinates of the stacked contours.
+        :return: np.ndarray, (n,) array of ring indices starting at 0.
+        """
+        return contour_ring_ids(coordinates)
+
+    @staticmethod
+    def spiral_toolpath(contours: np.ndarray, points_per_layer: int = 200) -> np.ndarray:
+        """
+        Blends layered contours into one continuous helical path, so that the tool neither steps down nor stops at a
+        fine point between the layers. The longest ring of every layer is resampled to points_per_layer points
+        equally spaced by arc length, all the rings are turned counterclockwise and started at the point closest to
+        the positive x-axis (the quadrant 1 / y=0 rule of sequence_points). Along every turn the path then moves
+        from the contour of the layer to the contour of the next layer while z rises linearly with the arc length.
+
+        The returned path should be programmed with a fine point at its end only, which RAPIDGenerator.layer_stops
+        does for every path whose z changes at nearly every target; PathResampling.path_layers finds its turns.
+
+        :param contours: np.ndarray, (n, k) array of the stacked layer contours, k >= 3.
+        :param points_per_layer: int, number of points of every turn of the helix.
+        :return: np.ndarray, (m, k) array of the helical path.
+        """
+        ids = GeometryImport.ring_ids(contours)
+        starts = np.flatnonzero(np.diff(ids, prepend=-1))
+        ring_z = contours[starts, 2]
+
+        # One ring per layer: the longest one, with the layers in increasing order of z
+        order = np.lexsort((-ring_perimeters(contours, ids), ring_z))
+        _, first = np.unique(ring_z[order], return_index=True)
+        selected = order[first]
+        keep = np.isin(ids, selected)
+        rings, ring = resample_rings(contours[keep], ids[keep], points_per_layer)
+        rings = rings.reshape(len(selected), points_per_layer, -1)
+        # resample_rings numbers the kept rings in their order in contours, so restore the z order
+        rings = rings[np.argsort(np.argsort(selected))]
+
+        x = rings[:, :, 0]
+        y = rings[:, :, 1]
+        area = 0.5 * np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y, axis=1)
+        rings[area < 0] = rings[area < 0, ::-1]
 
-        Parameters
-        ----------
-        data : numpy.ndarray
-        An ndarray of shape (n, 3) where each row represents (x, y, z) coordinates.
+        start = np.argmin(np.abs(np.arctan2(rings[:, :, 1], rings[:, :, 0])), axis=1)
+        rolled = (start[:, None] + np.arange(points_per_layer)) % points_per_layer
+        rings = np.take_along_axis(rings, rolled[:, :, None], axis=1)
 
-        Returns
-        -------
-        None
+        # Every turn goes from layer l to layer l + 1; the last layer is closed as a flat ring
+        following = np.concatenate((rings[1:], rings[-1:]), axis=0)
+        weight = (np.arange(points_per_layer) / points_per_layer)[None, :, None]
+        spiral = (1.0 - weight) * rings + weight * following
+        spiral = np.concatenate((spiral.reshape(-1, rings.shape[2]), rings[-1, :1]), axis=0)
+        return spiral
+
+    @staticmethod
+    def rot_T_ROB1(coordinates: np.ndarray, normals: np.ndarray, smoothing: int = 0,
+                   reference=(0.0, 0.0, 1.0)) -> np.ndarray:
+        """
+        Determines the end effector quaternions of the whole path in one pass. The tool z-axis is pointed against the
+        surface normal and the tool x-axis along the contour tangent, which for a flat layer gives the usual
+        [0, 0, 1, 0] family of orientations. The normals are turned to the forming side once for the whole path (to
+        +z by default, so the tool approaches from above), see orient_normals.
+
+        :param coordinates: np.ndarray, (n, 3) array of the x, y and z coordinates of the robot path.
+        :param normals: np.ndarray, (n, 3) array of the consistently oriented surface normals of the targets.
+        :param smoothing: int, half width in targets of the window over which neighbouring normals on the same ring
+            are averaged before the orientation is computed. 0 disables the smoothing.
+        :param reference: array_like, (3,) direction of the side the tool forms from, see orient_normals.
+        :return: np.ndarray, (n, 4) array of unit quaternions in the RAPID order [q1, q2, q3, q4].
         """
+        coordinates = np.asarray(coordinates, dtype=float)[:, :3]
+        normals = GeometryImport.orient_normals(normals, reference)
+        n = len(coordinates)
+
+        ids = GeometryImport.ring_ids(coordinates)
+        ring_start = np.flatnonzero(np.diff(ids, prepend=-1))
+        ring_len = np.diff(np.append(ring_start, n))
+        start = ring_start[ids]
+        length = ring_len[ids]
+        position = np.arange(n) - start
+
+        if smoothing > 0:
+            window = np.zeros_like(normals)
+            for offset in range(-smoothing, smoothing + 1):
+                window += normals[start + (position + offset) % length]
+            normals = window
+        normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
 
-        # Extract x, y, and z columns
-        x = data[:, 0]
-        y = data[:, 1]
-        z = data[:, 2]
+        tangent = coordinates[start + (position + 1) % length] - coordinates[start + (position - 1) % length]
 
-        df = np.array(data)
-        datafrm = pd.DataFrame(df)
-        datafrm.to_excel("checking_all_layers.xlsx")
+        z_axis = -normals
+        x_axis = tangent - np.sum(tangent * z_axis, axis=1, keepdims=True) * z_axis
+        x_norm = np.linalg.norm(x_axis, axis=1)
+        # Degenerate tangents (single point rings, tangent along the normal) fall back to the world x-axis
+        degenerate = x_norm < 1e-9
+        if np.any(degenerate):
+            fallback = np.array([1.0, 0.0, 0.0]) - z_axis[degenerate, 0:1] * z_axis[degenerate]
+            fallback[np.linalg.norm(fallback, axis=1) < 1e-9] = [0.0, 1.0, 0.0]
+            x_axis[degenerate] = fallback
+            x_norm = np.linalg.norm(x_axis, axis=1)
+        x_axis /= x_norm[:, None]
+        y_axis = np.cross(z_axis, x_axis)
 
-        print(f"Maximum z value: {max(z)}")
-        print(f"Minimum z value: {min(z)}")
+        q = GeometryImport._matrix_to_quaternion(np.stack((x_axis, y_axis, z_axis), axis=2))
 
-        # Create a figure and 3D axis
-        fig = plt.figure(figsize=(16,9))
-        ax = fig.add_subplot(111, projection='3d')
+        # q and -q are the same orientation; keep neighbouring targets on the same side to avoid wrist flips
+        signs = np.where(np.sum(q[1:] * q[:-1], axis=1) < 0, -1.0, 1.0)
+        q[1:] *= np.cumprod(signs)[:, None]
+        return q
 
-        # Get unique z values and assign a color to each
-        unique_z = np.unique(z)
-        colors = plt.cm.viridis(np.linspace(0, 1, len(unique_z)))
+    @staticmethod
+    def rot_T_ROB2(coordinates: np.ndarray, normals: np.ndarray, smoothing: int = 0,
+                   reference=(0.0, 0.0, 1.0)) -> np.ndarray:
+        """
+        Determines the end effector quaternions of the slave robot, which forms the sheet from below. The orientation
+        of rot_T_ROB1 is turned by 180 degrees about the tool x-axis so that the tool z-axis points along the normal.
 
-        # Plot the lines with changing colors
-        for i, z_val in enumerate(unique_z):
-            mask = (z == z_val)
-            x_level = x[mask]
-            y_level = y[mask]
-            z_level = z[mask]
-            print(f"Layer Number -> {i+1}")
-            # Connect the last and first points to form a closed contour
-            x_level = np.append(x_level, x_level[0])
-            y_level = np.append(y_level, y_level[0])
-            z_level = np.append(z_level, z_level[0])
+        :param coordinates: np.ndarray, (n, 3) array of the x, y and z coordinates of the robot path.
+        :param normals: np.ndarray, (n, 3) array of the surface normals of the targets.
+        :param smoothing: int, half width in targets of the normal smoothing window, see rot_T_ROB1.
+        :param reference: array_like, (3,) direction of the side of the master robot, see rot_T_ROB1.
+        :return: np.ndarray, (n, 4) array of unit quaternions in the RAPID order [q1, q2, q3, q4].
+        """
+        q = GeometryImport.rot_T_ROB1(coordinates, normals, smoothing=smoothing, reference=reference)
+        # q * [0, 1, 0, 0]
+        return np.column_stack((-q[:, 1], q[:, 0], q[:, 3], -q[:, 2]))
 
-            ax.plot(x_level, y_level, z_level, color=colors[i])
+    @staticmethod
+    def conf_T_ROB1(coordinates: np.ndarray, rotation: np.ndarray, tool=None, wobj=None,
+                    layered: bool = True) -> np.ndarray:
+        """
+        Determines the configuration data [cf1, cf4, cf6, cfx] of the path of the IRB 4600 from its inverse kinematics
+        instead of the sign of y: one arm configuration that reaches the most targets is used for the whole path and
+        the quadrants follow the joint angles, see RobotKinematics.IRB4600.check_path, which also reports the
+        unreachable and wrist singular targets.
 
-        # Add labels and legend
-        ax.set_xlabel('X')
-        ax.set_ylabel('Y')
-        ax.set_zlabel('Z')
+        :param coordinates: np.ndarray, (n, 3) array of the x, y and z coordinates of the robot path in the work object.
+        :param rotation: np.ndarray, (4,) or (n, 4) array of the tool quaternions, see rot_T_ROB1.
+        :param tool: tuple, TCP (3,) and quaternion (4,) of the tool, defaults to MyTool.
+        :param wobj: tuple, origin (3,) and quaternion (4,) of the work object, defaults to wobj0.
+        :param layered: bool, True if the path consists of closed rings, between which the wrist may unwind, False
+            for one continuous path such as spiral_toolpath.
+        :return: np.ndarray, (n, 4) array of configuration data.
+        """
+        from RobotKinematics import IDENTITY, IRB4600, MY_TOOL
 
-        ax.set_xlim(-100, 100)
-        ax.set_ylim(-100, 100)
-        ax.set_zlim(-100, 100)
+        robot = IRB4600(tool=MY_TOOL if tool is None else tool, wobj=IDENTITY if wobj is None else wobj)
+        ring_ids = GeometryImport.ring_ids(coordinates) if layered else None
+        return robot.check_path(coordinates, rotation, ring_ids=ring_ids)['confdata']
 
-        ax.grid(False)
-        plt.show()
+    @staticmethod
+    def _matrix_to_quaternion(rotation: np.ndarray) -> np.ndarray:
+        """
+        Converts a stack of rotation matrices into unit quaternions [w, x, y, z] using the branch of Shepperd's method
+        with the largest pivot for every matrix.
+
+        :param rotation: np.ndarray, (n, 3, 3) array of rotation matrices.
+        :return: np.ndarray, (n, 4) array of unit quaternions.
+        """
+        r = rotation
+        trace = r[:, 0, 0] + r[:, 1, 1] + r[:, 2, 2]
+        pivot = np.argmax(np.column_stack((trace, r[:, 0, 0], r[:, 1, 1], r[:, 2, 2])), axis=1)
+        q = np.empty((len(r), 4))
+
+        m = pivot == 0
+        s = 2.0 * np.sqrt(np.maximum(1.0 + trace[m], 0.0))
+        q[m] = np.column_stack((0.25 * s, (r[m, 2, 1] - r[m, 1, 2]) / s, (r[m, 0, 2] - r[m, 2, 0]) / s,
+                                (r[m, 1, 0] - r[m, 0, 1]) / s))
+        m = pivot == 1
+        s = 2.0 * np.sqrt(np.maximum(1.0 + r[m, 0, 0] - r[m, 1, 1] - r[m, 2, 2], 0.0))
+        q[m] = np.column_stack(((r[m, 2, 1] - r[m, 1, 2]) / s, 0.25 * s, (r[m, 0, 1] + r[m, 1, 0]) / s,
+                                (r[m, 0, 2] + r[m, 2, 0]) / s))
+        m = pivot == 2
+        s = 2.0 * np.sqrt(np.maximum(1.0 + r[m, 1, 1] - r[m, 0, 0] - r[m, 2, 2], 0.0))
+        q[m] = np.column_stack(((r[m, 0, 2] - r[m, 2, 0]) / s, (r[m, 0, 1] + r[m, 1, 0]) / s, 0.25 * s,
+                                (r[m, 1, 2] + r[m, 2, 1]) / s))
+        m = pivot == 3
+        s = 2.0 * np.sqrt(np.maximum(1.0 + r[m, 2, 2] - r[m, 0, 0] - r[m, 1, 1], 0.0))
+        q[m] = np.column_stack(((r[m, 1, 0] - r[m, 0, 1]) / s, (r[m, 0, 2] + r[m, 2, 0]) / s,
+                                (r[m, 1, 2] + r[m, 2, 1]) / s, 0.25 * s))
+
+        return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+    @staticmethod
+    def plot_contours(data) -> None:
+        """
+        Plots the contours and exports them to Excel, see GeometryPlotting.plot_contours.
+        """
+        from GeometryPlotting import plot_contours
+        plot_contours(data)
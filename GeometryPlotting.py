@@ -0,0 +1,98 @@
+"""
+Plotting and Excel export of the points and contours generated with Geometry4.GeometryImport. Kept apart from the
+slicing core so that matplotlib and pandas are only imported when something is actually plotted or exported.
+"""
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+def points_visualization(common_array_x, common_array_y, common_array_z) -> None:
+    """
+    Plots the sampled points of a part in 3D.
+    """
+    # common_array = np.vstack((common_array_x, common_array_y, common_array_z))
+    fig = plt.figure(figsize=(16, 9))
+    ax1 = plt.axes(projection='3d')
+    ax1.plot(common_array_x, common_array_y, common_array_z, marker='o', c='r')
+    ax1.set_xlim(-120, 120)
+    ax1.set_ylim(-120, 120)
+    ax1.set_zlim(-120, 120)
+    plt.show()
+
+
+def export_contours(data, filepath) -> None:
+    """
+    Writes the contour points to an Excel file.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+    An ndarray of shape (n, 3) where each row represents (x, y, z) coordinates.
+    filepath : str
+    Path of the Excel file.
+    """
+    import pandas as pd
+
+    datafrm = pd.DataFrame(np.array(data))
+    datafrm.to_excel(filepath)
+
+
+def plot_contours(data) -> None:
+
+    """
+    Plot outer contours with changing colors for each unique z value along with a color bar.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+    An ndarray of shape (n, 3) where each row represents (x, y, z) coordinates.
+
+    Returns
+    -------
+    None
+    """
+
+    # Extract x, y, and z columns
+    x = data[:, 0]
+    y = data[:, 1]
+    z = data[:, 2]
+
+    export_contours(data, "checking_all_layers.xlsx")
+
+    print(f"Maximum z value: {max(z)}")
+    print(f"Minimum z value: {min(z)}")
+
+    # Create a figure and 3D axis
+    fig = plt.figure(figsize=(16,9))
+    ax = fig.add_subplot(111, projection='3d')
+
+    # Get unique z values and assign a color to each
+    unique_z = np.unique(z)
+    colors = plt.cm.viridis(np.linspace(0, 1, len(unique_z)))
+
+    # Plot the lines with changing colors
+    for i, z_val in enumerate(unique_z):
+        mask = (z == z_val)
+        x_level = x[mask]
+        y_level = y[mask]
+        z_level = z[mask]
+        print(f"Layer Number -> {i+1}")
+        # Connect the last and first points to form a closed contour
+        x_level = np.append(x_level, x_level[0])
+        y_level = np.append(y_level, y_level[0])
+        z_level = np.append(z_level, z_level[0])
+
+        ax.plot(x_level, y_level, z_level, color=colors[i])
+
+    # Add labels and legend
+    ax.set_xlabel('X')
+    ax.set_ylabel('Y')
+    ax.set_zlabel('Z')
+
+    ax.set_xlim(-100, 100)
+    ax.set_ylim(-100, 100)
+    ax.set_zlim(-100, 100)
+
+    ax.grid(False)
+    plt.show()
@@ -0,0 +1,209 @@
+"""
+Incremental re-slicing of revised STL parts.
+
+The layer bands are fixed in the coordinates of the STL file (band k covers z_origin + k * layer_height up to the next
+band), and every band gets a fingerprint computed from the triangles that overlap it. The points of a band are sampled
+per triangle with a random stream seeded by the triangle itself, so an unchanged triangle always yields the same
+points. A band whose fingerprint is already in the cache therefore has exactly the contour that was computed before,
+and only the bands touched by an edit are sliced again and spliced into the toolpath.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from Geometry4 import GeometryImport
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """
+    splitmix64 finaliser, a vectorized hash of uint64 values.
+    """
+    with np.errstate(over='ignore'):
+        x = x + _GOLDEN
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _uniform(keys: np.ndarray) -> np.ndarray:
+    """
+    Deterministic uniform numbers in [0, 1) from uint64 keys.
+    """
+    return (_mix(keys) >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+
+def triangle_keys(triangles: np.ndarray, resolution: float = 1e-6) -> np.ndarray:
+    """
+    Hashes every triangle from its corner coordinates rounded to the resolution.
+
+    :param triangles: np.ndarray, (F, 3, 3) array of the triangle corners.
+    :param resolution: float, coordinates closer than this are treated as equal.
+    :return: np.ndarray, (F,) array of uint64 keys.
+    """
+    rounded = np.rint(triangles.reshape(len(triangles), 9) / resolution).astype(np.int64).view(np.uint64)
+    keys = np.zeros(len(triangles), dtype=np.uint64)
+    for column in range(9):
+        keys = _mix(keys ^ rounded[:, column])
+    return keys
+
+
+class IncrementalSlicer:
+
+    def __init__(self, cache_dir: str, layer_height: float = 1.0, alpha_value: float = 0.5,
+                 point_density: float = 10.0, z_origin: float = 0.0, processes=None) -> None:
+        """
+        Initializes an IncrementalSlicer object.
+
+        :param cache_dir: str, directory the contours of the bands are cached in. Every part gets a directory of its
+            own, keyed by the settings and the resolved path of its file, see part_cache_dir. The files of the bands
+            that a new revision of the part changed are deleted.
+        :param layer_height: float, height of each layer in the z direction.
+        :param alpha_value: float, alpha value for the alpha shape of every layer.
+        :param point_density: float, sampled points per mm^2 of surface.
+        :param z_origin: float, z value in the STL coordinates where the first band starts. Keep it fixed for all the
+            revisions of a part so the bands line up.
+        :param processes: int, number of processes of the shared worker pool.
+        """
+        self.layer_height = layer_height
+        self.alpha_value = alpha_value
+        self.point_density = point_density
+        self.z_origin = z_origin
+        self.processes = processes
+        settings = json.dumps({'layer_height': layer_height, 'alpha_value': alpha_value,
+                               'point_density': point_density, 'z_origin': z_origin}, sort_keys=True)
+        self.cache_dir = os.path.join(cache_dir, hashlib.sha1(settings.encode()).hexdigest()[:12])
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.last_report = {}
+
+    def band_fingerprints(self, triangles: np.ndarray, keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Computes the fingerprint of every band from the keys of the triangles overlapping it. The fingerprint is an
+        order independent sum of hashes, so it does not depend on the order of the triangles in the file.
+
+        :param triangles: np.ndarray, (F, 3, 3) array of the triangle corners.
+        :param keys: np.ndarray, (F,) array of triangle keys.
+        :return: tuple, (B,) array of the band indices and (B,) array of their uint64 fingerprints.
+        """
+        z = triangles[:, :, 2]
+        first = np.floor((z.min(axis=1) - self.z_origin) / self.layer_height).astype(np.int64)
+        last = np.floor((z.max(axis=1) - self.z_origin) / self.layer_height).astype(np.int64)
+        span = last - first + 1
+
+        # One (band, triangle) pair for every band a triangle overlaps
+        face = np.repeat(np.arange(len(triangles)), span)
+        band = first[face] + np.arange(len(face)) - np.repeat(np.cumsum(span) - span, span)
+        order = np.argsort(band, kind='stable')
+        band, face = band[order], face[order]
+
+        bands, starts = np.unique(band, return_index=True)
+        with np.errstate(over='ignore'):
+            hashed = _mix(keys[face] ^ band.astype(np.uint64))
+            fingerprints = np.add.reduceat(hashed, starts) if len(starts) else np.array([], dtype=np.uint64)
+        return bands, fingerprints
+
+    def sample_points(self, triangles: np.ndarray, keys: np.ndarray, normals: np.ndarray) -> tuple[np.ndarray, ...]:
+        """
+        Samples the surface with point_density points per mm^2, every triangle with its own deterministic random
+        stream.
+
+        :return: tuple, (N, 3) array of the points sorted by z and (N, 3) array of their normals.
+        """
+        edge_1 = triangles[:, 1] - triangles[:, 0]
+        edge_2 = triangles[:, 2] - triangles[:, 0]
+        area = 0.5 * np.linalg.norm(np.cross(edge_1, edge_2), axis=1)
+        expected = self.point_density * area
+        counts = np.floor(expected + _uniform(keys ^ np.uint64(0xA5A5A5A5A5A5A5A5))).astype(np.int64)
+
+        face = np.repeat(np.arange(len(triangles)), counts)
+        index = (np.arange(len(face)) - np.repeat(np.cumsum(counts) - counts, counts)).astype(np.uint64)
+        with np.errstate(over='ignore'):
+            stream = keys[face] + np.uint64(2) * index
+        u = _uniform(stream)
+        v = _uniform(stream + np.uint64(1))
+        folded = u + v > 1.0
+        u[folded] = 1.0 - u[folded]
+        v[folded] = 1.0 - v[folded]
+        points = triangles[face, 0] + u[:, None] * edge_1[face] + v[:, None] * edge_2[face]
+
+        order = np.argsort(points[:, 2], kind='stable')
+        return points[order], normals[face][order]
+
+    def part_cache_dir(self, filepath: str) -> str:
+        """
+        :param filepath: str, path of the stl file of a part.
+        :return: str, the directory the bands of the part are cached in, the same for every revision of the file.
+        """
+        part = hashlib.sha1(os.path.realpath(filepath).encode()).hexdigest()[:12]
+        return os.path.join(self.cache_dir, part)
+
+    @staticmethod
+    def _cache_path(part_dir: str, band: int, fingerprint: np.uint64) -> str:
+        return os.path.join(part_dir, f'{band}_{int(fingerprint):016x}.npy')
+
+    def _save_band(self, path: str, contour: np.ndarray) -> None:
+        # Written next to the cache file and renamed, so an interrupted run never leaves a truncated band behind
+        with open(path + '.part', 'wb') as file:
+            np.save(file, contour)
+        os.replace(path + '.part', path)
+
+    @staticmethod
+    def _remove_outdated(part_dir: str, paths: list[str]) -> int:
+        """
+        Deletes the cached bands of a part that are not part of its current revision, i.e. the earlier contours of the
+        changed bands and the bands the part no longer reaches.
+
+        :param part_dir: str, cache directory of the part, see part_cache_dir.
+        :param paths: list, cache files of the current bands.
+        :return: int, number of deleted files.
+        """
+        current = {os.path.basename(path) for path in paths}
+        removed = 0
+        for name in os.listdir(part_dir):
+            if name.endswith(('.npy', '.npy.part')) and name not in current:
+                os.remove(os.path.join(part_dir, name))
+                removed += 1
+        return removed
+
+    def slice(self, filepath: str) -> np.ndarray:
+        """
+        Slices a revision of a part, reusing the cached contours of all the bands whose triangles did not change.
+
+        :param filepath: str, path of the stl file.
+        :return: np.ndarray, (n, 6) array of [x, y, z, nx, ny, nz] contour points, shifted to the center of the part
+            like the output of GeometryImport.
+        """
+        import trimesh
+
+        start = time.perf_counter()
+        mesh = trimesh.load_mesh(filepath)
+        triangles = np.asarray(mesh.triangles)
+        keys = triangle_keys(triangles)
+        bands, fingerprints = self.band_fingerprints(triangles, keys)
+        part_dir = self.part_cache_dir(filepath)
+        os.makedirs(part_dir, exist_ok=True)
+        paths = [self._cache_path(part_dir, band, fingerprint) for band, fingerprint in zip(bands, fingerprints)]
+        stale = [i for i, path in enumerate(paths) if not os.path.exists(path)]
+
+        if stale:
+            points, normals = self.sample_points(triangles, keys, np.asarray(mesh.face_normals))
+            bottom = self.z_origin + bands[stale] * self.layer_height
+            fresh = GeometryImport(filepath)._schedule_layers(points, normals, bottom, self.layer_height,
+                                                              self.alpha_value, self.processes)
+            for j, i in enumerate(stale):
+                self._save_band(paths[i], fresh.get(j, np.empty((0, 6))))
+
+        contours = [np.load(path) for path in paths]
+        removed = self._remove_outdated(part_dir, paths)
+        contours = np.vstack([contour for contour in contours if len(contour)] or [np.empty((0, 6))])
+        contours[:, :3] -= (triangles.reshape(-1, 3).min(axis=0) + triangles.reshape(-1, 3).max(axis=0)) / 2
+
+        self.last_report = {'bands': len(bands), 'resliced': len(stale), 'reused': len(bands) - len(stale),
+                            'removed': removed, 'seconds': time.perf_counter() - start}
+        print(f"{filepath}: re-sliced {len(stale)} of {len(bands)} bands in {self.last_report['seconds']:.2f} s")
+        return contours
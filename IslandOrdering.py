@@ -0,0 +1,165 @@
+"""
+Ordering of the islands of every layer and of the start points of the rings to shorten the air moves of the tool.
+
+The engines emit the rings of a layer in the order of the alpha shape or the section, and every ring starts wherever
+the engine started it, so the tool travels back and forth between the islands without forming. optimise_travel turns
+all the rings in the same direction and then works through the layers in order: the islands of a layer are ordered
+as an open travelling salesman path from the point where the previous layer ended (nearest neighbour tour improved by
+2-opt on the matrix of the smallest distances between the rings), and every ring starts at its point closest to where
+the tool is, so each layer starts next to the end of the previous one. The open chains of the section of an open
+surface (GeometryImport.exact_section) cannot start anywhere; they are entered at the end closer to the tool.
+"""
+
+import numpy as np
+
+from PathResampling import contour_ring_ids, ring_bounds
+
+
+def air_travel(contours: np.ndarray) -> float:
+    """
+    Measures the distance the tool travels between the end of every ring and the start of the next one, including the
+    moves down to the next layer.
+
+    :param contours: np.ndarray, (n, k) array of stacked closed rings, k >= 3.
+    :return: float, the air travel in mm.
+    """
+    starts, counts = ring_bounds(contour_ring_ids(contours))
+    ends = starts + counts - 1
+    return float(np.linalg.norm(contours[starts[1:], :3] - contours[ends[:-1], :3], axis=1).sum())
+
+
+def signed_areas(contours: np.ndarray, ring_ids: np.ndarray) -> np.ndarray:
+    """
+    :param contours: np.ndarray, (n, k) array of stacked closed rings.
+    :param ring_ids: np.ndarray, (n,) array of ring indices.
+    :return: np.ndarray, (r,) array of the signed xy area of every ring, positive if it runs counterclockwise.
+    """
+    starts, counts = ring_bounds(ring_ids)
+    cross = contours[:-1, 0] * contours[1:, 1] - contours[1:, 0] * contours[:-1, 1]
+    # The term from the last point of a ring to the first point of the next ring is not part of either ring
+    cross = np.append(cross, 0.0)
+    cross[starts + counts - 1] = 0.0
+    return np.add.reduceat(cross, starts) / 2
+
+
+def ring_distances(rings: list[np.ndarray]) -> np.ndarray:
+    """
+    Computes the smallest distance between the points of every pair of rings.
+
+    :param rings: list, (m_i, 3) arrays of the ring points.
+    :return: np.ndarray, (r, r) symmetric matrix of the distances.
+    """
+    from scipy.spatial import cKDTree
+
+    points = np.vstack(rings)
+    starts = np.cumsum([0] + [len(ring) for ring in rings[:-1]])
+    distances = np.empty((len(rings), len(rings)))
+    for j, ring in enumerate(rings):
+        nearest, _ = cKDTree(ring).query(points)
+        distances[:, j] = np.minimum.reduceat(nearest, starts)
+    return np.minimum(distances, distances.T)
+
+
+def open_tour(distances: np.ndarray, entry: np.ndarray, max_iterations: int = 1000) -> np.ndarray:
+    """
+    Finds a short open path through all nodes that starts at an entry point: a nearest neighbour tour, improved by 2-opt
+    moves until no reversal of a part of the path shortens it. Every iteration evaluates all reversals at once and
+    applies the best one.
+
+    :param distances: np.ndarray, (r, r) symmetric matrix of the distances between the nodes.
+    :param entry: np.ndarray, (r,) array of the distances from the entry point to the nodes.
+    :param max_iterations: int, largest number of 2-opt moves.
+    :return: np.ndarray, (r,) array of the nodes in the order of the path.
+    """
+    r = len(entry)
+    order = np.empty(r, dtype=int)
+    visited = np.zeros(r, dtype=bool)
+    cost = np.asarray(entry, dtype=float)
+    for step in range(r):
+        order[step] = np.argmin(np.where(visited, np.inf, cost))
+        visited[order[step]] = True
+        cost = distances[order[step]]
+    if r < 3:
+        return order
+
+    # Node r is the entry point, node r + 1 a free end at zero distance from every node, so the path is a sequence
+    # from node r to node r + 1 and a reversal of any part of it between them keeps it open
+    matrix = np.zeros((r + 2, r + 2))
+    matrix[:r, :r] = distances
+    matrix[r, :r] = matrix[:r, r] = entry
+    upper = np.triu(np.ones((r, r), dtype=bool), k=1)
+    for _ in range(max_iterations):
+        sequence = np.concatenate(([r], order, [r + 1]))
+        previous, current, following = sequence[:-2], sequence[1:-1], sequence[2:]
+        # Reversing the path from position i to position j replaces the edges into i and out of j
+        delta = (matrix[previous[:, None], current[None, :]] + matrix[current[:, None], following[None, :]] -
+                 matrix[previous, current][:, None] - matrix[current, following][None, :])
+        delta = np.where(upper, delta, np.inf)
+        i, j = np.unravel_index(np.argmin(delta), delta.shape)
+        if delta[i, j] > -1e-9:
+            break
+        order[i:j + 1] = order[i:j + 1][::-1].copy()
+    return order
+
+
+def optimise_travel(contours: np.ndarray, direction: str = 'ccw', entry=None) -> tuple[np.ndarray, dict]:
+    """
+    Orders the islands of every layer, turns the rings in one direction and picks their start points so that the
+    air moves of the tool are short. The layers keep their order.
+
+    :param contours: np.ndarray, (n, k) array of the stacked closed rings of the layers, k >= 3, e.g. from
+        GeometryImport.parallel_generate_sequential_contour_points.
+    :param direction: str, 'ccw' or 'cw' to turn every ring counterclockwise or clockwise seen from above, None to
+        keep the direction of the engine. Open chains are not turned.
+    :param entry: np.ndarray, (3,) position of the tool before the first layer. Defaults to the first point of the
+        contours.
+    :return: tuple, (n, k) array of the reordered closed rings and a dict with the air travel in mm 'before' and
+        'after' the optimisation and the distance 'saved'.
+    """
+    if direction not in ('ccw', 'cw', None):
+        raise ValueError(f"Unknown ring direction '{direction}', expected 'ccw', 'cw' or None.")
+    contours = np.asarray(contours)
+    before = air_travel(contours)
+    ids = contour_ring_ids(contours)
+    starts, counts = ring_bounds(ids)
+
+    # An open chain repeats its last point instead of the first one
+    ends = starts + counts - 1
+    is_open = (counts > 2) & np.all(contours[ends, :3] == contours[ends - 1, :3], axis=1)
+    # Rings without the repeated first point, reversed where they run the wrong way, and chains without the repeated
+    # last point
+    area = signed_areas(contours, ids)
+    reverse = np.zeros(len(starts), dtype=bool) if direction is None else (area < 0) == (direction == 'ccw')
+    reverse &= ~is_open
+    rings = []
+    for start, count, flip in zip(starts, counts, reverse):
+        ring = contours[start:start + count - 1] if count > 1 else contours[start:start + 1]
+        rings.append(np.concatenate((ring[:1], ring[:0:-1])) if flip else ring)
+
+    position = np.asarray(contours[0, :3] if entry is None else entry, dtype=float)
+    ring_z = contours[starts, 2]
+    layer_starts = np.flatnonzero(np.diff(ring_z, prepend=np.nan) != 0)
+    ordered = []
+    for lower, upper in zip(layer_starts, np.append(layer_starts[1:], len(starts))):
+        # The tool can only enter an open chain at one of its ends
+        layer = [ring[[0, -1], :3] if chain else ring[:, :3]
+                 for ring, chain in zip(rings[lower:upper], is_open[lower:upper])]
+        entry_distances = np.array([np.linalg.norm(ring - position, axis=1).min() for ring in layer])
+        order = open_tour(ring_distances(layer), entry_distances) if len(layer) > 1 else np.array([0])
+        for index in order:
+            ring = rings[lower + index]
+            distances = np.linalg.norm(ring[:, :3] - position, axis=1)
+            if not is_open[lower + index]:
+                ring = np.roll(ring, -int(np.argmin(distances)), axis=0)
+                ring = np.concatenate((ring, ring[:1]))
+            else:
+                ring = ring[::-1] if distances[-1] < distances[0] else ring
+                ring = np.concatenate((ring, ring[-1:]))
+            ordered.append(ring)
+            position = ring[-1, :3]
+
+    result = np.vstack(ordered)
+    after = air_travel(result)
+    print(f"Air travel {before:.1f} mm -> {after:.1f} mm, saved {before - after:.1f} mm over {len(starts)} rings "
+          f"in {len(layer_starts)} layers")
+    return result, {'before': before, 'after': after, 'saved': before - after}
@@ -0,0 +1,295 @@
+"""
+Numeric kernels of the slicing pipeline with two interchangeable backends: compiled (and, where the work is
+independent, parallel) Numba versions when numba is installed and plain NumPy versions otherwise. Both backends return
+the same results; Benchmark.py checks that and times every kernel on both.
+
+The backend is chosen on first use, so importing this module costs no more than importing numpy. It can be forced
+with the environment variable DSIF_KERNELS ('numba' or 'numpy') or with set_backend. The compiled kernels are cached
+on disk by numba, so the worker processes of the shared pool do not compile them again.
+
+The compiled kernels run on one thread by default: the shared pool already runs one process per core, and the thread
+pool of numba must not be started in a process that forks the pool afterwards. Multithreaded kernels can be enabled
+with DSIF_KERNELS_PARALLEL=1 or set_backend(parallel=True) for single process use, e.g. OutOfCoreSlicing.
+"""
+
+import importlib.util
+import os
+
+import numpy as np
+
+_backend = None
+_parallel = False
+_compiled = {}
+# The parallel loops of the kernels run over prange, which is replaced by numba.prange before the first compilation
+prange = range
+
+
+def available_backends() -> list[str]:
+    """
+    :return: list, the backends that can be used on this machine.
+    """
+    if importlib.util.find_spec('numba') is None:
+        return ['numpy']
+    return ['numba', 'numpy']
+
+
+def set_backend(name=None, parallel=None) -> str:
+    """
+    Selects the backend of the kernels.
+
+    :param name: str, 'numba', 'numpy' or None for numba if it is installed.
+    :param parallel: bool, whether the compiled kernels may use several threads. None reads DSIF_KERNELS_PARALLEL.
+    :return: str, the selected backend.
+    """
+    global _backend, _parallel
+    if name is None:
+        name = os.environ.get('DSIF_KERNELS') or available_backends()[0]
+    if name not in ('numba', 'numpy'):
+        raise ValueError(f"Unknown kernel backend '{name}', expected 'numba' or 'numpy'.")
+    if name not in available_backends():
+        raise ImportError('The numba backend needs numba, install it with pip install numba.')
+    if parallel is None:
+        parallel = os.environ.get('DSIF_KERNELS_PARALLEL') == '1'
+    _backend, _parallel = name, bool(parallel)
+    return _backend
+
+
+def get_backend() -> str:
+    """
+    :return: str, the backend in use, selecting the default one on first call.
+    """
+    return _backend or set_backend()
+
+
+def _kernel(name: str):
+    """
+    Returns the compiled version of a kernel, compiling it on first use.
+    """
+    global prange
+    parallel = _parallel and _NUMBA_KERNELS[name][1]
+    if (name, parallel) not in _compiled:
+        import numba
+
+        prange = numba.prange
+        _compiled[name, parallel] = numba.njit(cache=True, parallel=parallel)(_NUMBA_KERNELS[name][0])
+    return _compiled[name, parallel]
+
+
+def circumradius_filter(points: np.ndarray, simplices: np.ndarray, alpha: float, backend=None) -> np.ndarray:
+    """
+    Selects the triangles of a Delaunay triangulation whose circumradius is below 1 / alpha, the triangles that make up
+    the alpha shape. Degenerate triangles are never selected.
+
+    :param points: np.ndarray, (n, 2) array of the x and y coordinates of the points.
+    :param simplices: np.ndarray, (m, 3) array of the point indices of every triangle.
+    :param alpha: float, alpha value of the alpha shape.
+    :param backend: str, 'numba' or 'numpy' to override the selected backend.
+    :return: np.ndarray, (m,) boolean mask of the selected triangles.
+    """
+    points = np.ascontiguousarray(points, dtype=np.float64)
+    simplices = np.ascontiguousarray(simplices, dtype=np.int64)
+    if (backend or get_backend()) == 'numba':
+        return _kernel('circumradius_filter')(points, simplices, 1.0 / alpha)
+
+    triangles = points[simplices]
+    a = ((triangles[:, 0, 0] - triangles[:, 1, 0]) ** 2 + (triangles[:, 0, 1] - triangles[:, 1, 1]) ** 2) ** 0.5
+    b = ((triangles[:, 1, 0] - triangles[:, 2, 0]) ** 2 + (triangles[:, 1, 1] - triangles[:, 2, 1]) ** 2) ** 0.5
+    c = ((triangles[:, 2, 0] - triangles[:, 0, 0]) ** 2 + (triangles[:, 2, 1] - triangles[:, 0, 1]) ** 2) ** 0.5
+    s = (a + b + c) / 2.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        areas = (s * (s - a) * (s - b) * (s - c)) ** 0.5
+        circum_r = a * b * c / (4.0 * areas)
+    return circum_r < 1.0 / alpha
+
+
+def _circumradius_filter(points, simplices, max_radius):
+    selected = np.zeros(len(simplices), dtype=np.bool_)
+    for i in prange(len(simplices)):
+        p, q, r = simplices[i, 0], simplices[i, 1], simplices[i, 2]
+        a = ((points[p, 0] - points[q, 0]) ** 2 + (points[p, 1] - points[q, 1]) ** 2) ** 0.5
+        b = ((points[q, 0] - points[r, 0]) ** 2 + (points[q, 1] - points[r, 1]) ** 2) ** 0.5
+        c = ((points[r, 0] - points[p, 0]) ** 2 + (points[r, 1] - points[p, 1]) ** 2) ** 0.5
+        s = (a + b + c) / 2.0
+        heron = s * (s - a) * (s - b) * (s - c)
+        if heron > 0.0:
+            selected[i] = a * b * c / (4.0 * heron ** 0.5) < max_radius
+    return selected
+
+
+def chain_segments(start: np.ndarray, end: np.ndarray, backend=None) -> tuple[list[np.ndarray], np.ndarray]:
+    """
+    Chains directed segments into rings and open chains. Every node is expected to start at most one segment, as the
+    segments of a section through a mesh do. The chains are walked from the nodes without a predecessor first, so an
+    open chain (of an open surface) comes back whole whatever the order of its segments; the nodes left over form
+    the rings.
+
+    :param start: np.ndarray, (s,) array of the start node of every segment.
+    :param end: np.ndarray, (s,) array of the end node of every segment.
+    :param backend: str, 'numba' or 'numpy' to override the selected backend.
+    :return: tuple, list of (r,) arrays of the nodes of every ring with at least 3 nodes and every open chain with at
+        least 2 nodes, in order and without repeating the first node of a ring, and a boolean array that is True for
+        the rings and False for the open chains.
+    """
+    start = np.ascontiguousarray(start, dtype=np.int64)
+    end = np.ascontiguousarray(end, dtype=np.int64)
+    if len(start) == 0:
+        return [], np.zeros(0, dtype=bool)
+    if (backend or get_backend()) == 'numba':
+        nodes, bounds, closed = _kernel('chain_segments')(start, end)
+        chains = [nodes[lower:upper] for lower, upper in zip(bounds[:-1], bounds[1:])]
+    else:
+        n_nodes = int(max(start.max(), end.max())) + 1
+        successor = np.full(n_nodes, -1)
+        successor[start] = end
+        has_predecessor = np.zeros(n_nodes, dtype=bool)
+        has_predecessor[end] = True
+        visited = np.zeros(n_nodes, dtype=bool)
+        chains, closed = [], []
+        for node in np.concatenate((start[~has_predecessor[start]], start)):
+            if visited[node]:
+                continue
+            chain = []
+            while node >= 0 and not visited[node]:
+                visited[node] = True
+                chain.append(node)
+                node = successor[node]
+            chains.append(np.array(chain))
+            closed.append(node == chain[0])
+        closed = np.array(closed, dtype=bool)
+    keep = np.array([len(chain) >= (3 if ring else 2) for chain, ring in zip(chains, closed)], dtype=bool)
+    return [chain for chain, kept in zip(chains, keep) if kept], closed[keep]
+
+
+def _chain_segments(start, end):
+    n_nodes = max(start.max(), end.max()) + 1
+    successor = np.full(n_nodes, -1, dtype=np.int64)
+    successor[start] = end
+    has_predecessor = np.zeros(n_nodes, dtype=np.bool_)
+    has_predecessor[end] = True
+    visited = np.zeros(n_nodes, dtype=np.bool_)
+    # An open chain (of an open surface) also visits the end node of its last segment, so there can be more nodes
+    # than segments, but every node is visited once
+    nodes = np.empty(n_nodes, dtype=np.int64)
+    bounds = np.empty(len(start) + 1, dtype=np.int64)
+    closed = np.empty(len(start), dtype=np.bool_)
+    n, n_chains = 0, 0
+    bounds[0] = 0
+    # The open chains from the nodes without a predecessor first, then the rings
+    for open_pass in (True, False):
+        for first in start:
+            if visited[first] or (open_pass and has_predecessor[first]):
+                continue
+            node = first
+            while node >= 0 and not visited[node]:
+                visited[node] = True
+                nodes[n] = node
+                n += 1
+                node = successor[node]
+            closed[n_chains] = node == first
+            n_chains += 1
+            bounds[n_chains] = n
+    return nodes[:n], bounds[:n_chains + 1], closed[:n_chains]
+
+
+def nearest_neighbour_order(points: np.ndarray, first: int, backend=None) -> np.ndarray:
+    """
+    Orders points greedily: starting from a given point the path always moves to the nearest point that was not
+    visited yet. Ties go to the lowest index.
+
+    :param points: np.ndarray, (n, k) array of the coordinates.
+    :param first: int, index of the point the path starts at.
+    :param backend: str, 'numba' or 'numpy' to override the selected backend.
+    :return: np.ndarray, (n,) array of the point indices in the order of the path.
+    """
+    points = np.ascontiguousarray(points, dtype=np.float64)
+    if (backend or get_backend()) == 'numba':
+        return _kernel('nearest_neighbour_order')(points, int(first))
+
+    order = np.empty(len(points), dtype=np.int64)
+    visited = np.zeros(len(points), dtype=bool)
+    current = int(first)
+    for step in range(len(points)):
+        order[step] = current
+        visited[current] = True
+        if step == len(points) - 1:
+            break
+        distances = np.einsum('ij,ij->i', points - points[current], points - points[current])
+        distances[visited] = np.inf
+        current = int(np.argmin(distances))
+    return order
+
+
+def _nearest_neighbour_order(points, first):
+    n = len(points)
+    order = np.empty(n, dtype=np.int64)
+    visited = np.zeros(n, dtype=np.bool_)
+    current = first
+    for step in range(n):
+        order[step] = current
+        visited[current] = True
+        best, best_distance = -1, np.inf
+        for j in range(n):
+            if visited[j]:
+                continue
+            distance = 0.0
+            for k in range(points.shape[1]):
+                distance += (points[j, k] - points[current, k]) ** 2
+            if distance < best_distance:
+                best, best_distance = j, distance
+        current = best
+    return order
+
+
+def band_bounds(z_sorted: np.ndarray, z_low: np.ndarray, z_high: np.ndarray, include_low: bool = True,
+                backend=None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Selects the band of points between z_low and z_high for every layer as an index range into the points sorted by
+    z. The band always excludes z_high; it includes z_low if include_low is True.
+
+    :param z_sorted: np.ndarray, (N,) array of the sorted z values.
+    :param z_low: np.ndarray, (L,) array of the lower bounds of the bands.
+    :param z_high: np.ndarray, (L,) array of the upper bounds of the bands.
+    :param include_low: bool, whether points at z_low belong to the band.
+    :param backend: str, 'numba' or 'numpy' to override the selected backend.
+    :return: tuple, (L,) array of the start and (L,) array of the end index of every band, never below the start.
+    """
+    z_sorted = np.ascontiguousarray(z_sorted, dtype=np.float64)
+    z_low = np.ascontiguousarray(z_low, dtype=np.float64)
+    z_high = np.ascontiguousarray(z_high, dtype=np.float64)
+    if (backend or get_backend()) == 'numba':
+        return _kernel('band_bounds')(z_sorted, z_low, z_high, include_low)
+
+    lower = np.searchsorted(z_sorted, z_low, side='left' if include_low else 'right')
+    upper = np.searchsorted(z_sorted, z_high, side='left')
+    return lower, np.maximum(upper, lower)
+
+
+def _band_bounds(z_sorted, z_low, z_high, include_low):
+    lower = np.empty(len(z_low), dtype=np.int64)
+    upper = np.empty(len(z_low), dtype=np.int64)
+    for i in prange(len(z_low)):
+        # Binary searches for the first value not below z_low (above z_low) and the first value not below z_high
+        low, high = 0, len(z_sorted)
+        while low < high:
+            middle = (low + high) // 2
+            if z_sorted[middle] < z_low[i] or (not include_low and z_sorted[middle] == z_low[i]):
+                low = middle + 1
+            else:
+                high = middle
+        lower[i] = low
+        high = len(z_sorted)
+        while low < high:
+            middle = (low + high) // 2
+            if z_sorted[middle] < z_high[i]:
+                low = middle + 1
+            else:
+                high = middle
+        upper[i] = max(low, lower[i])
+    return lower, upper
+
+
+# Python source of every compiled kernel and whether its loop can run in parallel
+_NUMBA_KERNELS = {'circumradius_filter': (_circumradius_filter, True),
+                  'chain_segments': (_chain_segments, False),
+                  'nearest_neighbour_order': (_nearest_neighbour_order, False),
+                  'band_bounds': (_band_bounds, True)}
@@ -0,0 +1,110 @@
+"""
+Adaptive layer heights from the slope of the surface.
+
+A layer of height h leaves a step (cusp) of h * |nz| on a surface whose unit normal has the z component nz: steep
+walls (nz near 0) can take high layers, shallow regions need low ones. For a cusp height tolerance c the local layer
+height is therefore c / |nz|, limited to the maximum layer height.
+
+The slopes are collected once into a histogram of face area over z bins and |nz| bins. In every z bin the slope that
+covers most of the surface area sets the allowed layer height, and the layers are stacked so that no layer is higher
+than the lowest allowed height of the bins it spans.
+"""
+
+import numpy as np
+
+
+def slope_histogram(triangles: np.ndarray, face_normals: np.ndarray, z_edges: np.ndarray,
+                    slope_bins: int = 64) -> np.ndarray:
+    """
+    Distributes the area of every face evenly over the z bins it spans and bins it by the absolute z component of its
+    normal.
+
+    :param triangles: np.ndarray, (F, 3, 3) array of the triangle corners.
+    :param face_normals: np.ndarray, (F, 3) array of the unit face normals.
+    :param z_edges: np.ndarray, (Z + 1,) array of the edges of the z bins.
+    :param slope_bins: int, number of equal bins of |nz| between 0 and 1.
+    :return: np.ndarray, (Z, slope_bins) array of the face area in every z bin and slope bin.
+    """
+    n_z = len(z_edges) - 1
+    z = triangles[:, :, 2]
+    first = np.clip(np.searchsorted(z_edges, z.min(axis=1), side='right') - 1, 0, n_z - 1)
+    last = np.clip(np.searchsorted(z_edges, z.max(axis=1), side='right') - 1, 0, n_z - 1)
+    span = last - first + 1
+    area = 0.5 * np.linalg.norm(np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]),
+                                axis=1)
+    slope = np.minimum((np.abs(face_normals[:, 2]) * slope_bins).astype(int), slope_bins - 1)
+
+    # One (z bin, face) pair for every z bin a face spans
+    face = np.repeat(np.arange(len(triangles)), span)
+    z_bin = first[face] + np.arange(len(face)) - np.repeat(np.cumsum(span) - span, span)
+    histogram = np.bincount(z_bin * slope_bins + slope[face], weights=(area / span)[face],
+                            minlength=n_z * slope_bins)
+    return histogram.reshape(n_z, slope_bins)
+
+
+def adaptive_layers(triangles: np.ndarray, face_normals: np.ndarray, z_min: float, z_max: float, cusp_height: float,
+                    max_height: float, coverage: float = 0.99, resolution=None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the layer schedule between z_min and z_max for a cusp height tolerance.
+
+    :param triangles: np.ndarray, (F, 3, 3) array of the triangle corners, in the coordinates of z_min and z_max.
+    :param face_normals: np.ndarray, (F, 3) array of the unit face normals.
+    :param z_min: float, bottom of the first layer.
+    :param z_max: float, top of the part.
+    :param cusp_height: float, largest allowed step on the surface in mm. It is also the lowest layer height.
+    :param max_height: float, highest allowed layer height in mm.
+    :param coverage: float, fraction of the surface area of a z bin that has to meet the tolerance. Values below 1
+        keep single noisy faces of scanned parts from forcing low layers.
+    :param resolution: float, height of the z bins, defaults to half the cusp height.
+    :return: tuple, (L,) array of the lower z value and (L,) array of the height of every layer.
+    """
+    if not 0 < cusp_height <= max_height:
+        raise ValueError(f'The cusp height {cusp_height} has to be positive and at most the layer height '
+                         f'{max_height}.')
+    resolution = resolution or cusp_height / 2
+    z_edges = np.arange(z_min, z_max + resolution, resolution)
+    histogram = slope_histogram(np.asarray(triangles, dtype=float), np.asarray(face_normals, dtype=float), z_edges)
+
+    # Upper edge of the slope bin in which the cumulative area of every z bin reaches the coverage
+    total = histogram.sum(axis=1)
+    cumulative = np.cumsum(histogram, axis=1)
+    slope_bin = np.argmax(cumulative >= coverage * total[:, None], axis=1)
+    slope = (slope_bin + 1) / histogram.shape[1]
+    allowed = np.where(total > 0, np.minimum(cusp_height / slope, max_height), max_height)
+
+    z_values, heights = [], []
+    z = z_min
+    while z < z_max:
+        lower = min(int((z - z_min) / resolution), len(allowed) - 1)
+        height = allowed[lower]
+        # Lower the layer until it meets the tolerance of every bin it spans
+        while True:
+            upper = min(int(np.ceil((min(z + height, z_max) - z_min) / resolution)), len(allowed))
+            lowest = allowed[lower:max(upper, lower + 1)].min()
+            if lowest >= height:
+                break
+            height = lowest
+        z_values.append(z)
+        heights.append(height)
+        z += height
+    return np.array(z_values), np.array(heights)
+
+
+def mesh_layers(filepath: str, z_min: float, z_max: float, cusp_height: float, max_height: float,
+                coverage: float = 0.99) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the layer schedule of an STL part whose points were shifted so that the center of their bounding box is
+    at the origin, as GeometryImport does.
+
+    :param filepath: str, path of the stl file.
+    :param z_min: float, lowest z value of the shifted points.
+    :param z_max: float, highest z value of the shifted points.
+    :return: tuple, (L,) array of the lower z value and (L,) array of the height of every layer, see adaptive_layers.
+    """
+    import trimesh
+
+    mesh = trimesh.load_mesh(filepath)
+    triangles = np.array(mesh.triangles, dtype=np.float64)
+    triangles[:, :, 2] -= (mesh.bounds[0, 2] + mesh.bounds[1, 2]) / 2
+    return adaptive_layers(triangles, np.asarray(mesh.face_normals), z_min, z_max, cusp_height, max_height,
+                           coverage=coverage)
@@ -0,0 +1,338 @@
+"""
+Out-of-core slicing of meshes that do not fit into memory, e.g. production scans with tens of millions of triangles.
+
+The STL file is streamed in chunks and never loaded as a whole:
+
+1. a first pass finds the bounding box and the layers,
+2. a second pass counts the triangles (and their area) overlapping every layer and groups consecutive layers into
+   z buckets so that the triangles of one bucket stay within the memory limit,
+3. a third pass writes every triangle to the spill file of each bucket it overlaps,
+4. the buckets are loaded one at a time and every layer is sliced with the exact section or the alpha shape engine of
+   GeometryImport.
+
+The contours can be written layer by layer to a toolpath file, so neither the mesh nor the toolpath has to be held in
+memory at once.
+
+    python OutOfCoreSlicing.py scan.stl -o scan.tp --memory-limit 512 --layer-height 0.5
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from Geometry4 import GeometryImport
+from ToolpathFormat import append_toolpath
+
+# Record of a binary STL file: face normal, three corners and the attribute byte count
+STL_RECORD = np.dtype([('normal', '<f4', (3,)), ('corners', '<f4', (3, 3)), ('attribute', '<u2')])
+# Bytes of a triangle held while its bucket is sliced: float32 corners and float64 face normal
+_STORED_BYTES_PER_TRIANGLE = 9 * 4 + 3 * 8
+# Bytes of temporaries per triangle of the layer being sliced: float64 corners, masks, cut points and section nodes
+_BYTES_PER_TRIANGLE = 256
+# Bytes of a sampled point of the alpha shape engine (point, normal, random numbers and Delaunay input)
+_BYTES_PER_POINT = 160
+
+
+def _is_binary_stl(filepath: str) -> bool:
+    with open(filepath, 'rb') as file:
+        header = file.read(84)
+    if len(header) < 84:
+        return False
+    n_triangles = int(np.frombuffer(header[80:84], dtype='<u4')[0])
+    return os.path.getsize(filepath) == 84 + STL_RECORD.itemsize * n_triangles
+
+
+def iter_stl_triangles(filepath: str, chunk_triangles: int = 1_000_000):
+    """
+    Streams the triangles of a binary or ASCII STL file.
+
+    :param filepath: str, path of the stl file.
+    :param chunk_triangles: int, maximum number of triangles per chunk.
+    :return: generator of (n, 3, 3) float32 arrays of the triangle corners.
+    """
+    if _is_binary_stl(filepath):
+        with open(filepath, 'rb') as file:
+            file.seek(84)
+            while True:
+                records = np.fromfile(file, dtype=STL_RECORD, count=chunk_triangles)
+                if len(records) == 0:
+                    return
+                yield np.ascontiguousarray(records['corners'])
+    else:
+        values = []
+        with open(filepath, 'r', errors='replace') as file:
+            for line in file:
+                words = line.split()
+                if words and words[0] == 'vertex':
+                    values.extend(words[1:4])
+                    if len(values) >= 9 * chunk_triangles:
+                        yield np.array(values, dtype=np.float32).reshape(-1, 3, 3)
+                        values = []
+        if values:
+            yield np.array(values, dtype=np.float32).reshape(-1, 3, 3)
+
+
+def face_normals(triangles: np.ndarray) -> np.ndarray:
+    """
+    Computes the unit normals of triangles from their corner order. The normals stored in STL files are often zero or
+    stale, so they are not used.
+
+    :param triangles: np.ndarray, (F, 3, 3) array of the triangle corners.
+    :return: np.ndarray, (F, 3) array of the unit normals, zero for degenerate triangles.
+    """
+    triangles = np.asarray(triangles, dtype=np.float64)
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    return np.divide(normals, length, out=np.zeros_like(normals), where=length > 0)
+
+
+class OutOfCoreSlicer:
+
+    def __init__(self, memory_limit: int = 512 * 2 ** 20, layer_height: float = 1.0, engine: str = 'exact',
+                 alpha_value: float = 0.5, point_density: float = 10.0, spill_dir=None, seed: int = 0) -> None:
+        """
+        Initializes an OutOfCoreSlicer object.
+
+        :param memory_limit: int, maximum number of bytes used for the triangles of a bucket and the temporaries of
+            slicing one layer.
+        :param layer_height: float, height of each layer in the z direction.
+        :param engine: str, 'exact' for the exact section in the middle of every band or 'alpha' for the alpha shape of
+            the points sampled in every band. The alpha engine samples the whole area of every triangle overlapping a
+            band, which suits the small triangles of scans; use the exact engine for meshes with long facets.
+        :param alpha_value: float, alpha value for the alpha shape of every layer.
+        :param point_density: float, sampled points per mm^2 of surface for the alpha engine.
+        :param spill_dir: str, directory for the spill files, defaults to the temporary directory of the system.
+        :param seed: int, seed of the sampling of the alpha engine.
+        """
+        if engine not in ('alpha', 'exact'):
+            raise ValueError(f"Unknown slicing engine '{engine}', expected 'alpha' or 'exact'.")
+        self.memory_limit = memory_limit
+        self.layer_height = layer_height
+        self.engine = engine
+        self.alpha_value = alpha_value
+        self.point_density = point_density
+        self.spill_dir = spill_dir
+        self.seed = seed
+        # Chunks of a quarter of the limit while streaming the file
+        self.chunk_triangles = max(int(memory_limit // (4 * _BYTES_PER_TRIANGLE)), 1024)
+        self.last_report = {}
+
+    def scan(self, filepath: str) -> tuple[np.ndarray, np.ndarray, int]:
+        """
+        First pass: the bounding box and the number of triangles.
+
+        :return: tuple, (3,) minimum and (3,) maximum corner of the bounding box and the number of triangles.
+        """
+        low, high, n_triangles = np.full(3, np.inf), np.full(3, -np.inf), 0
+        for triangles in iter_stl_triangles(filepath, self.chunk_triangles):
+            corners = triangles.reshape(-1, 3)
+            low = np.minimum(low, corners.min(axis=0))
+            high = np.maximum(high, corners.max(axis=0))
+            n_triangles += len(triangles)
+        if n_triangles == 0:
+            raise ValueError(f'{filepath} contains no triangles.')
+        return low, high, n_triangles
+
+    def _layer_span(self, triangles: np.ndarray, z_values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        First and last layer that needs every triangle: the layers whose band it overlaps for the alpha engine, the
+        layers whose cutting plane it crosses for the exact engine. The last layer is below the first one for a
+        triangle that no layer needs, e.g. a flat triangle between two cutting planes.
+        """
+        z = triangles[:, :, 2]
+        if self.engine == 'exact':
+            z_planes = z_values + self.layer_height / 2
+            first = np.searchsorted(z_planes, z.min(axis=1), side='left')
+            last = np.searchsorted(z_planes, z.max(axis=1), side='right') - 1
+            return first, last
+        first = np.searchsorted(z_values, z.min(axis=1), side='right') - 1
+        last = np.searchsorted(z_values, z.max(axis=1), side='right') - 1
+        return np.clip(first, 0, len(z_values) - 1), np.clip(last, 0, len(z_values) - 1)
+
+    def layer_histogram(self, filepath: str, z_values: np.ndarray) -> tuple[np.ndarray, ...]:
+        """
+        Second pass: counts the triangles overlapping every layer, the triangles starting in every layer and the area
+        of the triangles overlapping every layer.
+
+        :return: tuple, three (L,) arrays.
+        """
+        n_layers = len(z_values)
+        overlapping, starting, area = np.zeros(n_layers + 1), np.zeros(n_layers), np.zeros(n_layers + 1)
+        for triangles in iter_stl_triangles(filepath, self.chunk_triangles):
+            first, last = self._layer_span(triangles, z_values)
+            used = last >= first
+            triangles, first, last = triangles[used].astype(np.float64), first[used], last[used]
+            face_area = 0.5 * np.linalg.norm(np.cross(triangles[:, 1] - triangles[:, 0],
+                                                      triangles[:, 2] - triangles[:, 0]), axis=1)
+            # Difference arrays: +1 at the first layer of a triangle and -1 after its last layer
+            overlapping += np.bincount(first, minlength=n_layers + 1) - np.bincount(last + 1, minlength=n_layers + 1)
+            area += (np.bincount(first, face_area, minlength=n_layers + 1) -
+                     np.bincount(last + 1, face_area, minlength=n_layers + 1))
+            starting += np.bincount(first, minlength=n_layers)
+        return np.cumsum(overlapping)[:n_layers], starting, np.cumsum(area)[:n_layers]
+
+    def plan_buckets(self, overlapping: np.ndarray, starting: np.ndarray, area: np.ndarray) -> list[tuple[int, int]]:
+        """
+        Groups consecutive layers into buckets whose triangles, together with the temporaries of slicing one of their
+        layers, fit into the memory limit. A bucket holds the triangles overlapping its first layer plus the triangles
+        starting in any of its other layers.
+
+        :return: list, (first layer, last layer + 1) of every bucket.
+        """
+        layer_bytes = overlapping * _BYTES_PER_TRIANGLE
+        if self.engine == 'alpha':
+            layer_bytes = layer_bytes + self.point_density * area * _BYTES_PER_POINT
+
+        buckets, first, held, peak = [], 0, 0.0, 0.0
+        for layer in range(len(overlapping)):
+            if overlapping[layer] * _STORED_BYTES_PER_TRIANGLE + layer_bytes[layer] > self.memory_limit:
+                hint = ' or use the exact engine' if self.engine == 'alpha' else ''
+                raise MemoryError(f'Layer {layer} alone needs more than the memory limit of '
+                                  f'{self.memory_limit / 2 ** 20:.1f} MiB, raise the limit{hint}.')
+            added = (overlapping[layer] if layer == first else starting[layer]) * _STORED_BYTES_PER_TRIANGLE
+            if layer > first and held + added + max(peak, layer_bytes[layer]) > self.memory_limit:
+                buckets.append((first, layer))
+                first, held, peak = layer, 0.0, 0.0
+                added = overlapping[layer] * _STORED_BYTES_PER_TRIANGLE
+            held += added
+            peak = max(peak, layer_bytes[layer])
+        buckets.append((first, len(overlapping)))
+        return buckets
+
+    def partition(self, filepath: str, z_values: np.ndarray, buckets: list, directory: str) -> list[str]:
+        """
+        Third pass: writes every triangle to the spill file of each bucket it overlaps.
+
+        :return: list, path of the spill file of every bucket.
+        """
+        paths = [os.path.join(directory, f'bucket_{i}.f32') for i in range(len(buckets))]
+        for path in paths:
+            open(path, 'wb').close()
+        bucket_of_layer = np.zeros(len(z_values), dtype=int)
+        for i, (first, stop) in enumerate(buckets):
+            bucket_of_layer[first:stop] = i
+
+        for triangles in iter_stl_triangles(filepath, self.chunk_triangles):
+            first, last = self._layer_span(triangles, z_values)
+            used = last >= first
+            triangles = triangles[used]
+            first, last = bucket_of_layer[first[used]], bucket_of_layer[last[used]]
+            span = last - first + 1
+            # One (bucket, triangle) pair for every bucket a triangle overlaps
+            face = np.repeat(np.arange(len(triangles)), span)
+            bucket = first[face] + np.arange(len(face)) - np.repeat(np.cumsum(span) - span, span)
+            order = np.argsort(bucket, kind='stable')
+            bucket, face = bucket[order], face[order]
+            targets, starts = np.unique(bucket, return_index=True)
+            for target, lower, upper in zip(targets, starts, np.append(starts[1:], len(bucket))):
+                with open(paths[target], 'ab') as file:
+                    triangles[face[lower:upper]].tofile(file)
+        return paths
+
+    def _slice_layer(self, triangles: np.ndarray, normals: np.ndarray, z_layer: float, layer: int) -> np.ndarray:
+        """
+        Slices one layer of a bucket with the selected engine.
+        """
+        z = triangles[:, :, 2]
+        if self.engine == 'exact':
+            z_plane = z_layer + self.layer_height / 2
+            crossing = (z.min(axis=1) <= z_plane) & (z.max(axis=1) >= z_plane)
+            return GeometryImport.exact_section(triangles[crossing], normals[crossing], z_plane)
+
+        overlapping = (z.min(axis=1) < z_layer + self.layer_height) & (z.max(axis=1) >= z_layer)
+        triangles, normals = triangles[overlapping].astype(np.float64), normals[overlapping]
+        edge_1 = triangles[:, 1] - triangles[:, 0]
+        edge_2 = triangles[:, 2] - triangles[:, 0]
+        rng = np.random.default_rng((self.seed, layer))
+        expected = self.point_density * 0.5 * np.linalg.norm(np.cross(edge_1, edge_2), axis=1)
+        face = np.repeat(np.arange(len(triangles)), np.floor(expected + rng.random(len(triangles))).astype(int))
+        u, v = rng.random((2, len(face)))
+        folded = u + v > 1.0
+        u[folded] = 1.0 - u[folded]
+        v[folded] = 1.0 - v[folded]
+        points = triangles[face, 0] + u[:, None] * edge_1[face] + v[:, None] * edge_2[face]
+        in_band = (points[:, 2] >= z_layer) & (points[:, 2] < z_layer + self.layer_height)
+        if np.count_nonzero(in_band) < 4:
+            return np.empty((0, 6))
+        return GeometryImport._layer_contours(points[in_band, :2], normals[face[in_band]],
+                                              z_layer + self.layer_height / 2, self.alpha_value)
+
+    def slice(self, filepath: str, output=None):
+        """
+        Slices a part bucket by bucket.
+
+        :param filepath: str, path of the stl file.
+        :param output: str, path of a toolpath file the contours are appended to layer by layer, see ToolpathFormat.
+            If None the contours are returned instead.
+        :return: np.ndarray, (n, 6) array of [x, y, z, nx, ny, nz] contour points shifted to the center of the part
+            like the output of GeometryImport, or None if an output file is given.
+        """
+        start = time.perf_counter()
+        low, high, n_triangles = self.scan(filepath)
+        middle = (low + high) / 2
+        z_values = np.arange(low[2], high[2], self.layer_height)
+        overlapping, starting, area = self.layer_histogram(filepath, z_values)
+        buckets = self.plan_buckets(overlapping, starting, area)
+        if output is not None and os.path.exists(output):
+            os.remove(output)
+
+        directory = tempfile.mkdtemp(prefix='slicing_', dir=self.spill_dir)
+        contours, peak_bytes, spilled = [], 0, 0
+        try:
+            paths = self.partition(filepath, z_values, buckets, directory)
+            for (first, stop), path in zip(buckets, paths):
+                triangles = np.fromfile(path, dtype=np.float32).reshape(-1, 3, 3)
+                os.remove(path)
+                spilled += triangles.nbytes
+                normals = face_normals(triangles)
+                layer_bytes = overlapping[first:stop] * _BYTES_PER_TRIANGLE
+                if self.engine == 'alpha':
+                    layer_bytes = layer_bytes + self.point_density * area[first:stop] * _BYTES_PER_POINT
+                peak_bytes = max(peak_bytes, triangles.nbytes + normals.nbytes + int(layer_bytes.max(initial=0)))
+                for layer in range(first, stop):
+                    contour = self._slice_layer(triangles, normals, z_values[layer], layer)
+                    if len(contour) == 0:
+                        continue
+                    contour[:, :3] -= middle
+                    if output is None:
+                        contours.append(contour)
+                    else:
+                        append_toolpath(output, contour)
+                del triangles, normals
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        self.last_report = {'triangles': n_triangles, 'layers': len(z_values), 'buckets': len(buckets),
+                            'spilled_bytes': spilled, 'peak_bytes': peak_bytes,
+                            'seconds': time.perf_counter() - start}
+        print(f"{filepath}: {n_triangles} triangles, {len(z_values)} layers in {len(buckets)} buckets, "
+              f"peak {peak_bytes / 2 ** 20:.1f} MiB of {self.memory_limit / 2 ** 20:.0f} MiB in "
+              f"{self.last_report['seconds']:.2f} s")
+        if output is not None:
+            return None
+        return np.vstack(contours) if contours else np.empty((0, 6))
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Slice an STL file that does not fit into memory.')
+    parser.add_argument('filepath', help='STL file')
+    parser.add_argument('-o', '--output', required=True, help='toolpath file')
+    parser.add_argument('--memory-limit', type=float, default=512, help='memory limit in MiB')
+    parser.add_argument('--layer-height', type=float, default=1.0)
+    parser.add_argument('--engine', choices=('exact', 'alpha'), default='exact')
+    parser.add_argument('--alpha', type=float, default=0.5)
+    parser.add_argument('--density', type=float, default=10.0, help='sampled points per mm^2 for the alpha engine')
+    parser.add_argument('--spill-dir', default=None, help='directory for the spill files')
+    args = parser.parse_args(argv)
+
+    OutOfCoreSlicer(memory_limit=int(args.memory_limit * 2 ** 20), layer_height=args.layer_height,
+                    engine=args.engine, alpha_value=args.alpha, point_density=args.density,
+                    spill_dir=args.spill_dir).slice(args.filepath, output=args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Arc length resampling of the closed contour rings generated by the GeometryImport engines. All the rings of a part are
+resampled together from one cumulative distance array instead of looping over the rings or the points.
+"""
+
+import numpy as np
+
+
+def contour_ring_ids(coordinates: np.ndarray) -> np.ndarray:
+    """
+    Assigns every point of a stacked contour array to the ring it belongs to. The engines emit closed rings, so a ring
+    ends where it comes back to its first point or where the z value of the path changes. The open chains of the
+    section of an open surface (GeometryImport.exact_section) repeat their last point instead, so a ring also ends
+    where a point repeats the one before it.
+
+    :param coordinates: np.ndarray, (n, k) array whose first three columns are the x, y and z coordinates.
+    :return: np.ndarray, (n,) array of ring indices starting at 0.
+    """
+    n = len(coordinates)
+    ids = np.zeros(n, dtype=int)
+    # Index after the last point of the layer of every point, so a ring only searches its own layer for its end
+    layer_ends = np.append(np.flatnonzero(coordinates[1:, 2] != coordinates[:-1, 2]) + 1, n)
+    start, ring = 0, 0
+    while start < n:
+        end = layer_ends[np.searchsorted(layer_ends, start, side='right')]
+        closed = np.all(coordinates[start + 1:end, :3] == coordinates[start, :3], axis=1)
+        repeated = np.all(coordinates[start + 1:end, :3] == coordinates[start:end - 1, :3], axis=1)
+        ring_end = np.flatnonzero(closed | repeated)
+        if len(ring_end):
+            end = start + 2 + ring_end[0]
+        ids[start:end] = ring
+        ring += 1
+        start = end
+    return ids
+
+
+def is_spiral_path(coordinates: np.ndarray) -> bool:
+    """
+    Tells a continuous spiral path (GeometryImport.spiral_toolpath), whose z changes at nearly every target, from a
+    layered one, whose z only changes between the layers.
+
+    :param coordinates: np.ndarray, (n, k) array whose first three columns are the x, y and z coordinates.
+    :return: bool, whether z changes at more than half of the steps of the path.
+    """
+    z = np.asarray(coordinates)[:, 2]
+    return len(z) > 2 and np.count_nonzero(z[1:] != z[:-1]) > (len(z) - 1) / 2
+
+
+def path_layers(coordinates: np.ndarray) -> np.ndarray:
+    """
+    Assigns every target of a toolpath to its layer. The layers of a layered path are the runs of equal z. The turns
+    of a spiral path (see is_spiral_path) are counted by the angle the path winds around the centre of its xy
+    coordinates: a new turn starts when the path has gone around once more, half an angular step early so that the
+    first target of a turn of spiral_toolpath is not left to the turn before it.
+
+    :param coordinates: np.ndarray, (n, k) array whose first three columns are the x, y and z coordinates.
+    :return: np.ndarray, (n,) array of the layer or turn index of every target, starting at 0 and never decreasing.
+    """
+    coordinates = np.asarray(coordinates, dtype=float)
+    if len(coordinates) == 0:
+        return np.zeros(0, dtype=int)
+    if not is_spiral_path(coordinates):
+        return np.concatenate(([0], np.cumsum(coordinates[1:, 2] != coordinates[:-1, 2])))
+
+    centred = coordinates[:, :2] - coordinates[:, :2].mean(axis=0)
+    angle = np.unwrap(np.arctan2(centred[:, 1], centred[:, 0]))
+    # Counterclockwise or clockwise, the wound angle never decreases, so a turn is only counted once
+    wound = np.maximum.accumulate(np.sign(angle[-1] - angle[0] or 1.0) * (angle - angle[0]))
+    step = np.median(np.abs(np.diff(angle)))
+    turns = np.floor((wound + step / 2) / (2 * np.pi)).astype(int)
+    # The target that closes the last turn does not start a turn of its own
+    if len(turns) > 1 and turns[-1] > turns[-2]:
+        turns[-1] = turns[-2]
+    return turns
+
+
+def ring_bounds(ring_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the first index and the number of points of every ring of a stacked contour array.
+
+    :param ring_ids: np.ndarray, (n,) array of ring indices, equal for consecutive points of the same ring.
+    :return: tuple, (r,) array of the start indices and (r,) array of the point counts of the rings.
+    """
+    ring_ids = np.asarray(ring_ids)
+    starts = np.flatnonzero(np.diff(ring_ids, prepend=ring_ids[0] - 1) != 0) if len(ring_ids) else np.array([], int)
+    counts = np.diff(np.append(starts, len(ring_ids)))
+    return starts, counts
+
+
+def ring_perimeters(coordinates: np.ndarray, ring_ids: np.ndarray) -> np.ndarray:
+    """
+    Computes the closed perimeter of every ring, including the segment from the last point back to the first one.
+
+    :param coordinates: np.ndarray, (n, k) array whose first three columns are the x, y and z coordinates.
+    :param ring_ids: np.ndarray, (n,) array of ring indices.
+    :return: np.ndarray, (r,) array of the perimeters.
+    """
+    starts, counts = ring_bounds(ring_ids)
+    segments, _ = _segments(np.asarray(coordinates, dtype=float), starts, counts)
+    return np.add.reduceat(segments, starts) if len(starts) else np.array([])
+
+
+def _segments(coordinates, starts, counts) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Lengths of the segments from every point to its successor on the same ring, wrapping around at the ring end.
+    """
+    successor = np.arange(1, len(coordinates) + 1)
+    successor[starts + counts - 1] = starts
+    segments = np.linalg.norm(coordinates[successor, :3] - coordinates[:, :3], axis=1)
+    return segments, successor
+
+
+def resample_rings(coordinates: np.ndarray, ring_ids: np.ndarray, n_points=None,
+                   spacing=None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Resamples every closed ring to points that are equally spaced by arc length, either a fixed number of points per
+    ring or as many points as fit at a given spacing. The arc length is measured on the x, y and z columns; any
+    further columns (e.g. normals) are interpolated linearly along with the coordinates. The resampled rings are open,
+    i.e. the first point is not repeated at the end.
+
+    :param coordinates: np.ndarray, (n, k) array of the stacked rings.
+    :param ring_ids: np.ndarray, (n,) array of ring indices.
+    :param n_points: int or np.ndarray, number of points of every ring or (r,) array with one count per ring.
+    :param spacing: float, distance between the points in mm, used when n_points is None. Every ring gets at least 3
+        points and the spacing is shrunk slightly so that the points close up evenly.
+    :return: tuple, (m, k) array of the resampled rings and (m,) array of their ring indices.
+    """
+    if (n_points is None) == (spacing is None):
+        raise ValueError('Give either n_points or spacing.')
+    coordinates = np.asarray(coordinates, dtype=float)
+    starts, counts = ring_bounds(ring_ids)
+    n_rings = len(starts)
+
+    segments, successor = _segments(coordinates, starts, counts)
+    point_s = np.cumsum(segments) - segments
+    ring_length = np.add.reduceat(segments, starts)
+    if n_points is None:
+        n_points = np.maximum(np.ceil(ring_length / spacing).astype(int), 3)
+    n_points = np.broadcast_to(np.asarray(n_points, dtype=int), (n_rings,))
+
+    # Arc length of every target: ring start + fraction of the ring perimeter
+    ring = np.repeat(np.arange(n_rings), n_points)
+    step = np.arange(len(ring)) - np.repeat(np.cumsum(n_points) - n_points, n_points)
+    target_s = point_s[starts][ring] + ring_length[ring] * step / n_points[ring]
+
+    segment = np.searchsorted(point_s, target_s, side='right') - 1
+    segment = np.clip(segment, starts[ring], (starts + counts - 1)[ring])
+    length = segments[segment]
+    fraction = np.divide(target_s - point_s[segment], length, out=np.zeros_like(length), where=length > 0)
+
+    resampled = coordinates[segment] + fraction[:, None] * (coordinates[successor[segment]] - coordinates[segment])
+    return resampled, ring
+
+
+def roll_rings(coordinates: np.ndarray, ring_ids: np.ndarray, first: np.ndarray) -> np.ndarray:
+    """
+    Changes the start point of every open ring without changing its direction.
+
+    :param coordinates: np.ndarray, (n, k) array of the stacked rings.
+    :param ring_ids: np.ndarray, (n,) array of ring indices.
+    :param first: np.ndarray, (r,) index within every ring of the point that becomes its first point.
+    :return: np.ndarray, (n, k) array of the rolled rings.
+    """
+    starts, counts = ring_bounds(ring_ids)
+    ring = np.repeat(np.arange(len(starts)), counts)
+    position = np.arange(len(ring)) - starts[ring]
+    return np.asarray(coordinates)[starts[ring] + (position + np.asarray(first)[ring]) % counts[ring]]
+
+
+def close_rings(coordinates: np.ndarray, ring_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Repeats the first point of every open ring at its end, the convention of the contours of the GeometryImport
+    engines.
+
+    :param coordinates: np.ndarray, (n, k) array of the stacked open rings.
+    :param ring_ids: np.ndarray, (n,) array of ring indices.
+    :return: tuple, (n + r, k) array of the closed rings and their ring indices.
+    """
+    starts, counts = ring_bounds(ring_ids)
+    ends = starts + counts
+    index = np.insert(np.arange(len(ring_ids)), ends, starts)
+    return np.asarray(coordinates)[index], np.asarray(ring_ids)[index]
+
+
+def resample_contours(contours: np.ndarray, n_points=None, spacing=None) -> np.ndarray:
+    """
+    Resamples the stacked closed contours of a GeometryImport engine, all layers and islands in one call, and keeps
+    them closed so the result can be used wherever the engine output is used.
+
+    :param contours: np.ndarray, (n, k) array of stacked closed rings.
+    :param n_points: int, number of distinct points of every ring.
+    :param spacing: float, distance between the points in mm, used when n_points is None.
+    :return: np.ndarray, (m, k) array of the resampled closed rings.
+    """
+    ids = contour_ring_ids(contours)
+    starts, counts = ring_bounds(ids)
+    # The closing point of every ring is dropped, resample_rings measures the segment back to the first point anyway
+    is_closing = np.zeros(len(ids), dtype=bool)
+    closed = np.all(contours[starts + counts - 1, :3] == contours[starts, :3], axis=1) & (counts > 1)
+    is_closing[(starts + counts - 1)[closed]] = True
+    resampled, ring = resample_rings(contours[~is_closing], ids[~is_closing], n_points=n_points, spacing=spacing)
+    resampled, _ = close_rings(resampled, ring)
+    return resampled
+
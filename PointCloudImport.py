@@ -0,0 +1,291 @@
+"""
+Import of scanned point clouds (PLY, XYZ, CSV) as the input of the slicing engines instead of the points sampled on
+an STL mesh.
+
+The file is streamed in chunks of points and every chunk is added to a voxel grid right away: the points falling into
+the same voxel are replaced by their mean, and their normals (if the file has any) by their mean direction. Only the
+occupied voxels and one chunk are held in memory, so a scan of any size is read with bounded memory. Clouds without
+normals get normals from the principal axes of the neighbourhood of every point.
+
+GeometryImport reads a point cloud through this module when its file has one of the POINT_CLOUD_EXTENSIONS (or is a
+PLY file without faces); the alpha shape and raster engines then slice the downsampled cloud.
+"""
+
+import io
+import itertools
+import os
+
+import numpy as np
+
+POINT_CLOUD_EXTENSIONS = ('.ply', '.xyz', '.csv', '.txt', '.pts')
+DEFAULT_VOXEL_SIZE = 0.2
+_PLY_TYPES = {'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1', 'short': 'i2', 'int16': 'i2',
+              'ushort': 'u2', 'uint16': 'u2', 'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+              'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8'}
+# Bytes per occupied voxel (key, point and normal sums, count) and per point of a chunk while it is merged
+_BYTES_PER_VOXEL = 64
+_BYTES_PER_CHUNK_POINT = 160
+# Offset of the voxel indices packed into 21 bits per axis
+_KEY_OFFSET = 2 ** 20
+# Other names of the normal columns in the headers of scan exports
+_NORMAL_NAMES = {'normal_x': 'nx', 'normal_y': 'ny', 'normal_z': 'nz',
+                 'normalx': 'nx', 'normaly': 'ny', 'normalz': 'nz'}
+
+
+def read_ply_header(filepath: str) -> dict:
+    """
+    Reads the header of a PLY file.
+
+    :param filepath: str, path of the PLY file.
+    :return: dict, 'format' ('ascii', 'binary_little_endian' or 'binary_big_endian'), 'elements' as a list of
+        (name, count, [(property name, type or None for lists)]) and the byte 'offset' of the data.
+    """
+    with open(filepath, 'rb') as file:
+        if file.readline().strip() != b'ply':
+            raise ValueError(f'{filepath} is not a PLY file.')
+        header = {'format': None, 'elements': []}
+        for line in file:
+            words = line.decode('ascii', errors='replace').split()
+            if not words or words[0] in ('comment', 'obj_info'):
+                continue
+            if words[0] == 'format':
+                header['format'] = words[1]
+            elif words[0] == 'element':
+                header['elements'].append((words[1], int(words[2]), []))
+            elif words[0] == 'property':
+                is_list = words[1] == 'list'
+                header['elements'][-1][2].append((words[-1], None if is_list else words[1]))
+            elif words[0] == 'end_header':
+                header['offset'] = file.tell()
+                return header
+    raise ValueError(f'{filepath} has no end_header.')
+
+
+def is_point_cloud(filepath: str) -> bool:
+    """
+    :return: bool, whether a file is read as a point cloud: an XYZ, CSV, TXT or PTS file, or a PLY file without faces.
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension not in POINT_CLOUD_EXTENSIONS:
+        return False
+    if extension == '.ply':
+        return not any(name == 'face' and count > 0 for name, count, _ in read_ply_header(filepath)['elements'])
+    return True
+
+
+def _split_columns(columns: list[str], values: np.ndarray, filepath: str) -> tuple[np.ndarray, np.ndarray]:
+    index = {_NORMAL_NAMES.get(name, name): i for i, name in enumerate(columns)}
+    if not all(name in index for name in ('x', 'y', 'z')):
+        raise ValueError(f'{filepath} has no x, y and z columns.')
+    points = values[:, [index['x'], index['y'], index['z']]].astype(np.float64)
+    normals = None
+    if all(name in index for name in ('nx', 'ny', 'nz')):
+        normals = values[:, [index['nx'], index['ny'], index['nz']]].astype(np.float64)
+    return points, normals
+
+
+def _parse_text(text: bytes, delimiter, n_columns: int, filepath: str) -> np.ndarray:
+    values = np.loadtxt(io.StringIO(text.decode('ascii', errors='replace')), delimiter=delimiter, comments='#',
+                        ndmin=2)
+    if len(values) and values.shape[1] != n_columns:
+        raise ValueError(f'{filepath}: every row needs {n_columns} numeric values.')
+    return values
+
+
+def iter_point_chunks(filepath: str, chunk_points: int = 250_000):
+    """
+    Streams the points of a point cloud file. PLY files may be ASCII or binary; XYZ, CSV, TXT and PTS files are text
+    files with one point per line, separated by spaces or commas, with an optional header line and # comments. The
+    columns are found by the names of the header (x, y, z and nx, ny, nz, in any case and order, e.g. X,Y,Z,R,G,B);
+    other columns such as colours are ignored. Without a header the first three columns are x, y and z and the file
+    has no normals, whatever follows them.
+
+    :param filepath: str, path of the point cloud file.
+    :param chunk_points: int, maximum number of points per chunk, approximate for text files, which are read in
+        blocks of as many lines as the first one.
+    :return: generator of tuples of a (n, 3) array of the points and a (n, 3) array of their normals or None.
+    """
+    if os.path.splitext(filepath)[1].lower() != '.ply':
+        with open(filepath, 'rb') as file:
+            first = file.readline()
+            while first and (not first.strip() or first.lstrip().startswith(b'#')):
+                first = file.readline()
+            if not first:
+                return
+            delimiter = ',' if b',' in first else None
+            words = first.replace(b',', b' ').split()
+            n_columns = len(words)
+            try:
+                list(map(float, words))
+                pending = first
+                columns = ['x', 'y', 'z'][:n_columns] + [f'c{i}' for i in range(3, n_columns)]
+            except ValueError:
+                # A header line names the columns, e.g. //X,Y,Z,R,G,B,Nx,Ny,Nz of CloudCompare
+                pending = b''
+                columns = [word.decode('ascii', errors='replace').lstrip('/').lower() for word in words]
+            block_bytes = chunk_points * max(len(first), 16)
+            while True:
+                block = pending + file.read(block_bytes)
+                pending = b''
+                if not block:
+                    return
+                # The block ends with a whole line
+                block += file.readline()
+                values = _parse_text(block, delimiter, n_columns, filepath)
+                if len(values):
+                    yield _split_columns(columns, values, filepath)
+
+    header = read_ply_header(filepath)
+    endian = {'binary_little_endian': '<', 'binary_big_endian': '>'}.get(header['format'])
+    with open(filepath, 'rb') as file:
+        file.seek(header['offset'])
+        for name, count, properties in header['elements']:
+            if any(kind is None for _, kind in properties) and (name == 'vertex' or endian is not None):
+                if name == 'vertex':
+                    raise ValueError(f'{filepath}: list properties of the vertices are not supported.')
+                raise ValueError(f'{filepath}: the {name} element before the vertices has list properties.')
+            if name != 'vertex':
+                # Elements in front of the vertices are skipped
+                if endian is None:
+                    for _ in range(count):
+                        file.readline()
+                else:
+                    file.seek(count * np.dtype([(p, endian + _PLY_TYPES[k]) for p, k in properties]).itemsize, 1)
+                continue
+            columns = [property_name for property_name, _ in properties]
+            if endian is None:
+                for start in range(0, count, chunk_points):
+                    lines = b''.join(itertools.islice(file, min(chunk_points, count - start)))
+                    yield _split_columns(columns, _parse_text(lines, None, len(columns), filepath), filepath)
+            else:
+                dtype = np.dtype([(p, endian + _PLY_TYPES[k]) for p, k in properties])
+                for start in range(0, count, chunk_points):
+                    records = np.fromfile(file, dtype=dtype, count=min(chunk_points, count - start))
+                    values = np.column_stack([records[column].astype(np.float64) for column in columns])
+                    yield _split_columns(columns, values, filepath)
+            return
+
+
+class VoxelGrid:
+
+    def __init__(self, voxel_size: float, memory_budget=None) -> None:
+        """
+        Accumulates points into the voxels of a regular grid, one chunk at a time.
+
+        :param voxel_size: float, edge length of the voxels in mm.
+        :param memory_budget: int, maximum number of bytes of the occupied voxels. None means no limit.
+        """
+        self.voxel_size = voxel_size
+        self.memory_budget = memory_budget
+        self.origin = None
+        self.keys = np.empty(0, dtype=np.int64)
+        self.sums = np.empty((0, 3))
+        self.normal_sums = None
+        self.counts = np.empty(0)
+        self.n_points = 0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, points: np.ndarray, normals=None) -> None:
+        """
+        Adds a chunk of points, and their normals, to the grid.
+
+        :param points: np.ndarray, (n, 3) array of the points.
+        :param normals: np.ndarray, (n, 3) array of the normals or None. Either every chunk has normals or none.
+        """
+        if len(points) == 0:
+            return
+        if self.origin is None:
+            self.origin = points.min(axis=0)
+            self.normal_sums = None if normals is None else np.empty((0, 3))
+        index = np.floor((points - self.origin) / self.voxel_size).astype(np.int64) + _KEY_OFFSET
+        if index.min() < 0 or index.max() >= 2 * _KEY_OFFSET:
+            raise ValueError(f'The cloud spans more than {2 * _KEY_OFFSET} voxels of {self.voxel_size} mm.')
+        key = (index[:, 0] << 42) | (index[:, 1] << 21) | index[:, 2]
+
+        self.keys, inverse = np.unique(np.concatenate((self.keys, key)), return_inverse=True)
+        inverse = inverse.reshape(-1)
+        n_voxels = len(self.keys)
+        self.counts = np.bincount(inverse, weights=np.concatenate((self.counts, np.ones(len(points)))),
+                                  minlength=n_voxels)
+        self.sums = np.column_stack([np.bincount(inverse, weights=np.concatenate((self.sums[:, axis], points[:, axis])),
+                                                 minlength=n_voxels) for axis in range(3)])
+        if self.normal_sums is not None:
+            unit = normals / np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+            self.normal_sums = np.column_stack([np.bincount(inverse, minlength=n_voxels, weights=np.concatenate(
+                (self.normal_sums[:, axis], unit[:, axis]))) for axis in range(3)])
+        self.n_points += len(points)
+        if self.memory_budget is not None and n_voxels * _BYTES_PER_VOXEL > self.memory_budget:
+            raise MemoryError(f'{n_voxels} voxels of {self.voxel_size} mm need more than the memory budget of '
+                              f'{self.memory_budget} bytes, use larger voxels.')
+
+    def points(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :return: tuple, (V, 3) array of the mean point of every occupied voxel and (V, 3) array of their unit mean
+            normals, None if the points had no normals.
+        """
+        points = self.sums / self.counts[:, None]
+        if self.normal_sums is None:
+            return points, None
+        return points, self.normal_sums / np.maximum(np.linalg.norm(self.normal_sums, axis=1, keepdims=True), 1e-12)
+
+
+def estimate_normals(points: np.ndarray, neighbours: int = 10, chunk_points: int = 100_000) -> np.ndarray:
+    """
+    Estimates the surface normal of every point as the direction of least variance of its nearest neighbours, all
+    eigenproblems of a chunk in one call. The normals are oriented away from the center of the cloud, so that they are
+    consistent over the part; the engines only carry them along and rot_T_ROB1 turns them all to the forming side.
+
+    :param points: np.ndarray, (n, 3) array of the points.
+    :param neighbours: int, number of neighbours of every point, itself included.
+    :param chunk_points: int, number of points whose neighbourhoods are held in memory at once.
+    :return: np.ndarray, (n, 3) array of the unit normals.
+    """
+    from scipy.spatial import cKDTree
+
+    tree = cKDTree(points)
+    neighbours = min(neighbours, len(points))
+    normals = np.empty_like(points)
+    center = points.mean(axis=0)
+    for start in range(0, len(points), chunk_points):
+        stop = min(start + chunk_points, len(points))
+        _, nearest = tree.query(points[start:stop], k=neighbours, workers=-1)
+        local = points[nearest.reshape(stop - start, -1)]
+        local = local - local.mean(axis=1, keepdims=True)
+        _, vectors = np.linalg.eigh(local.transpose(0, 2, 1) @ local)
+        normal = vectors[:, :, 0]
+        outward = np.einsum('ij,ij->i', normal, points[start:stop] - center) >= 0
+        normals[start:stop] = np.where(outward[:, None], normal, -normal)
+    return normals
+
+
+def load_point_cloud(filepath: str, voxel_size: float = DEFAULT_VOXEL_SIZE, chunk_points: int = 250_000,
+                     memory_budget=None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Streams a point cloud file through a voxel grid.
+
+    :param filepath: str, path of the point cloud file, see iter_point_chunks.
+    :param voxel_size: float, edge length of the voxels in mm, 0 or None to keep every point.
+    :param chunk_points: int, number of points read at once.
+    :param memory_budget: int, maximum number of bytes of the voxel grid and a chunk. None means no limit.
+    :return: tuple, (n, 3) array of the downsampled points and (n, 3) array of their unit normals.
+    """
+    if memory_budget is not None:
+        chunk_points = int(max(min(chunk_points, memory_budget // (4 * _BYTES_PER_CHUNK_POINT)), 1024))
+    if not voxel_size:
+        chunks = list(iter_point_chunks(filepath, chunk_points))
+        points = np.vstack([chunk for chunk, _ in chunks])
+        normals = None if any(n is None for _, n in chunks) else np.vstack([n for _, n in chunks])
+        n_read = len(points)
+    else:
+        grid = VoxelGrid(voxel_size, None if memory_budget is None else memory_budget // 2)
+        for chunk, chunk_normals in iter_point_chunks(filepath, chunk_points):
+            grid.add(chunk, chunk_normals)
+        points, normals = grid.points()
+        n_read = grid.n_points
+    if normals is None:
+        normals = estimate_normals(points)
+    print(f"Point cloud {os.path.basename(filepath)}: {n_read} points -> {len(points)} points in voxels of "
+          f"{voxel_size} mm")
+    return points, normals
@@ -0,0 +1,115 @@
+"""
+Memory lean storage of the point cloud sampled on the surface of a part.
+"""
+
+import numpy as np
+
+# Bytes of temporaries per sampled point while a chunk is drawn (random numbers, face indices, triangle corners and
+# edges and the sampled point in float64)
+_TEMPORARY_BYTES_PER_POINT = 160
+# Points sampled at once without a memory budget, about 10 MB of temporaries
+_DEFAULT_CHUNK = 65_536
+# Fewest points sampled at once under a memory budget
+_MIN_CHUNK = 1024
+
+
+class PointStore:
+
+    def __init__(self, n_points: int, dtype=np.float64, with_normals: bool = True, memory_budget=None) -> None:
+        """
+        Initializes a PointStore object holding one C-contiguous (N, 3) buffer of points and, optionally, one (N, 3)
+        buffer of their surface normals.
+
+        :param n_points: int, number of points.
+        :param dtype: numpy dtype, np.float64 or np.float32 precision of the buffers.
+        :param with_normals: bool, whether the normals of the points are stored as well.
+        :param memory_budget: int, maximum number of bytes the store may use for its buffers and the temporaries of
+            the sampling. None samples in chunks of a fixed size. Only the float32 buffers halve the memory of the
+            points themselves; the chunks keep the temporaries small for either dtype.
+        """
+        self.dtype = np.dtype(dtype)
+        self.memory_budget = memory_budget
+        buffer_bytes = n_points * 3 * self.dtype.itemsize * (2 if with_normals else 1)
+        sampling_bytes = _MIN_CHUNK * _TEMPORARY_BYTES_PER_POINT
+        if memory_budget is not None and buffer_bytes + sampling_bytes > memory_budget:
+            raise ValueError(f'{n_points} points need {buffer_bytes} bytes and {sampling_bytes} bytes for sampling, '
+                             f'the memory budget is {memory_budget}.')
+
+        self.points = np.empty((n_points, 3), dtype=self.dtype)
+        self.normals = np.empty((n_points, 3), dtype=self.dtype) if with_normals else None
+        # Estimated from the buffers and the temporaries of one chunk, not measured
+        self.estimated_peak_bytes = buffer_bytes
+
+    @property
+    def nbytes(self) -> int:
+        return self.points.nbytes + (self.normals.nbytes if self.normals is not None else 0)
+
+    def chunk_size(self) -> int:
+        """
+        Number of points that are sampled at once without exceeding the memory budget, or _DEFAULT_CHUNK without a
+        budget.
+        """
+        if self.memory_budget is None:
+            return _DEFAULT_CHUNK
+        return int(max((self.memory_budget - self.nbytes) // _TEMPORARY_BYTES_PER_POINT, _MIN_CHUNK))
+
+    @classmethod
+    def from_mesh(cls, mesh, n_points: int, dtype=np.float64, with_normals: bool = True, memory_budget=None,
+                  seed=None) -> 'PointStore':
+        """
+        Samples points uniformly (area weighted) on the surface of a mesh, chunk by chunk directly into the buffers
+        of a new store.
+
+        :param mesh: trimesh.Trimesh, the mesh of the part.
+        :param n_points: int, number of points.
+        :param dtype: numpy dtype, precision of the buffers.
+        :param with_normals: bool, whether the face normals of the points are stored as well.
+        :param memory_budget: int, maximum number of bytes, see __init__.
+        :param seed: int, seed of the random generator.
+        :return: PointStore, the sampled points.
+        """
+        store = cls(n_points, dtype=dtype, with_normals=with_normals, memory_budget=memory_budget)
+        store.sample_triangles(np.asarray(mesh.triangles), np.asarray(mesh.face_normals) if with_normals else None,
+                               np.random.default_rng(seed))
+        return store
+
+    def sample_triangles(self, triangles: np.ndarray, face_normals, rng: np.random.Generator) -> None:
+        """
+        Fills the store with points sampled uniformly on a set of triangles.
+
+        :param triangles: np.ndarray, (F, 3, 3) array of the triangle corners.
+        :param face_normals: np.ndarray, (F, 3) array of the face normals or None.
+        :param rng: np.random.Generator, random generator.
+        """
+        edge_1 = triangles[:, 1] - triangles[:, 0]
+        edge_2 = triangles[:, 2] - triangles[:, 0]
+        cumulative_area = np.cumsum(0.5 * np.linalg.norm(np.cross(edge_1, edge_2), axis=1))
+        del edge_1, edge_2
+
+        chunk = self.chunk_size()
+        self.estimated_peak_bytes = max(self.estimated_peak_bytes, self.nbytes + cumulative_area.nbytes +
+                                        min(chunk, len(self.points)) * _TEMPORARY_BYTES_PER_POINT)
+        for start in range(0, len(self.points), chunk):
+            stop = min(start + chunk, len(self.points))
+            face = np.searchsorted(cumulative_area, rng.random(stop - start) * cumulative_area[-1], side='right')
+            face = np.minimum(face, len(triangles) - 1)
+            u, v = rng.random((2, stop - start))
+            # Points of the unit square beyond the diagonal are folded back into the triangle
+            folded = u + v > 1.0
+            u[folded] = 1.0 - u[folded]
+            v[folded] = 1.0 - v[folded]
+            corner = triangles[face, 0]
+            sampled = corner + u[:, None] * (triangles[face, 1] - corner) + v[:, None] * (triangles[face, 2] - corner)
+            self.points[start:stop] = sampled
+            if self.normals is not None:
+                self.normals[start:stop] = face_normals[face]
+
+    def center(self) -> np.ndarray:
+        """
+        Shifts the points in place so that the center of their bounding box is at (0, 0, 0).
+
+        :return: np.ndarray, (3,) array of the shift that was subtracted.
+        """
+        middle = (self.points.min(axis=0) + self.points.max(axis=0)) / 2
+        self.points -= middle
+        return middle.astype(np.float64)
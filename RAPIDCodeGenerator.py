@@ -1,13 +1,20 @@
 """
 A python library to generate RAPID program from the points generated using an object of the Geometry class.
 
+
+A program can also be split into one module per layer (LayerModules). The text of every module depends only on the
+targets of its layer and its SHA-256 hash identifies it, so RWSUploader only transfers the modules that changed.
 """
+import hashlib
+
 import numpy as np
 
+from PathResampling import is_spiral_path, path_layers
+
 
 class RAPIDGenerator:
 
-    def __init__(self):
+    def __init__(self, tool='MyTool', wobj='wobj0', speed='v100', zone='z1'):
         self.ModuleStart = 'MODULE Module1 \n'
         self.RobTargets = ''
         self.ProcMain = 'PROC main() \n'
@@ -15,8 +22,187 @@ class RAPIDGenerator:
         self.EndProc = 'ENDPROC \n'
         self.PathProc = 'PROC Path() \n'
         self.EndModule = 'ENDMODULE \n'
+        self.Tool = tool
+        self.WObj = wobj
+        self.Speed = speed
+        self.Zone = zone
+
+    @staticmethod
+    def _targets(translation, rotation, configuration, externalaxes) -> tuple[np.ndarray, ...]:
+        """
+        Broadcasts the robtarget components of a path to one row per target.
+
+        :param translation: np.ndarray, (n, 3) array of the x, y and z coordinates of the path.
+        :param rotation: np.ndarray, (4,) quaternion used for every target or (n, 4) array of quaternions.
+        :param configuration: np.ndarray, (4,) or (n, 4) array of the cf1, cf4, cf6 and cfx configuration data.
+        :param externalaxes: np.ndarray, (6,) or (n, 6) array of the external axes values.
+        :return: tuple, the four components as (n, k) arrays.
+        """
+        translation = np.asarray(translation, dtype=float)[:, :3]
+        n = len(translation)
+        rotation = np.broadcast_to(np.asarray(rotation, dtype=float), (n, 4))
+        configuration = np.broadcast_to(np.asarray(configuration, dtype=int), (n, 4))
+        externalaxes = np.broadcast_to(np.asarray(externalaxes, dtype=float), (n, 6))
+        return translation, rotation, configuration, externalaxes
+
+    @staticmethod
+    def RobTarget(name, translation, rotation, configuration, externalaxes, local=False) -> str:
+        """
+        Formats a single CONST robtarget declaration, LOCAL to its module if local is True.
+        """
+        trans = ','.join(f'{v:.6f}' for v in translation)
+        rot = ','.join(f'{v:.9f}' for v in rotation)
+        conf = ','.join(str(int(v)) for v in configuration)
+        extax = ','.join(f'{v:G}' for v in externalaxes)
+        scope = 'LOCAL ' if local else ''
+        return f'    {scope}CONST robtarget {name}:=[[{trans}],[{rot}],[{conf}],[{extax}]];\n'
+
+    @staticmethod
+    def layer_stops(translation) -> np.ndarray:
+        """
+        Marks the last target of every layer, i.e. every target after which the z coordinate changes, together with
+        the last target of the path. These are the targets that are programmed as fine points. A spiral path, whose z
+        changes at every target (see PathResampling.is_spiral_path), only stops at its last target.
+
+        :param translation: np.ndarray, (n, 3) array of the x, y and z coordinates of the path.
+        :return: np.ndarray, (n,) boolean mask of the stop points.
+        """
+        translation = np.asarray(translation)
+        if is_spiral_path(translation):
+            return np.arange(len(translation)) == len(translation) - 1
+        z = translation[:, 2]
+        return np.append(z[1:] != z[:-1], True)
+
+    def _declarations(self, translation, rotation, configuration, externalaxes, local=False) -> str:
+        translation, rotation, configuration, externalaxes = self._targets(translation, rotation, configuration,
+                                                                           externalaxes)
+        return ''.join(self.RobTarget(f'Target_{i + 1}', translation[i], rotation[i], configuration[i],
+                                      externalaxes[i], local=local) for i in range(len(translation)))
+
+    def _moves(self, n, stops, tool, sync_ids=False) -> str:
+        zones = np.where(stops, 'fine', self.Zone)
+        if sync_ids:
+            return ''.join(f'        MoveL Target_{i + 1}\\ID:={i + 1}, {self.Speed}, {zones[i]}, '
+                           f'{tool}\\WObj:={self.WObj};\n' for i in range(n))
+        return ''.join(f'        MoveL Target_{i + 1}, {self.Speed}, {zones[i]}, {tool}\\WObj:={self.WObj};\n'
+                       for i in range(n))
 
     def MoveL(self, translation, rotation=np.array([0, 0, 1, 0]), configuration=np.array([0, 0, 0, 0]),
-              externalaxes=np.array([9E+09, 9E+09, 9E+09, 9E+09, 9E+09, 9E+09])):
-        print(self.ModuleStart + self.RobTargets + self.ProcMain + self.CallProc + self.EndProc + self.PathProc +
-              self.EndProc + self.EndModule)
+              externalaxes=np.array([9E+09, 9E+09, 9E+09, 9E+09, 9E+09, 9E+09]), stops=None) -> str:
+        """
+        Generates a RAPID module that moves linearly through all the targets of the path.
+
+        :param translation: np.ndarray, (n, 3) array of the x, y and z coordinates of the path.
+        :param rotation: np.ndarray, (4,) quaternion used for every target or (n, 4) array of quaternions.
+        :param configuration: np.ndarray, (4,) or (n, 4) array of configuration data.
+        :param externalaxes: np.ndarray, (6,) or (n, 6) array of external axes values.
+        :param stops: np.ndarray, (n,) boolean mask of the targets programmed as fine points. Defaults to the last
+            target of every layer, see layer_stops.
+        :return: str, the module text.
+        """
+        if stops is None:
+            stops = self.layer_stops(translation)
+        self.RobTargets = self._declarations(translation, rotation, configuration, externalaxes)
+        return (self.ModuleStart + self.RobTargets + self.ProcMain + self.CallProc + self.EndProc + self.PathProc +
+                self._moves(len(translation), stops, self.Tool) + self.EndProc + self.EndModule)
+
+    def SyncMoveL(self, master, slave, master_rotation=np.array([0, 0, 1, 0]), slave_rotation=np.array([1, 0, 0, 0]),
+                  master_configuration=np.array([0, 0, 0, 0]), slave_configuration=np.array([0, 0, 0, 0]),
+                  slave_tool=None, tasks=('T_ROB1', 'T_ROB2'), stops=None) -> dict[str, str]:
+        """
+        Generates the two RAPID modules of a double sided incremental forming path. Both tasks wait for each other,
+        switch on synchronized movement and every MoveL carries the same \\ID in both modules, so the n-th target of
+        the master is reached together with the n-th target of the slave.
+
+        :param master: np.ndarray, (n, 3) array of the path of the master robot.
+        :param slave: np.ndarray, (n, 3) array of the path of the slave robot.
+        :param master_rotation: np.ndarray, (4,) or (n, 4) quaternions of the master robot.
+        :param slave_rotation: np.ndarray, (4,) or (n, 4) quaternions of the slave robot.
+        :param master_configuration: np.ndarray, (4,) or (n, 4) configuration data of the master robot.
+        :param slave_configuration: np.ndarray, (4,) or (n, 4) configuration data of the slave robot.
+        :param slave_tool: str, tooldata of the slave robot. Defaults to the tool of the master robot.
+        :param tasks: tuple, names of the master and the slave task.
+        :param stops: np.ndarray, (n,) boolean mask of the fine points. Defaults to the last target of every layer,
+            see layer_stops.
+        :return: dict, module text of every task keyed by the task name.
+        """
+        master = np.asarray(master, dtype=float)
+        slave = np.asarray(slave, dtype=float)
+        if master.shape[0] != slave.shape[0]:
+            raise ValueError('The master and the slave path need the same number of targets to be synchronized.')
+        if stops is None:
+            stops = self.layer_stops(master)
+        externalaxes = np.array([9E+09, 9E+09, 9E+09, 9E+09, 9E+09, 9E+09])
+        task_list = ','.join(f'["{task}"]' for task in tasks)
+        sync_data = (f'    PERS tasks task_list{{{len(tasks)}}} := [{task_list}];\n'
+                     '    VAR syncident sync1;\n    VAR syncident sync2;\n    VAR syncident sync3;\n')
+
+        modules = {}
+        for task, path, rotation, configuration, tool in (
+                (tasks[0], master, master_rotation, master_configuration, self.Tool),
+                (tasks[1], slave, slave_rotation, slave_configuration, slave_tool or self.Tool)):
+            targets = self._declarations(path, rotation, configuration, externalaxes)
+            modules[task] = (self.ModuleStart + sync_data + targets + self.ProcMain + self.CallProc + self.EndProc +
+                             self.PathProc + '        WaitSyncTask sync1, task_list;\n' +
+                             '        SyncMoveOn sync2, task_list;\n' +
+                             self._moves(len(path), stops, tool, sync_ids=True) +
+                             '        SyncMoveOff sync3;\n' + self.EndProc + self.EndModule)
+        return modules
+
+    def LayerModules(self, translation, rotation=np.array([0, 0, 1, 0]), configuration=np.array([0, 0, 0, 0]),
+                     externalaxes=np.array([9E+09, 9E+09, 9E+09, 9E+09, 9E+09, 9E+09]), stops=None, layers=None,
+                     prefix='Layer', routine_prefix='Path') -> dict[str, str]:
+        """
+        Generates the RAPID program of a path as one module per layer and a main module that calls the layers in
+        order. The module of a layer declares its targets LOCAL and holds one procedure with the layer number, e.g.
+        PROC Path_001() in MODULE Layer_001 (RAPID does not allow a routine with the name of a module), so its text
+        only depends on the targets of the layer: a layer whose targets did not change gives the same module text
+        (and hash, see module_hashes) every time it is generated.
+
+        :param translation: np.ndarray, (n, 3) array of the x, y and z coordinates of the path.
+        :param rotation: np.ndarray, (4,) quaternion used for every target or (n, 4) array of quaternions.
+        :param configuration: np.ndarray, (4,) or (n, 4) array of configuration data.
+        :param externalaxes: np.ndarray, (6,) or (n, 6) array of external axes values.
+        :param stops: np.ndarray, (n,) boolean mask of the targets programmed as fine points. Defaults to the last
+            target of every layer, see layer_stops.
+        :param layers: np.ndarray, (n,) array of the layer of every target, in the order of the path. Defaults to the
+            layers of the path, or the turns of a spiral path, see PathResampling.path_layers.
+        :param prefix: str, name of the layer modules, followed by the layer number, e.g. Layer_001.
+        :param routine_prefix: str, name of the procedures of the layers, followed by the layer number, e.g. Path_001.
+            It has to differ from prefix.
+        :return: dict, module text keyed by the module name: the layer modules in the order of the path, followed by
+            the main module (named like ModuleStart).
+        """
+        if routine_prefix == prefix:
+            raise ValueError(f"The layer routines need another name than their modules, both are '{prefix}'.")
+        translation, rotation, configuration, externalaxes = self._targets(translation, rotation, configuration,
+                                                                           externalaxes)
+        if stops is None:
+            stops = self.layer_stops(translation)
+        stops = np.asarray(stops, dtype=bool)
+        if layers is None:
+            layers = path_layers(translation)
+        bounds = np.flatnonzero(np.diff(np.asarray(layers), prepend=np.nan, append=np.nan))
+        width = max(3, len(str(len(bounds) - 1)))
+
+        modules, routines = {}, []
+        for number, (lower, upper) in enumerate(zip(bounds[:-1], bounds[1:]), start=1):
+            name = f'{prefix}_{number:0{width}d}'
+            routine = f'{routine_prefix}_{number:0{width}d}'
+            modules[name] = (f'MODULE {name} \n' +
+                             self._declarations(translation[lower:upper], rotation[lower:upper],
+                                                configuration[lower:upper], externalaxes[lower:upper], local=True) +
+                             f'PROC {routine}() \n' + self._moves(upper - lower, stops[lower:upper], self.Tool) +
+                             self.EndProc + self.EndModule)
+            routines.append(routine)
+        calls = ''.join(f'    {routine}; \n' for routine in routines)
+        modules[self.ModuleStart.split()[1]] = self.ModuleStart + self.ProcMain + calls + self.EndProc + self.EndModule
+        return modules
+
+    @staticmethod
+    def module_hashes(modules: dict[str, str]) -> dict[str, str]:
+        """
+        :param modules: dict, module text keyed by the module name.
+        :return: dict, hex SHA-256 hash of the UTF-8 text of every module keyed by the module name.
+        """
+        return {name: hashlib.sha256(text.encode('utf-8')).hexdigest() for name, text in modules.items()}
@@ -0,0 +1,235 @@
+"""
+Incremental upload of RAPID modules to the robot controller over Robot Web Services (RWS).
+
+The program of a part is generated as one module per layer (RAPIDGenerator.LayerModules). The uploader keeps a JSON
+manifest of the hash of every module that is on the controller and sends a module with set-module-text, as
+ABBSocketConnect.py does, only if its hash differs from the manifest. After the operator changed the parameters of a
+few layers only those layers (and the main module, if the number of layers changed) are transferred again. Modules of
+layers that no longer exist are unloaded with unloadmod. Both requests use the query style of RWS 1.0, like
+abb_robot_client.
+
+StandInRWS is a local HTTP server that answers like the controller, records every request it receives and rejects the
+requests the controller would not know, so the uploads can be checked without a robot:
+
+    python RWSUploader.py     # uploads a generated program to the stand-in server, changes one layer, uploads again
+"""
+
+import json
+import os
+import threading
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from RAPIDCodeGenerator import RAPIDGenerator
+
+MANIFEST_FILE = 'rws_manifest.json'
+
+
+class RWSClient:
+
+    def __init__(self, base_url: str = 'http://127.0.0.1:80', username=None, password=None) -> None:
+        """
+        Minimal RWS client with the _do_post method of abb_robot_client.rws.RWS, for machines without that package.
+
+        :param base_url: str, address of the controller.
+        :param username: str, HTTP user, defaults to 'Default User'.
+        :param password: str, HTTP password, defaults to 'robotics'.
+        """
+        self.base_url = base_url
+        passwords = urllib.request.HTTPPasswordMgrWithDefaultRealm()
+        passwords.add_password(None, base_url, username or 'Default User', password or 'robotics')
+        self._opener = urllib.request.build_opener(urllib.request.HTTPDigestAuthHandler(passwords))
+
+    def _do_post(self, relative_url: str, payload=None):
+        url = '/'.join([self.base_url, relative_url])
+        url += '&json=1' if '?' in url else '?json=1'
+        data = urllib.parse.urlencode(payload or {}).encode('utf-8')
+        with self._opener.open(urllib.request.Request(url, data=data, method='POST')) as response:
+            body = response.read()
+            if response.status == 204 or not body:
+                return None
+            return json.loads(body)
+
+
+def connect(base_url: str = 'http://127.0.0.1:80', username=None, password=None):
+    """
+    Connects to a controller with abb_robot_client if it is installed and with RWSClient otherwise.
+
+    :return: object, client with a _do_post(relative_url, payload) method.
+    """
+    try:
+        from abb_robot_client.rws import RWS
+    except ImportError:
+        return RWSClient(base_url, username, password)
+    return RWS(base_url, username, password)
+
+
+class ModuleUploader:
+
+    def __init__(self, client, task: str = 'T_ROB1', manifest_path: str = MANIFEST_FILE) -> None:
+        """
+        Initializes a ModuleUploader object.
+
+        :param client: object, RWS client with a _do_post(relative_url, payload) method, see connect.
+        :param task: str, RAPID task the modules are loaded into.
+        :param manifest_path: str, JSON file of the hashes of the modules on the controller. It has to be deleted (or
+            force used) when the modules on the controller were changed by other means.
+        """
+        self.client = client
+        self.task = task
+        self.manifest_path = manifest_path
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self) -> dict:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path) as file:
+            manifest = json.load(file)
+        return manifest.get('modules', {}) if manifest.get('task') == self.task else {}
+
+    def _save_manifest(self) -> None:
+        with open(self.manifest_path + '.part', 'w') as file:
+            json.dump({'task': self.task, 'modules': self.manifest}, file, indent=1, sort_keys=True)
+        os.replace(self.manifest_path + '.part', self.manifest_path)
+
+    def changed(self, modules: dict[str, str]) -> list[str]:
+        """
+        :param modules: dict, module text keyed by the module name.
+        :return: list, names of the modules whose text differs from the manifest, in the order of modules.
+        """
+        hashes = RAPIDGenerator.module_hashes(modules)
+        return [name for name in modules if self.manifest.get(name) != hashes[name]]
+
+    def upload(self, modules: dict[str, str], force: bool = False, unload_stale: bool = True) -> dict:
+        """
+        Sends the modules that changed since the last upload. The manifest is saved after every module, so an upload
+        that fails halfway only sends the remaining modules when it is repeated.
+
+        :param modules: dict, module text keyed by the module name, e.g. from RAPIDGenerator.LayerModules.
+        :param force: bool, whether to send every module regardless of the manifest.
+        :param unload_stale: bool, whether to unload the modules of the manifest that are not in modules any more,
+            e.g. the last layers after the part was sliced into fewer layers.
+        :return: dict, the names of the 'uploaded', 'skipped' and 'unloaded' modules and the 'bytes' sent.
+        """
+        hashes = RAPIDGenerator.module_hashes(modules)
+        send = list(modules) if force else self.changed(modules)
+        report = {'uploaded': [], 'skipped': [name for name in modules if name not in send], 'unloaded': [],
+                  'bytes': 0}
+        for name in send:
+            self.client._do_post(f'rw/rapid/modules/{name}?task={self.task}&action=set-module-text',
+                                 payload={'text': modules[name]})
+            self.manifest[name] = hashes[name]
+            self._save_manifest()
+            report['uploaded'].append(name)
+            report['bytes'] += len(modules[name].encode('utf-8'))
+
+        if unload_stale:
+            for name in sorted(set(self.manifest) - set(modules)):
+                self.client._do_post(f'rw/rapid/tasks/{self.task}?action=unloadmod', payload={'module': name})
+                del self.manifest[name]
+                self._save_manifest()
+                report['unloaded'].append(name)
+        print(f"Uploaded {len(report['uploaded'])} modules ({report['bytes']} bytes), {len(report['skipped'])} "
+              f"unchanged, {len(report['unloaded'])} unloaded")
+        return report
+
+
+class StandInRWS:
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0) -> None:
+        """
+        Local HTTP server that accepts the RWS 1.0 requests of the uploader and records them: set-module-text on
+        rw/rapid/modules/{module}?task={task} with a text field and unloadmod on rw/rapid/tasks/{task} with a module
+        field are answered with 204 No Content like on the controller, any other request is recorded and rejected with
+        400 Bad Request. Use it as a context manager:
+
+            with StandInRWS() as server:
+                ModuleUploader(RWSClient(server.url)).upload(modules)
+                print(server.requests)
+
+        :param host: str, address the server listens on.
+        :param port: int, port the server listens on, 0 for a free port.
+        """
+        self.requests = []
+        self.modules = {}
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                url = urllib.parse.urlsplit(self.path)
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+                form = {key: values[0] for key, values in urllib.parse.parse_qs(body, keep_blank_values=True).items()}
+                query = {key: values[0] for key, values in urllib.parse.parse_qs(url.query).items()}
+                self.send_response(204 if stand_in.record(url.path, query, form) else 400)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f'http://{host}:{self._server.server_address[1]}'
+        self._thread = None
+
+    def record(self, path: str, query: dict, form: dict) -> bool:
+        """
+        Records a request and applies it to the modules held by the server.
+
+        :return: bool, whether the request is one of the known RWS 1.0 requests.
+        """
+        parts = path.strip('/').split('/')
+        with self._lock:
+            self.requests.append({'path': path, 'query': query, 'form': form})
+            if (len(parts) == 4 and parts[:3] == ['rw', 'rapid', 'modules'] and
+                    query.get('action') == 'set-module-text' and 'task' in query and 'text' in form):
+                self.modules[parts[3]] = form['text']
+                return True
+            if (len(parts) == 4 and parts[:3] == ['rw', 'rapid', 'tasks'] and query.get('action') == 'unloadmod'
+                    and 'module' in form):
+                self.modules.pop(form['module'], None)
+                return True
+            return False
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+def main() -> int:
+    import tempfile
+
+    # Three layers of a square path, then the second layer is moved outwards by 1 mm, then the last layer is dropped
+    square = np.array([[1, 0], [0, 1], [-1, 0], [0, -1]]) * 50.0
+    path = np.vstack([np.column_stack((square, np.full(4, z))) for z in (0.0, 0.5, 1.0)])
+    generator = RAPIDGenerator()
+    modules = generator.LayerModules(path)
+    path[4:8, :2] *= 51 / 50
+    changed = generator.LayerModules(path)
+    shorter = generator.LayerModules(path[:8])
+
+    with tempfile.TemporaryDirectory() as directory, StandInRWS() as server:
+        manifest = os.path.join(directory, MANIFEST_FILE)
+        reports = [ModuleUploader(RWSClient(server.url), manifest_path=manifest).upload(program)
+                   for program in (modules, modules, changed, shorter)]
+        received = [' '.join([request['query'].get('action', '?'), request['path'].rsplit('/', 1)[-1]] +
+                             list(request['form'].get('module', '').split())) for request in server.requests]
+        print(f"The stand-in server received {received}")
+        expected = (reports[0]['uploaded'] == list(modules) and reports[1]['uploaded'] == [] and
+                    reports[2]['uploaded'] == ['Layer_002'] and reports[3]['unloaded'] == ['Layer_003'] and
+                    server.modules == shorter)
+    print("Only the changed modules were transferred" if expected else "Unexpected transfers")
+    return 0 if expected else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
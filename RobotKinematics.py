@@ -0,0 +1,224 @@
+"""
+Closed form kinematics of the ABB IRB 4600-60/2.05 for checking whole toolpaths before they are sent to the controller.
+
+All eight arm and wrist solutions of every target are computed in one vectorized pass, checked against the joint
+limits and summarised as RAPID configuration data. A path is given one arm configuration (cfx) for all its targets, so
+the robot never changes configuration in the middle of a path, and the quadrants cf1, cf4 and cf6 follow the joint
+angles along the path. Targets that cannot be reached in that configuration and targets close to the wrist singularity
+(axis 5 near 0) are flagged.
+
+The dimensions and joint limits are those of the product specification; the zero position has the upper arm vertical
+and the forearm horizontal, axis 2 tilts the arm forward and axis 3 tilts the forearm down.
+"""
+
+import numpy as np
+
+# Link dimensions in mm: axis 2 relative to axis 1, upper arm, forearm offset, wrist center and flange
+A1, D1, A2, A3, D4, D6 = 175.0, 495.0, 900.0, 175.0, 960.0, 135.0
+JOINT_LIMITS = np.radians([[-180.0, 180.0], [-90.0, 150.0], [-180.0, 75.0], [-400.0, 400.0], [-125.0, 120.0],
+                           [-400.0, 400.0]])
+# Tool frame of MyTool as declared on the controller, see ABBSocketConnect.py: TCP in mm and quaternion [q1, q2, q3, q4]
+MY_TOOL = (np.array([31.792631019, 0.0, 229.638935148]), np.array([0.945518576, 0.0, 0.325568154, 0.0]))
+IDENTITY = (np.zeros(3), np.array([1.0, 0.0, 0.0, 0.0]))
+
+
+def quaternion_to_matrix(q: np.ndarray) -> np.ndarray:
+    """
+    Converts unit quaternions in the RAPID order [q1, q2, q3, q4] = [w, x, y, z] into rotation matrices.
+
+    :param q: np.ndarray, (4,) or (n, 4) array of quaternions.
+    :return: np.ndarray, (n, 3, 3) array of rotation matrices.
+    """
+    q = np.atleast_2d(np.asarray(q, dtype=float))
+    w, x, y, z = (q / np.linalg.norm(q, axis=1, keepdims=True)).T
+    return np.stack((np.column_stack((1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y))),
+                     np.column_stack((2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x))),
+                     np.column_stack((2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)))), axis=1)
+
+
+def _rotation(axis: int, angle: np.ndarray) -> np.ndarray:
+    """
+    (n, 3, 3) rotation matrices about the x (0), y (1) or z (2) axis.
+    """
+    angle = np.asarray(angle, dtype=float)
+    c, s = np.cos(angle), np.sin(angle)
+    matrix = np.zeros(angle.shape + (3, 3))
+    i, j = [k for k in range(3) if k != axis]
+    matrix[..., axis, axis] = 1.0
+    matrix[..., i, i] = c
+    matrix[..., j, j] = c
+    # The y rotation is the one with the sine signs swapped
+    sign = -1.0 if axis == 1 else 1.0
+    matrix[..., i, j] = -sign * s
+    matrix[..., j, i] = sign * s
+    return matrix
+
+
+def configuration_index(front: np.ndarray, in_front_of_arm: np.ndarray, axis_5_negative: np.ndarray) -> np.ndarray:
+    """
+    Numbers the arm configurations like the cfx value of the RAPID confdata: 0 to 3 with the wrist center in front of
+    axis 1, 4 to 7 behind it, then in front of or behind the lower arm and finally axis 5 positive or negative.
+    """
+    return (4 * np.logical_not(front) + 2 * np.logical_not(in_front_of_arm) +
+            np.asarray(axis_5_negative).astype(int))
+
+
+class IRB4600:
+
+    def __init__(self, tool=MY_TOOL, wobj=IDENTITY, singularity_tolerance: float = 5.0) -> None:
+        """
+        Initializes an IRB4600 object.
+
+        :param tool: tuple, TCP (3,) in mm and orientation (4,) of the tool frame relative to the flange (tool0).
+        :param wobj: tuple, origin (3,) in mm and orientation (4,) of the work object the targets are given in,
+            relative to the base of the robot. The identity is wobj0 on a robot whose base frame is the world frame.
+        :param singularity_tolerance: float, targets with |axis 5| below this angle in degrees are wrist singular.
+        """
+        self.tool = (np.asarray(tool[0], dtype=float), quaternion_to_matrix(tool[1])[0])
+        self.wobj = (np.asarray(wobj[0], dtype=float), quaternion_to_matrix(wobj[1])[0])
+        self.singularity_tolerance = np.radians(singularity_tolerance)
+
+    def forward(self, joints: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Computes the TCP poses of joint positions.
+
+        :param joints: np.ndarray, (n, 6) array of axis angles in degrees.
+        :return: tuple, (n, 3) array of TCP positions and (n, 3, 3) array of TCP orientations in the work object.
+        """
+        q = np.radians(np.atleast_2d(joints))
+        arm = _rotation(2, q[:, 0]) @ _rotation(1, q[:, 1] + q[:, 2])
+        elbow = np.column_stack((A1 + A2 * np.sin(q[:, 1]), np.zeros(len(q)), D1 + A2 * np.cos(q[:, 1])))
+        # The wrist center is A3 above and D4 ahead of axis 3 along the forearm
+        wrist = (_rotation(2, q[:, 0]) @ elbow[:, :, None])[:, :, 0] + arm @ np.array([D4, 0.0, A3])
+        # The flange frame tool0 has its z axis along the axis of joint 6
+        flange = arm @ _rotation(0, q[:, 3]) @ _rotation(1, q[:, 4]) @ _rotation(0, q[:, 5]) @ _rotation(1, np.pi / 2)
+        flange_position = wrist + D6 * flange[:, :, 2]
+
+        tcp = flange_position + flange @ self.tool[0]
+        orientation = flange @ self.tool[1]
+        position = (tcp - self.wobj[0]) @ self.wobj[1]
+        return position, self.wobj[1].T @ orientation
+
+    def inverse(self, translation: np.ndarray, rotation: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Computes all eight joint solutions of every target.
+
+        :param translation: np.ndarray, (n, 3) array of the TCP positions in the work object in mm.
+        :param rotation: np.ndarray, (4,) or (n, 4) array of TCP quaternions in the work object.
+        :return: tuple, (n, 8, 6) array of axis angles in degrees ordered by the cfx index, NaN where the target is
+            out of reach of the arm, and (n, 8) boolean array of the solutions within the joint limits.
+        """
+        translation = np.asarray(translation, dtype=float)[:, :3]
+        n = len(translation)
+        rotation = quaternion_to_matrix(np.broadcast_to(np.asarray(rotation, dtype=float), (n, 4)))
+
+        tcp_rotation = self.wobj[1] @ rotation
+        tcp = translation @ self.wobj[1].T + self.wobj[0]
+        flange = tcp_rotation @ self.tool[1].T
+        wrist = tcp - (flange @ self.tool[0]) - D6 * flange[:, :, 2]
+
+        joints = np.full((n, 8, 6), np.nan)
+        forearm = np.hypot(D4, A3)
+        forearm_angle = np.arctan2(A3, D4)
+        for back in (False, True):
+            q1 = np.arctan2(wrist[:, 1], wrist[:, 0]) + (np.pi if back else 0.0)
+            q1 = (q1 + np.pi) % (2 * np.pi) - np.pi
+            # Wrist center in the plane of the arm, relative to axis 2; the height is measured downwards
+            r = np.hypot(wrist[:, 0], wrist[:, 1]) * (-1.0 if back else 1.0) - A1
+            down = D1 - wrist[:, 2]
+            cos_elbow = (r ** 2 + down ** 2 - A2 ** 2 - forearm ** 2) / (2 * A2 * forearm)
+            with np.errstate(invalid='ignore'):
+                elbow = np.arccos(cos_elbow)
+            for elbow_sign in (1.0, -1.0):
+                delta = elbow_sign * elbow
+                beta = np.arctan2(down, r) - np.arctan2(forearm * np.sin(delta), A2 + forearm * np.cos(delta))
+                q2 = beta + np.pi / 2
+                q3 = delta + forearm_angle - np.pi / 2
+
+                arm = _rotation(2, q1) @ _rotation(1, q2 + q3)
+                wrist_rotation = np.transpose(arm, (0, 2, 1)) @ flange @ _rotation(1, -np.pi / 2)
+                m = wrist_rotation
+                for negative in (False, True):
+                    sign = -1.0 if negative else 1.0
+                    q5 = sign * np.arctan2(np.hypot(m[:, 0, 1], m[:, 0, 2]), m[:, 0, 0])
+                    q4 = np.arctan2(sign * m[:, 1, 0], -sign * m[:, 2, 0])
+                    q6 = np.arctan2(sign * m[:, 0, 1], sign * m[:, 0, 2])
+                    # A positive elbow angle keeps the wrist center in front of the lower arm
+                    index = configuration_index(not back, elbow_sign > 0, negative)
+                    joints[:, index] = np.column_stack((q1, q2, q3, q4, q5, q6))
+
+        joints = (joints + np.pi) % (2 * np.pi) - np.pi
+        within = np.all((joints >= JOINT_LIMITS[:, 0]) & (joints <= JOINT_LIMITS[:, 1]), axis=2)
+        return np.degrees(joints), within
+
+    def configure(self, translation: np.ndarray, rotation: np.ndarray, cfx=None, ring_ids=None) -> dict:
+        """
+        Selects one arm configuration for the whole path and computes the joint angles and configuration data of every
+        target. Axes 4 and 6 are unwrapped along the path and shifted by whole turns into their limits, so that they do
+        not spin around between neighbouring targets. With ring ids every ring is unwrapped and shifted on its own:
+        a tool oriented along the contour tangent turns once per ring, which over many layers would wind axes 4 and 6
+        beyond their limits, so the wrist unwinds between the rings instead.
+
+        :param translation: np.ndarray, (n, 3) array of the TCP positions in the work object in mm.
+        :param rotation: np.ndarray, (4,) or (n, 4) array of TCP quaternions in the work object.
+        :param cfx: int, arm configuration to use. Defaults to the one that reaches the most targets, the lowest
+            number on a tie.
+        :param ring_ids: np.ndarray, (n,) array of the ring of every target, see GeometryImport.ring_ids. None treats
+            the path as one continuous motion, e.g. a spiral toolpath.
+        :return: dict, 'cfx' the selected configuration, 'joints' (n, 6) axis angles in degrees, 'confdata' (n, 4)
+            array of [cf1, cf4, cf6, cfx], 'reachable' (n,) mask of the targets reachable in the configuration and
+            within the joint limits, 'singular' (n,) mask of the wrist singular targets and 'reachable_any' (n,) mask
+            of the targets that some configuration reaches.
+        """
+        joints, within = self.inverse(translation, rotation)
+        if cfx is None:
+            cfx = int(np.argmax(within.sum(axis=0)))
+        path = np.radians(joints[:, cfx])
+
+        ring_ids = np.zeros(len(path), dtype=int) if ring_ids is None else np.asarray(ring_ids)
+        for ring in np.unique(ring_ids):
+            for axis in (3, 5):
+                targets = np.flatnonzero((ring_ids == ring) & ~np.isnan(path[:, axis]))
+                if len(targets) == 0:
+                    continue
+                unwrapped = np.unwrap(path[targets, axis])
+                turns = np.arange(-2, 3) * 2 * np.pi
+                shifted = unwrapped[None, :] + turns[:, None]
+                violations = np.sum((shifted < JOINT_LIMITS[axis, 0]) | (shifted > JOINT_LIMITS[axis, 1]), axis=1)
+                best = np.lexsort((np.abs(shifted).max(axis=1), violations))[0]
+                path[targets, axis] = shifted[best]
+
+        reachable = np.all((path >= JOINT_LIMITS[:, 0]) & (path <= JOINT_LIMITS[:, 1]), axis=1)
+        singular = np.abs(np.nan_to_num(path[:, 4], nan=np.inf)) < self.singularity_tolerance
+        quadrants = np.floor(np.nan_to_num(path[:, [0, 3, 5]]) / (np.pi / 2)).astype(int)
+        confdata = np.column_stack((quadrants, np.full(len(path), cfx)))
+        return {'cfx': cfx, 'joints': np.degrees(path), 'confdata': confdata, 'reachable': reachable,
+                'singular': singular, 'reachable_any': within.any(axis=1)}
+
+    def check_path(self, translation: np.ndarray, rotation: np.ndarray, cfx=None, ring_ids=None) -> dict:
+        """
+        Configures a path and prints the unreachable and wrist singular stretches of targets.
+
+        :return: dict, see configure, with 'unreachable_segments' and 'singular_segments' as lists of (first, last)
+            target indices.
+        """
+        result = self.configure(translation, rotation, cfx=cfx, ring_ids=ring_ids)
+        result['unreachable_segments'] = _segments(~result['reachable'])
+        result['singular_segments'] = _segments(result['singular'])
+        n = len(result['reachable'])
+        print(f"IRB 4600 configuration cfx {result['cfx']}: {np.count_nonzero(~result['reachable'])} of {n} targets "
+              f"unreachable in {len(result['unreachable_segments'])} segments, "
+              f"{np.count_nonzero(result['singular'])} wrist singular in {len(result['singular_segments'])} segments")
+        for first, last in result['unreachable_segments'][:10]:
+            print(f"    Unreachable: targets {first + 1} to {last + 1}")
+        for first, last in result['singular_segments'][:10]:
+            print(f"    Wrist singular: targets {first + 1} to {last + 1}")
+        return result
+
+
+def _segments(mask: np.ndarray) -> list[tuple[int, int]]:
+    """
+    Runs of True values of a mask as (first, last) index pairs.
+    """
+    edges = np.diff(np.concatenate(([0], np.asarray(mask, dtype=int), [0])))
+    return list(zip(np.flatnonzero(edges == 1).tolist(), (np.flatnonzero(edges == -1) - 1).tolist()))
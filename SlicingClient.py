@@ -0,0 +1,127 @@
+"""
+Thin client of the local slicing service (SlicingService.py). It only needs the standard library and numpy, so a
+command line or GUI client starts quickly and a part the service has cached is answered in well under a second.
+
+    python SlicingClient.py FromRP.STL --layer-height 0.5
+"""
+
+import argparse
+import http.client
+import json
+import os
+import time
+import urllib.parse
+
+import numpy as np
+
+DEFAULT_URL = 'http://127.0.0.1:8765'
+
+
+class SlicingClient:
+
+    def __init__(self, url: str = DEFAULT_URL, timeout: float = 3600.0) -> None:
+        """
+        :param url: str, address of the service.
+        :param timeout: float, seconds to wait for an answer, including the slicing of a job that is streamed.
+        """
+        address = urllib.parse.urlsplit(url)
+        self.host = address.hostname
+        self.port = address.port or 80
+        self.timeout = timeout
+
+    def _request(self, method: str, path: str, body=None) -> http.client.HTTPResponse:
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        data = None if body is None else json.dumps(body).encode('utf-8')
+        connection.request(method, path, body=data, headers={'Content-Type': 'application/json'})
+        return connection.getresponse()
+
+    def _json(self, method: str, path: str, body=None) -> dict:
+        response = self._request(method, path, body)
+        result = json.loads(response.read())
+        if response.status >= 400:
+            raise RuntimeError(f"Slicing service: {result.get('error', response.status)}")
+        return result
+
+    def health(self) -> dict:
+        return self._json('GET', '/health')
+
+    def submit(self, stl: str, params=None, rapid: bool = False) -> str:
+        """
+        Queues a job on the service.
+
+        :param stl: str, path of the STL file, resolved on this machine.
+        :param params: dict, parameters overriding BatchProcessor.DEFAULT_PARAMS.
+        :param rapid: bool, whether the service also generates the RAPID module.
+        :return: str, the id of the job.
+        """
+        return self._json('POST', '/jobs', {'stl': os.path.abspath(stl), 'params': params or {},
+                                            'rapid': rapid})['id']
+
+    def status(self, job_id: str) -> dict:
+        return self._json('GET', f'/jobs/{job_id}')
+
+    def stream(self, job_id: str):
+        """
+        Yields the events of a job as the service produces them, see SlicingService.
+        """
+        response = self._request('GET', f'/jobs/{job_id}/stream')
+        if response.status >= 400:
+            raise RuntimeError(f"Slicing service: {json.loads(response.read()).get('error', response.status)}")
+        for line in response:
+            yield json.loads(line)
+
+    def slice(self, stl: str, params=None, on_event=None) -> np.ndarray:
+        """
+        Slices a part on the service and collects the streamed layers.
+
+        :param stl: str, path of the STL file.
+        :param params: dict, parameters overriding BatchProcessor.DEFAULT_PARAMS.
+        :param on_event: callable, called with every event, e.g. to show the progress or draw the layers as they come.
+        :return: np.ndarray, (n, 6) array of the targets and their surface normals.
+        """
+        layers = []
+        for event in self.stream(self.submit(stl, params)):
+            if on_event is not None:
+                on_event(event)
+            if event['event'] == 'layer':
+                layers.append(np.asarray(event['points'], dtype=float).reshape(-1, 6))
+            elif event['event'] == 'failed':
+                raise RuntimeError(f"Slicing service: {event['error']}")
+        return np.vstack(layers) if layers else np.empty((0, 6))
+
+    def rapid(self, stl: str, params=None) -> str:
+        """
+        Generates the RAPID module of a part on the service.
+
+        :return: str, the module text.
+        """
+        job_id = self.submit(stl, params, rapid=True)
+        for event in self.stream(job_id):
+            if event['event'] == 'failed':
+                raise RuntimeError(f"Slicing service: {event['error']}")
+        return self._json('GET', f'/jobs/{job_id}/rapid')['module']
+
+
+def main(argv=None) -> np.ndarray:
+    parser = argparse.ArgumentParser(description='Slice a part on the local slicing service.')
+    parser.add_argument('filepath')
+    parser.add_argument('--url', default=DEFAULT_URL)
+    parser.add_argument('--layer-height', type=float, default=0.5)
+    parser.add_argument('--alpha', type=float, default=0.2)
+    parser.add_argument('--engine', choices=('alpha', 'exact', 'raster'), default='alpha')
+    parser.add_argument('--rapid', help='write the RAPID module of the toolpath to this file')
+    args = parser.parse_args(argv)
+
+    params = {'layer_height': args.layer_height, 'alpha_value': args.alpha, 'engine': args.engine}
+    client = SlicingClient(args.url)
+    start = time.perf_counter()
+    toolpath = client.slice(args.filepath, params)
+    print(f"{len(toolpath)} targets in {len(np.unique(toolpath[:, 2]))} layers in {time.perf_counter() - start:.2f} s")
+    if args.rapid:
+        with open(args.rapid, 'w') as file:
+            file.write(client.rapid(args.filepath, params))
+    return toolpath
+
+
+if __name__ == "__main__":
+    main()
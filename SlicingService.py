@@ -0,0 +1,360 @@
+"""
+Long running local slicing service. It starts the shared worker pool once, keeps the loaded parts and the sliced
+contours in memory and accepts slicing and RAPID jobs over HTTP (standard library only), so a client does not pay for
+the interpreter start up, the imports, the STL parsing and the pool start up again, and a part that was sliced with
+the same parameters before is answered from the cache.
+
+    python SlicingService.py --port 8765 -p 4
+
+The API speaks JSON:
+
+    GET  /health                service status and cache sizes
+    POST /jobs                  {"stl": path, "params": {...}, "rapid": false} queues a job, returns {"id": ...}
+    GET  /jobs/<id>             status of a job
+    GET  /jobs/<id>/stream      chunked stream of JSON lines: "progress" while the layers are sliced, one "layer" with
+                                the rows [x, y, z, nx, ny, nz] of every layer and a final "done" or "failed"
+    GET  /jobs/<id>/rapid       the RAPID module of a job submitted with "rapid": true
+
+The parameters are those of BatchProcessor (DEFAULT_PARAMS). SlicingClient.py is the matching client. A finished job
+keeps its events for clients that connect late until max_jobs newer jobs have finished; after that its id is unknown.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from BatchProcessor import DEFAULT_PARAMS, BatchProcessor
+from Geometry4 import GeometryImport, get_worker_pool
+
+DEFAULT_PORT = 8765
+# Parameters that only change the RAPID module, not the contours
+RAPID_PARAMS = ('speed', 'zone', 'smoothing', 'wobj')
+
+
+class CachedGeometry(GeometryImport):
+
+    def __init__(self, filepath: str, number_sampling_points: int, seed: int = 0, voxel_size=None) -> None:
+        """
+        GeometryImport that samples its surface and loads its triangles only once. The sampling is seeded, so the
+        cached contours of a part are the contours a fresh run would give.
+        """
+        super().__init__(filepath, number_sampling_points=number_sampling_points, seed=seed, voxel_size=voxel_size)
+        self._samples = None
+        self._triangles = None
+        self._load_lock = threading.Lock()
+        # Held while the part is sliced, so that two jobs on the same part slice it once
+        self.slice_lock = threading.Lock()
+
+    def sample_surface(self) -> tuple[np.ndarray, np.ndarray]:
+        with self._load_lock:
+            if self._samples is None:
+                self._samples = super().sample_surface()
+            return self._samples
+
+    def load_triangles(self) -> tuple[np.ndarray, np.ndarray]:
+        with self._load_lock:
+            if self._triangles is None:
+                self._triangles = super().load_triangles()
+            return self._triangles
+
+
+class LRUCache:
+
+    def __init__(self, size: int) -> None:
+        """
+        Thread safe mapping that keeps the size most recently used entries.
+        """
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+class Job:
+
+    def __init__(self, job_id: str, stl: str, params: dict, rapid: bool) -> None:
+        """
+        State of a job and the events streamed to the clients. Every event is kept, so a client that connects late
+        receives the whole stream.
+        """
+        self.id = job_id
+        self.stl = stl
+        self.params = params
+        self.rapid = rapid
+        self.status = 'queued'
+        self.events = []
+        self.record = {}
+        self.module = None
+        self.condition = threading.Condition()
+
+    def emit(self, event: dict) -> None:
+        with self.condition:
+            self.events.append(event)
+            if event['event'] in ('done', 'failed'):
+                self.status = event['event']
+            self.condition.notify_all()
+
+    def follow(self):
+        """
+        Yields the events of the job, waiting for new ones until the job is done or failed.
+        """
+        position = 0
+        while True:
+            with self.condition:
+                while position == len(self.events):
+                    self.condition.wait()
+                events = self.events[position:]
+            position += len(events)
+            for event in events:
+                yield event
+                if event['event'] in ('done', 'failed'):
+                    return
+
+    def summary(self) -> dict:
+        return {'id': self.id, 'stl': self.stl, 'status': self.status, 'rapid': self.rapid, **self.record}
+
+
+class SlicingService:
+
+    def __init__(self, processes=None, jobs: int = 2, max_parts: int = 8, max_contours: int = 32,
+                 max_jobs: int = 64) -> None:
+        """
+        Initializes a SlicingService object and starts the shared worker pool.
+
+        :param processes: int, number of processes of the shared worker pool. Defaults to the number of cores.
+        :param jobs: int, number of jobs run at the same time, the others wait in the queue.
+        :param max_parts: int, number of loaded parts kept in memory.
+        :param max_contours: int, number of sliced toolpaths kept in memory.
+        :param max_jobs: int, number of finished jobs kept in memory with their events, the most recent ones.
+        """
+        self.processes = processes
+        _, self.pool_size = get_worker_pool(processes)
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+        self.parts = LRUCache(max_parts)
+        self.contours = LRUCache(max_contours)
+        self.jobs = {}
+        self.max_jobs = max_jobs
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, stl: str, params=None, rapid: bool = False) -> Job:
+        """
+        Queues a slicing job, and a RAPID job if rapid is True.
+
+        :param stl: str, path of the STL file on this machine.
+        :param params: dict, parameters overriding DEFAULT_PARAMS.
+        :param rapid: bool, whether to generate the RAPID module of the toolpath as well.
+        :return: Job, the queued job.
+        """
+        if not os.path.isfile(stl):
+            raise FileNotFoundError(f'{stl} does not exist.')
+        params = {**DEFAULT_PARAMS, **(params or {})}
+        with self._lock:
+            job = Job(f'job{next(self._ids)}', os.path.abspath(stl), params, rapid)
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job)
+        return job
+
+    def part(self, stl: str, params: dict) -> tuple[CachedGeometry, tuple]:
+        """
+        :return: tuple, the cached part and its cache key, which changes when the STL file changes.
+        """
+        stat = os.stat(stl)
+        key = (stl, stat.st_size, stat.st_mtime_ns, params['number_sampling_points'], params.get('seed', 0),
+               params.get('voxel_size'))
+        with self._lock:
+            g = self.parts.get(key)
+            if g is None:
+                g = CachedGeometry(stl, params['number_sampling_points'], seed=params.get('seed', 0),
+                                   voxel_size=params.get('voxel_size'))
+                self.parts.put(key, g)
+        return g, key
+
+    def _run(self, job: Job) -> None:
+        start = time.perf_counter()
+        job.status = 'running'
+        job.emit({'event': 'running'})
+        try:
+            g, part_key = self.part(job.stl, job.params)
+            slicing = {key: value for key, value in job.params.items() if key not in RAPID_PARAMS}
+            key = (part_key, json.dumps(slicing, sort_keys=True))
+            with g.slice_lock:
+                toolpath = self.contours.get(key)
+                cached = toolpath is not None
+                if not cached:
+                    g.progress = lambda done, total: job.emit({'event': 'progress', 'layers_done': done,
+                                                               'layers': total})
+                    try:
+                        toolpath = BatchProcessor.toolpath(g, job.params, self.processes)
+                    finally:
+                        g.progress = None
+                    self.contours.put(key, toolpath)
+
+            for layer, rows in enumerate(self.layers(toolpath, job.params)):
+                job.emit({'event': 'layer', 'layer': layer, 'z': float(rows[0, 2]), 'points': rows.tolist()})
+            reach = {}
+            if job.rapid:
+                _, job.module, reach = BatchProcessor.program(g, toolpath, job.params)
+            job.record = {'cached': cached, 'targets': len(toolpath), 'layers': len(np.unique(toolpath[:, 2])),
+                          'seconds': time.perf_counter() - start, **reach}
+            job.emit({'event': 'done', **job.record})
+        except Exception as error:
+            traceback.print_exc()
+            job.record = {'error': repr(error)}
+            job.emit({'event': 'failed', 'error': repr(error)})
+        print(f"[{job.status}] {job.id} {os.path.basename(job.stl)} {time.perf_counter() - start:.2f} s")
+        self._forget_finished()
+
+    def _forget_finished(self) -> None:
+        # The oldest finished jobs go first, queued and running jobs are always kept. A client that is still
+        # streaming a forgotten job holds on to it and reads its stream to the end.
+        with self._lock:
+            finished = [job_id for job_id, job in self.jobs.items() if job.status in ('done', 'failed')]
+            for job_id in finished[:max(len(finished) - self.max_jobs, 0)]:
+                del self.jobs[job_id]
+
+    @staticmethod
+    def layers(toolpath: np.ndarray, params: dict) -> list[np.ndarray]:
+        """
+        Splits a toolpath into the parts streamed as layers: the rows of every z value of a layered toolpath, the
+        turns of points_per_layer rows of a spiral one.
+        """
+        if params['mode'] == 'spiral':
+            bounds = np.arange(0, len(toolpath), params['points_per_layer'])
+        else:
+            bounds = np.flatnonzero(np.diff(toolpath[:, 2], prepend=np.nan) != 0)
+        return np.split(toolpath, bounds[1:])
+
+    def health(self) -> dict:
+        statuses = [job.status for job in list(self.jobs.values())]
+        return {'status': 'ok', 'processes': self.pool_size, 'cached_parts': len(self.parts),
+                'cached_toolpaths': len(self.contours), 'queued': statuses.count('queued'),
+                'running': statuses.count('running'), 'jobs': len(statuses)}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 for the chunked streams
+    protocol_version = 'HTTP/1.1'
+    service = None
+
+    def _send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job(self, job_id: str):
+        job = self.service.jobs.get(job_id)
+        if job is None:
+            self._send_json(404, {'error': f'unknown job {job_id}'})
+        return job
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        if parts == ['health']:
+            return self._send_json(200, self.service.health())
+        if len(parts) < 2 or parts[0] != 'jobs':
+            return self._send_json(404, {'error': f'unknown path {self.path}'})
+        job = self._job(parts[1])
+        if job is None:
+            return
+        if len(parts) == 2:
+            return self._send_json(200, job.summary())
+        if parts[2] == 'rapid':
+            if not job.rapid:
+                return self._send_json(400, {'error': f'{job.id} was submitted without "rapid"'})
+            if job.status != 'done':
+                return self._send_json(409, {'error': f'{job.id} is {job.status}'})
+            return self._send_json(200, {'id': job.id, 'module': job.module})
+        if parts[2] == 'stream':
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            try:
+                for event in job.follow():
+                    data = json.dumps(event).encode('utf-8') + b'\n'
+                    self.wfile.write(f'{len(data):X}\r\n'.encode('ascii') + data + b'\r\n')
+                    self.wfile.flush()
+                self.wfile.write(b'0\r\n\r\n')
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped reading, the job goes on
+                self.close_connection = True
+            return
+        self._send_json(404, {'error': f'unknown path {self.path}'})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            return self._send_json(404, {'error': f'unknown path {self.path}'})
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            job = self.service.submit(request['stl'], request.get('params'), bool(request.get('rapid', False)))
+        except (KeyError, ValueError, OSError) as error:
+            return self._send_json(400, {'error': repr(error)})
+        self._send_json(202, {'id': job.id, 'status': job.status})
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(host: str = '127.0.0.1', port: int = DEFAULT_PORT, processes=None, jobs: int = 2) -> ThreadingHTTPServer:
+    """
+    Creates the service and its HTTP server. Call serve_forever on the result to answer requests.
+
+    :return: ThreadingHTTPServer, the server, with the service as its service attribute.
+    """
+    handler = type('Handler', (ServiceHandler,), {'service': SlicingService(processes=processes, jobs=jobs)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.service = handler.service
+    return server
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Local slicing service with a warm worker pool and caches.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('-p', '--processes', type=int, default=None, help='processes of the shared worker pool')
+    parser.add_argument('-j', '--jobs', type=int, default=2, help='number of jobs run at the same time')
+    args = parser.parse_args(argv)
+
+    server = serve(args.host, args.port, args.processes, args.jobs)
+    print(f"Slicing service on http://{args.host}:{server.server_address[1]} with {server.service.pool_size} "
+          f"processes")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
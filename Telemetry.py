@@ -0,0 +1,306 @@
+"""
+Recording of the actual TCP path of the robot during forming and its deviation from the planned toolpath.
+
+A TelemetryCollector polls a source (the robtarget of the controller over RWS, or samples pushed from a callback)
+on an asyncio loop at a fixed rate into a preallocated RingBuffer. A second task drains the buffer in chunks into a
+toolpath file (ToolpathFormat.append_toolpath) with the columns t, x, y, z, q1, q2, q3, q4, so a recording that is
+cut off is still readable. path_deviation measures the distance of every recorded point from the nearest segment of
+the planned path.
+
+PathSimulator replays a planned path at a constant speed behind the get_robtarget method of the RWS client, so the
+whole chain can be run without a robot:
+
+    python Telemetry.py     # records a simulated square path for 2 s and prints its deviation from the plan
+"""
+
+import asyncio
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from ToolpathFormat import append_toolpath
+
+# Same fields as abb_robot_client.rws.RobTarget
+RobTarget = namedtuple('RobTarget', ['trans', 'rot', 'robconf', 'extax'])
+COLUMNS = ('t', 'x', 'y', 'z', 'q1', 'q2', 'q3', 'q4')
+
+
+class RingBuffer:
+
+    def __init__(self, capacity: int, n_columns: int = len(COLUMNS)) -> None:
+        """
+        Fixed size buffer of rows. Writing never allocates: when the reader falls behind by more than the capacity,
+        the oldest rows are overwritten and counted as dropped.
+
+        :param capacity: int, number of rows the buffer holds.
+        :param n_columns: int, number of values of every row.
+        """
+        self.data = np.zeros((capacity, n_columns))
+        self.capacity = capacity
+        self.written = 0
+        self.read = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self.written - self.read
+
+    def push(self, row) -> None:
+        self.data[self.written % self.capacity] = row
+        self.written += 1
+        if self.written - self.read > self.capacity:
+            self.dropped += self.written - self.read - self.capacity
+            self.read = self.written - self.capacity
+
+    def drain(self) -> np.ndarray:
+        """
+        :return: np.ndarray, (m, n_columns) copy of the rows written since the last drain, oldest first.
+        """
+        indices = np.arange(self.read, self.written) % self.capacity
+        self.read = self.written
+        return self.data[indices]
+
+
+class RWSPoller:
+
+    def __init__(self, client) -> None:
+        """
+        Source that reads the current robtarget of the controller. The HTTP request of the client blocks, so it runs
+        in the default executor of the loop. One request is in flight at a time, which limits the rate to the round
+        trip time of RWS.
+
+        :param client: object, RWS client with a get_robtarget() method returning trans and rot, e.g.
+            abb_robot_client.rws.RWS or PathSimulator.
+        """
+        self.client = client
+
+    async def read(self) -> np.ndarray:
+        target = await asyncio.get_running_loop().run_in_executor(None, self.client.get_robtarget)
+        return np.concatenate((np.asarray(target.trans, dtype=float), np.asarray(target.rot, dtype=float)))
+
+
+class SubscriptionSource:
+
+    def __init__(self) -> None:
+        """
+        Source fed from a callback: the callback calls put from any thread and the collector takes the latest sample
+        at every tick. It is not connected to an RWS subscription here; the TCP pose is not a subscribable RWS 1.0
+        resource, so a subscription would go through a PERS robtarget that a RAPID task keeps up to date, and its
+        handler would call put.
+        """
+        self._latest = None
+        self._loop = None
+        self._ready = None
+
+    def put(self, sample) -> None:
+        """
+        :param sample: array-like, (7,) x, y, z, q1, q2, q3, q4 of the TCP.
+        """
+        self._latest = np.asarray(sample, dtype=float)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def read(self) -> np.ndarray:
+        if self._loop is None:
+            self._loop, self._ready = asyncio.get_running_loop(), asyncio.Event()
+        while self._latest is None:
+            await self._ready.wait()
+            self._ready.clear()
+        return self._latest
+
+
+class TelemetryCollector:
+
+    def __init__(self, source, filepath: str, rate: float = 250.0, capacity: int = 65536,
+                 chunk_rows: int = 4096) -> None:
+        """
+        Initializes a TelemetryCollector object.
+
+        :param source: object, RWSPoller, SubscriptionSource or any object with an async read() returning the (7,)
+            x, y, z, q1, q2, q3, q4 of the TCP.
+        :param filepath: str, toolpath file the samples are appended to with the columns of COLUMNS.
+        :param rate: float, samples per second.
+        :param capacity: int, rows of the ring buffer.
+        :param chunk_rows: int, rows written to the file at once.
+        """
+        self.source = source
+        self.filepath = filepath
+        self.period = 1.0 / rate
+        self.buffer = RingBuffer(capacity)
+        self.chunk_rows = chunk_rows
+        self.samples = 0
+        self.late_ticks = 0
+        self._stop = None
+
+    def stop(self) -> None:
+        """
+        Ends the recording after the current sample, e.g. from a callback of the forming program.
+        """
+        if self._stop is not None:
+            self._stop.set()
+
+    async def _poll(self, duration) -> None:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        tick = start
+        while not self._stop.is_set() and (duration is None or tick - start < duration):
+            sample = await self.source.read()
+            self.buffer.push(np.concatenate(([loop.time() - start], sample)))
+            self.samples += 1
+            tick += self.period
+            delay = tick - loop.time()
+            if delay < 0:
+                # The source is slower than the rate, continue from now instead of bursting to catch up
+                self.late_ticks += 1
+                tick = loop.time()
+            await asyncio.sleep(max(delay, 0))
+        self._stop.set()
+
+    async def _write(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            stopped = self._stop.is_set()
+            if len(self.buffer) >= self.chunk_rows or (stopped and len(self.buffer)):
+                await loop.run_in_executor(None, append_toolpath, self.filepath, self.buffer.drain())
+            if stopped:
+                return
+            await asyncio.sleep(self.period * self.chunk_rows / 4)
+
+    async def run(self, duration=None) -> dict:
+        """
+        Records until the duration has passed or stop is called.
+
+        :param duration: float, seconds to record, None until stop.
+        :return: dict, number of 'samples', 'dropped' samples (the writer fell behind by more than the buffer),
+            'late_ticks' (the source was slower than the rate) and the achieved 'rate' in samples per second.
+        """
+        self._stop = asyncio.Event()
+        start = time.perf_counter()
+        await asyncio.gather(self._poll(duration), self._write())
+        seconds = time.perf_counter() - start
+        return {'samples': self.samples, 'dropped': self.buffer.dropped, 'late_ticks': self.late_ticks,
+                'rate': self.samples / seconds if seconds > 0 else 0.0}
+
+
+class PathSimulator:
+
+    def __init__(self, path: np.ndarray, speed: float = 100.0, rotation=np.array([0, 0, 1, 0]), noise: float = 0.0,
+                 seed=None, clock=time.perf_counter) -> None:
+        """
+        Replays a path at a constant TCP speed, standing in for the RWS client of the controller.
+
+        :param path: np.ndarray, (n, 3) array of the x, y and z coordinates of the path.
+        :param speed: float, TCP speed in mm/s.
+        :param rotation: np.ndarray, (4,) quaternion reported with every target.
+        :param noise: float, standard deviation of the normal noise added to the reported position in mm.
+        :param seed: int, seed of the noise.
+        :param clock: callable, returns the current time in seconds. The replay starts at the first call.
+        """
+        self.path = np.asarray(path, dtype=float)[:, :3]
+        self.arc_length = np.append(0, np.cumsum(np.linalg.norm(np.diff(self.path, axis=0), axis=1)))
+        self.speed = speed
+        self.rotation = np.asarray(rotation, dtype=float)
+        self.noise = noise
+        self._rng = np.random.default_rng(seed)
+        self._clock = clock
+        self._start = None
+
+    @property
+    def duration(self) -> float:
+        return self.arc_length[-1] / self.speed
+
+    def position(self, t) -> np.ndarray:
+        """
+        :param t: float or np.ndarray, seconds since the start of the replay.
+        :return: np.ndarray, (3,) or (m, 3) position on the path, the end of the path after the duration.
+        """
+        s = np.clip(np.asarray(t, dtype=float) * self.speed, 0, self.arc_length[-1])
+        return np.stack([np.interp(s, self.arc_length, self.path[:, axis]) for axis in range(3)], axis=-1)
+
+    def get_robtarget(self) -> RobTarget:
+        now = self._clock()
+        if self._start is None:
+            self._start = now
+        trans = self.position(now - self._start) + self._rng.normal(0, self.noise, 3) * (self.noise > 0)
+        return RobTarget(trans, self.rotation.copy(), np.zeros(4), np.full(6, 9E+09))
+
+
+def path_deviation(actual: np.ndarray, planned: np.ndarray) -> dict:
+    """
+    Measures the distance of every recorded point from the nearest segment of the planned path, including the
+    transitions between the layers. Segments longer than the typical spacing of the path (approach moves, steps to the
+    next layer) are split into pieces of at most that length first. The candidate pieces of a point are found in a
+    KD-tree of the piece midpoints: a piece of length at most L within distance d of the point has its midpoint within
+    d + L / 2, and d is at most the distance to the nearest piece end, so the search is exact and the number of
+    candidates does not depend on the longest segment.
+
+    :param actual: np.ndarray, (m, 3) array of the recorded x, y and z coordinates.
+    :param planned: np.ndarray, (n, 3) array of the planned path, n >= 2.
+    :return: dict, 'distance' (m,) of every point, 'segment' (m,) index of the nearest segment (from planned point i to
+        i + 1), 'closest' (m, 3) nearest point of the planned path and the 'max', 'mean', 'rms' and 'p95' distances.
+    """
+    from scipy.spatial import cKDTree
+
+    actual = np.asarray(actual, dtype=float)[:, :3]
+    planned = np.asarray(planned, dtype=float)[:, :3]
+    lengths = np.linalg.norm(np.diff(planned, axis=0), axis=1)
+    moving = lengths[lengths > 0]
+    spacing = float(np.median(moving)) if len(moving) else 1.0
+
+    # Pieces of every segment, each remembering the segment it belongs to
+    pieces = np.maximum(np.ceil(lengths / spacing).astype(np.int64), 1)
+    parent = np.repeat(np.arange(len(lengths)), pieces)
+    fraction = (np.arange(len(parent)) - np.repeat(np.cumsum(pieces) - pieces, pieces)) / pieces[parent]
+    start = planned[parent] + fraction[:, None] * (planned[parent + 1] - planned[parent])
+    direction = (planned[parent + 1] - planned[parent]) / pieces[parent][:, None]
+    piece_lengths = lengths[parent] / pieces[parent]
+
+    nearest_end, _ = cKDTree(np.vstack((start, planned[-1:]))).query(actual)
+    candidates = cKDTree(start + direction / 2).query_ball_point(actual, nearest_end + piece_lengths.max() / 2 + 1e-9)
+
+    counts = np.array([len(candidate) for candidate in candidates])
+    piece = np.concatenate(candidates).astype(np.int64)
+    point = np.repeat(np.arange(len(actual)), counts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.einsum('ij,ij->i', actual[point] - start[piece], direction[piece]) / piece_lengths[piece] ** 2
+    t = np.clip(np.nan_to_num(t), 0, 1)
+    closest = start[piece] + t[:, None] * direction[piece]
+    distance = np.linalg.norm(actual[point] - closest, axis=1)
+
+    # The nearest candidate of every point: sort by point, then by distance, and take the first of every point
+    order = np.lexsort((distance, point))
+    first = order[np.concatenate(([0], np.cumsum(counts)[:-1]))]
+    result = {'distance': distance[first], 'segment': parent[piece[first]], 'closest': closest[first]}
+    result.update({'max': float(result['distance'].max()), 'mean': float(result['distance'].mean()),
+                   'rms': float(np.sqrt(np.mean(result['distance'] ** 2))),
+                   'p95': float(np.percentile(result['distance'], 95))})
+    return result
+
+
+def main() -> int:
+    import os
+    import tempfile
+
+    from ToolpathFormat import read_toolpath
+
+    # Two layers of a 100 mm square, replayed at 200 mm/s with 0.05 mm noise
+    square = np.array([[50, 50], [-50, 50], [-50, -50], [50, -50], [50, 50]], dtype=float)
+    planned = np.vstack([np.column_stack((square, np.full(5, z))) for z in (0.0, -0.5)])
+    simulator = PathSimulator(planned, speed=200.0, noise=0.05, seed=0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, 'recorded.bin')
+        collector = TelemetryCollector(RWSPoller(simulator), filepath, rate=250.0, chunk_rows=128)
+        report = asyncio.run(collector.run(duration=simulator.duration))
+        recorded = read_toolpath(filepath)
+    print(f"Recorded {report['samples']} samples at {report['rate']:.0f} Hz, {report['dropped']} dropped, "
+          f"{report['late_ticks']} late ticks, {len(recorded)} rows in the file")
+
+    deviation = path_deviation(recorded[:, 1:4], planned)
+    print(f"Deviation from the planned path: max {deviation['max']:.3f} mm, mean {deviation['mean']:.3f} mm, "
+          f"rms {deviation['rms']:.3f} mm, 95 % {deviation['p95']:.3f} mm")
+    return 0 if len(recorded) == report['samples'] and deviation['max'] < 0.5 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,75 @@
+"""
+Binary file format for toolpaths and recorded robot paths.
+
+A file starts with a 16 byte header: the magic bytes b'DSIFTP1\\x00', the number of columns as little endian uint32 and
+a reserved uint32. The rest of the file are the rows as little endian float64 values, so a file can be extended chunk
+by chunk and read back with a single np.fromfile.
+"""
+
+import os
+
+import numpy as np
+
+MAGIC = b'DSIFTP1\x00'
+HEADER_SIZE = 16
+
+
+def _header(n_columns: int) -> bytes:
+    return MAGIC + np.array([n_columns, 0], dtype='<u4').tobytes()
+
+
+def write_toolpath(filepath: str, toolpath: np.ndarray) -> None:
+    """
+    Writes a toolpath to a file. The file is written next to its destination first and then moved in place, so an
+    interrupted run never leaves a half written toolpath behind.
+
+    :param filepath: str, path of the file.
+    :param toolpath: np.ndarray, (n, k) array of the toolpath.
+    """
+    toolpath = np.ascontiguousarray(toolpath, dtype='<f8')
+    temporary = filepath + '.part'
+    with open(temporary, 'wb') as file:
+        file.write(_header(toolpath.shape[1]))
+        file.write(toolpath.tobytes())
+    os.replace(temporary, filepath)
+
+
+def append_toolpath(filepath: str, chunk: np.ndarray) -> None:
+    """
+    Appends rows to a toolpath file, creating the file if it does not exist yet.
+
+    :param filepath: str, path of the file.
+    :param chunk: np.ndarray, (n, k) array of rows with the same number of columns as the file.
+    """
+    chunk = np.ascontiguousarray(chunk, dtype='<f8')
+    if os.path.exists(filepath) and os.path.getsize(filepath) >= HEADER_SIZE:
+        n_columns = _read_header(filepath)
+        if n_columns != chunk.shape[1]:
+            raise ValueError(f'{filepath} holds {n_columns} columns, the chunk has {chunk.shape[1]}.')
+        with open(filepath, 'ab') as file:
+            file.write(chunk.tobytes())
+    else:
+        with open(filepath, 'wb') as file:
+            file.write(_header(chunk.shape[1]))
+            file.write(chunk.tobytes())
+
+
+def _read_header(filepath: str) -> int:
+    with open(filepath, 'rb') as file:
+        header = file.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or header[:8] != MAGIC:
+        raise ValueError(f'{filepath} is not a toolpath file.')
+    return int(np.frombuffer(header[8:12], dtype='<u4')[0])
+
+
+def read_toolpath(filepath: str) -> np.ndarray:
+    """
+    Reads a toolpath file. A trailing incomplete row, e.g. from a recording that was cut off, is ignored.
+
+    :param filepath: str, path of the file.
+    :return: np.ndarray, (n, k) array of the toolpath.
+    """
+    n_columns = _read_header(filepath)
+    values = np.fromfile(filepath, dtype='<f8', offset=HEADER_SIZE)
+    n_rows = len(values) // n_columns if n_columns else 0
+    return values[:n_rows * n_columns].reshape(n_rows, n_columns)
@@ -2,6 +2,7 @@
 # import RAPIDCodeGenerator
 """
 
+import argparse
 import time
 
 from Geometry4 import GeometryImport
@@ -35,10 +36,43 @@ from Geometry4 import GeometryImport
 
 if __name__ == "__main__":
 
-    FILE_PATH = "FromRP.STL"
+    # For a whole directory of parts see BatchProcessor.py
+    parser = argparse.ArgumentParser(description="Slice a single part and plot its contours.")
+    parser.add_argument("filepath", nargs="?", default="FromRP.STL")
+    parser.add_argument("--layer-height", type=float, default=0.25)
+    parser.add_argument("--alpha", type=float, default=0.2)
+    parser.add_argument("--cusp-height", type=float, default=None,
+                        help="adapt the layer heights to the slope, --layer-height is then the highest layer")
+    parser.add_argument("--engine", choices=("alpha", "exact", "raster"), default="alpha",
+                        help="contour of every layer from the alpha shape, the exact section or an occupancy raster")
+    parser.add_argument("--optimise-travel", action="store_true",
+                        help="order the islands and start points of every layer to shorten the air moves")
+    parser.add_argument("--tool-radius", type=float, default=None,
+                        help="move the contours to the centre of the forming tool ball along the surface normals")
+    parser.add_argument("--tool-side", choices=("outside", "inside"), default="outside",
+                        help="side of the surface the tool is offset to, outside is the side the normals point to")
+    parser.add_argument("--voxel-size", type=float, default=None,
+                        help="voxel size in mm a scanned point cloud (PLY, XYZ, CSV) is downsampled to")
+    parser.add_argument("--service", default=None,
+                        help="slice on a running SlicingService.py at this address, e.g. http://127.0.0.1:8765")
+    args = parser.parse_args()
+
     start_time = time.time()
-    g2 = GeometryImport(filepath=FILE_PATH)
-    pointcloud = g2.parallel_generate_sequential_contour_points(layer_height=0.25, alpha_value=0.2)
+    if args.service:
+        from SlicingClient import SlicingClient
+
+        params = {"layer_height": args.layer_height, "alpha_value": args.alpha, "cusp_height": args.cusp_height,
+                  "engine": args.engine, "optimise_travel": args.optimise_travel, "tool_radius": args.tool_radius,
+                  "tool_side": args.tool_side, "voxel_size": args.voxel_size}
+        pointcloud = SlicingClient(args.service).slice(args.filepath, params)[:, :3]
+    else:
+        g2 = GeometryImport(filepath=args.filepath, voxel_size=args.voxel_size)
+        pointcloud = g2.parallel_generate_sequential_contour_points(layer_height=args.layer_height,
+                                                                    alpha_value=args.alpha,
+                                                                    cusp_height=args.cusp_height, engine=args.engine,
+                                                                    optimise_travel=args.optimise_travel,
+                                                                    tool_radius=args.tool_radius,
+                                                                    tool_side=args.tool_side)
     end_time = time.time()
     print("Total Processing Time: ", end_time-start_time)
-    g2.plot_contours(pointcloud)
+    GeometryImport.plot_contours(pointcloud)
@@ -0,0 +1,21 @@
+import numpy as np
+
+from CycleTime import estimate_cycle_time
+
+
+def _square(layers=2):
+    square = np.array([[1, 0], [0, 1], [-1, 0], [0, -1]]) * 50.0
+    return np.vstack([np.column_stack((square, np.full(4, 0.5 * layer))) for layer in range(layers)])
+
+
+def test_fine_zone_stops_at_every_target():
+    path = _square()
+    fine = estimate_cycle_time(path, zone='fine', fine_delay=0.1)
+    assert fine['fine_points'] == len(path)
+    zero = estimate_cycle_time(path, zone=0.0, fine_delay=0.1, stops=np.zeros(len(path), dtype=bool))
+    assert zero['fine_points'] == len(path)
+    np.testing.assert_allclose(fine['total'], zero['total'])
+    # Every target settles, not only the ends of the layers
+    stops = estimate_cycle_time(path, zone='fine', fine_delay=0.0)
+    np.testing.assert_allclose(fine['total'] - stops['total'], 0.1 * len(path))
+    assert estimate_cycle_time(path, zone='z1', fine_delay=0.1)['fine_points'] == 3
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+import trimesh
+
+from Geometry4 import GeometryImport
+from PathResampling import contour_ring_ids
+
+
+def _half_cylinder(radius=20.0, shift=0.0, n=40, seed=0):
+    # An open surface: half of a cylinder wall, with its triangles in random order
+    angle = np.linspace(0, np.pi, n + 1)
+    x, y = shift + radius * np.cos(angle), radius * np.sin(angle)
+    lower = np.column_stack((x, y, np.zeros(n + 1)))
+    upper = np.column_stack((x, y, np.full(n + 1, 10.0)))
+    triangles = np.concatenate([np.stack((lower[:-1], lower[1:], upper[1:]), axis=1),
+                                np.stack((lower[:-1], upper[1:], upper[:-1]), axis=1)])
+    triangles = triangles[np.random.default_rng(seed).permutation(len(triangles))]
+    edge = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    return triangles, edge / np.linalg.norm(edge, axis=1, keepdims=True)
+
+
+def _lengths(section):
+    ids = contour_ring_ids(section)
+    steps = np.linalg.norm(np.diff(section[:, :2], axis=0), axis=1)
+    return np.bincount(ids[1:][np.diff(ids) == 0], weights=steps[np.diff(ids) == 0])
+
+
+def test_open_surface_section_is_one_open_chain():
+    triangles, normals = _half_cylinder()
+    section = GeometryImport.exact_section(triangles, normals, 5.0)
+    # The chord of a polygon with 40 sides on the half circle, and no closing chord across the diameter
+    np.testing.assert_allclose(_lengths(section), [40 * 2 * 20.0 * np.sin(np.pi / 80)])
+    np.testing.assert_array_equal(section[-1], section[-2])
+    assert np.abs(section[0, 0]) == 20.0
+
+
+def test_open_chains_and_rings_stay_apart():
+    first, first_normals = _half_cylinder()
+    second, second_normals = _half_cylinder(radius=10.0, shift=100.0, seed=1)
+    box = trimesh.creation.box((10, 10, 10))
+    box.apply_translation((-100, 0, 5))
+    triangles = np.concatenate((first, second, box.triangles))
+    normals = np.concatenate((first_normals, second_normals, box.face_normals))
+    section = GeometryImport.exact_section(triangles, normals, 5.0)
+    lengths = _lengths(section)
+    # The ring of the box comes first and is closed, then the two half circles
+    np.testing.assert_allclose(sorted(lengths), sorted([40.0, 1600 * np.sin(np.pi / 80), 800 * np.sin(np.pi / 80)]))
+    np.testing.assert_allclose(lengths[0], 40.0)
+    ring = section[contour_ring_ids(section) == 0]
+    np.testing.assert_array_equal(ring[0], ring[-1])
+
+
+def test_part_without_contours_is_rejected(tmp_path):
+    # A flat sheet has no height, so no layer cuts it
+    path = str(tmp_path / 'flat.stl')
+    trimesh.Trimesh(np.array([[0, 0, 0], [10, 0, 0], [10, 10, 0], [0, 10, 0]]), [[0, 1, 2], [0, 2, 3]]).export(path)
+    with pytest.raises(ValueError, match='No layer'):
+        GeometryImport(path).parallel_generate_sequential_contour_points(engine='exact', processes=1)
@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import trimesh
+
+from IncrementalSlicing import IncrementalSlicer
+
+
+def _slicer(tmp_path, name='cache'):
+    return IncrementalSlicer(str(tmp_path / name), layer_height=1.0, processes=1)
+
+
+def _box(path, bump=False):
+    # A 20 x 20 x 5 mm box over the bands -3 to 2, optionally with a bump on its side in band 0
+    mesh = trimesh.creation.box((20, 20, 5))
+    if bump:
+        mesh = trimesh.util.concatenate([mesh, trimesh.creation.box((2, 4, 0.6)).apply_translation((10.5, 0, 0.5))])
+    mesh.export(path)
+    return path
+
+
+def test_changed_bands_replace_their_cache_files(tmp_path):
+    slicer = _slicer(tmp_path)
+    part = _box(str(tmp_path / 'part.stl'))
+    first = slicer.slice(part)
+    part_dir = slicer.part_cache_dir(part)
+    before = set(os.listdir(part_dir))
+    assert len(before) == slicer.last_report['bands'] == 6
+
+    # The revision is 1 mm lower: the top band goes and the other bands change
+    trimesh.creation.box((20, 20, 5)).apply_translation((0, 0, -1)).export(part)
+    slicer.slice(part)
+    after = set(os.listdir(part_dir))
+    assert slicer.last_report['removed'] == len(before - after) > 0
+    assert len(after) == slicer.last_report['bands']
+    assert not any(name.endswith('.part') for name in after)
+
+    _box(part)
+    np.testing.assert_array_equal(slicer.slice(part), first)
+
+
+def test_local_edit_reslices_only_its_bands(tmp_path):
+    slicer = _slicer(tmp_path)
+    part = _box(str(tmp_path / 'part.stl'))
+    slicer.slice(part)
+    _box(part, bump=True)
+    spliced = slicer.slice(part)
+    assert slicer.last_report['resliced'] == 1 and slicer.last_report['reused'] == 5
+
+    full = _slicer(tmp_path, 'fresh').slice(part)
+    np.testing.assert_array_equal(spliced, full)
+
+
+def test_parts_keep_their_own_cache(tmp_path):
+    slicer = _slicer(tmp_path)
+    first = _box(str(tmp_path / 'a.stl'))
+    second = _box(str(tmp_path / 'b.stl'), bump=True)
+    for part in (first, second):
+        slicer.slice(part)
+    for part in (first, second):
+        slicer.slice(part)
+        assert slicer.last_report['reused'] == 6 and slicer.last_report['removed'] == 0
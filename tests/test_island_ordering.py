@@ -0,0 +1,47 @@
+import numpy as np
+
+from IslandOrdering import air_travel, optimise_travel
+from PathResampling import contour_ring_ids
+
+
+def _square(centre, z, size=10.0, clockwise=False):
+    corners = np.array([[1, -1], [1, 1], [-1, 1], [-1, -1], [1, -1]]) * size / 2 + centre
+    corners = corners[::-1] if clockwise else corners
+    return np.column_stack((corners, np.full(5, z)))
+
+
+def _chain(first, last, z, n=5):
+    # An open chain of an open surface repeats its last point, see GeometryImport.exact_section
+    points = np.linspace(first, last, n)
+    return np.column_stack((np.vstack((points, points[-1:])), np.full(n + 1, z)))
+
+
+def test_islands_are_visited_in_a_short_order():
+    contours = np.vstack([_square((0, 0), 0.0), _square((100, 0), 0.0, clockwise=True), _square((10, 0), 0.0),
+                          _square((90, 0), 0.0)])
+    result, travel = optimise_travel(contours)
+    assert travel['after'] < travel['before'] and travel['after'] == air_travel(result)
+    ids = contour_ring_ids(result)
+    assert len(np.unique(ids)) == 4
+    # Every ring is counterclockwise and closed
+    for ring in np.unique(ids):
+        points = result[ids == ring]
+        np.testing.assert_array_equal(points[0], points[-1])
+        assert np.sum(points[:-1, 0] * points[1:, 1] - points[1:, 0] * points[:-1, 1]) > 0
+
+
+def test_open_chains_are_entered_at_an_end():
+    contours = np.vstack([_chain((0, 0), (50, 0), 0.0), _chain((0, 10), (50, 10), 0.0),
+                          _chain((0, 20), (50, 20), 0.0)])
+    result, travel = optimise_travel(contours)
+    # Back and forth: two steps of 10 mm between the chains, no chain is cut open
+    np.testing.assert_allclose(travel['after'], 20.0)
+    ids = contour_ring_ids(result)
+    assert len(np.unique(ids)) == 3
+    for ring in np.unique(ids):
+        points = result[ids == ring]
+        np.testing.assert_array_equal(points[-1], points[-2])
+        np.testing.assert_allclose(np.abs(points[-1, 0] - points[0, 0]), 50.0)
+    # The section of an open surface keeps the length of its chains
+    steps = np.linalg.norm(np.diff(result[:, :2], axis=0), axis=1)
+    np.testing.assert_allclose(steps[np.diff(ids) == 0].sum(), 150.0)
@@ -0,0 +1,146 @@
+"""
+The numba and numpy backends of Kernels must give the same results. Run with NUMBA_BOUNDSCHECK=1 (and a fresh
+NUMBA_CACHE_DIR) to turn out of bounds accesses of the compiled kernels into errors.
+"""
+
+import numpy as np
+import pytest
+from scipy.spatial import Delaunay
+
+import Kernels
+
+BACKENDS = Kernels.available_backends()
+needs_numba = pytest.mark.skipif('numba' not in BACKENDS, reason='numba is not installed')
+
+
+def _equal(output, reference):
+    if isinstance(reference, (list, tuple)):
+        assert len(output) == len(reference)
+        for a, b in zip(output, reference):
+            np.testing.assert_array_equal(a, b)
+    else:
+        np.testing.assert_array_equal(output, reference)
+
+
+@needs_numba
+@pytest.mark.parametrize('n_points', [0, 3, 2_000])
+def test_circumradius_filter_backends_agree(n_points):
+    rng = np.random.default_rng(0)
+    points = rng.random((n_points, 2)) * 100.0
+    simplices = Delaunay(points).simplices if n_points >= 3 else np.empty((0, 3), dtype=np.int32)
+    for alpha in (0.05, 0.5, 5.0):
+        _equal(Kernels.circumradius_filter(points, simplices, alpha, 'numba'),
+               Kernels.circumradius_filter(points, simplices, alpha, 'numpy'))
+
+
+def _closed_rings(rng, sizes):
+    nodes = rng.permutation(sum(sizes))
+    start, end, chains, offset = [], [], [], 0
+    for size in sizes:
+        ring = nodes[offset:offset + size]
+        start.append(ring)
+        end.append(np.roll(ring, -1))
+        chains.append(ring)
+        offset += size
+    order = rng.permutation(sum(sizes))
+    return np.concatenate(start)[order], np.concatenate(end)[order], chains
+
+
+def _open_chains(rng, sizes):
+    # A chain of k nodes has k - 1 segments, as a section of an open surface has
+    nodes = rng.permutation(sum(sizes))
+    start, end, chains, offset = [], [], [], 0
+    for size in sizes:
+        chain = nodes[offset:offset + size]
+        start.append(chain[:-1])
+        end.append(chain[1:])
+        chains.append(chain)
+        offset += size
+    order = rng.permutation(sum(sizes) - len(sizes))
+    return np.concatenate(start)[order], np.concatenate(end)[order], chains
+
+
+@needs_numba
+@pytest.mark.parametrize('make', [_closed_rings, _open_chains])
+def test_chain_segments_backends_agree(make):
+    rng = np.random.default_rng(1)
+    start, end, _ = make(rng, [3, 2, 50, 7, 1_000, 4])
+    numba_rings, numba_closed = Kernels.chain_segments(start, end, 'numba')
+    numpy_rings, numpy_closed = Kernels.chain_segments(start, end, 'numpy')
+    _equal(numba_rings, numpy_rings)
+    _equal(numba_closed, numpy_closed)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('make', [_closed_rings, _open_chains])
+def test_shuffled_segments_come_back_as_whole_chains(make, backend):
+    rng = np.random.default_rng(1)
+    start, end, chains = make(rng, [3, 2, 50, 7, 1_000, 4])
+    rings, closed = Kernels.chain_segments(start, end, backend)
+    is_ring = make is _closed_rings
+    # Rings of fewer than 3 nodes and chains of a single node are dropped
+    expected = [chain for chain in chains if len(chain) >= (3 if is_ring else 2)]
+    assert len(rings) == len(expected) and np.all(closed == is_ring)
+    by_node = {int(chain[0]): chain for chain in expected}
+    for ring in rings:
+        if is_ring:
+            # A ring may start at any of its nodes, it keeps its order
+            first = next(node for node in ring if int(node) in by_node)
+            ring = np.roll(ring, -int(np.flatnonzero(ring == first)[0]))
+        np.testing.assert_array_equal(ring, by_node[int(ring[0])])
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_open_chain_keeps_its_last_node(backend):
+    # 4 segments, 5 nodes: the chain visits one node more than it has segments
+    rings, closed = Kernels.chain_segments(np.array([0, 2, 1, 4]), np.array([2, 1, 4, 3]), backend)
+    assert len(rings) == 1 and not closed[0]
+    np.testing.assert_array_equal(rings[0], [0, 2, 1, 4, 3])
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_open_chain_out_of_order_comes_back_whole(backend):
+    rings, closed = Kernels.chain_segments(np.array([1, 4, 0, 2]), np.array([4, 3, 2, 1]), backend)
+    assert len(rings) == 1 and not closed[0]
+    np.testing.assert_array_equal(rings[0], [0, 2, 1, 4, 3])
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_chain_segments_of_empty_input(backend):
+    rings, closed = Kernels.chain_segments(np.empty(0, dtype=int), np.empty(0, dtype=int), backend)
+    assert rings == [] and len(closed) == 0
+
+
+@needs_numba
+@pytest.mark.parametrize('n_points', [0, 1, 2, 500])
+def test_nearest_neighbour_order_backends_agree(n_points):
+    points = np.random.default_rng(2).random((n_points, 3))
+    first = n_points // 2
+    order = Kernels.nearest_neighbour_order(points, first, 'numba')
+    _equal(order, Kernels.nearest_neighbour_order(points, first, 'numpy'))
+    assert sorted(order) == list(range(n_points))
+
+
+@needs_numba
+def test_nearest_neighbour_order_ties_go_to_the_lowest_index():
+    points = np.array([[0.0, 0.0], [1.0, 0.0], [-1.0, 0.0], [1.0, 0.0]])
+    _equal(Kernels.nearest_neighbour_order(points, 0, 'numba'), Kernels.nearest_neighbour_order(points, 0, 'numpy'))
+
+
+@needs_numba
+@pytest.mark.parametrize('include_low', [True, False])
+@pytest.mark.parametrize('n_points', [0, 1, 5_000])
+def test_band_bounds_backends_agree(include_low, n_points):
+    rng = np.random.default_rng(3)
+    # Rounded z values put points exactly on the band limits
+    z_sorted = np.sort(np.round(rng.random(n_points) * 10.0, 1))
+    z_low = np.arange(-0.5, 10.5, 0.5)
+    _equal(Kernels.band_bounds(z_sorted, z_low, z_low + 0.5, include_low, 'numba'),
+           Kernels.band_bounds(z_sorted, z_low, z_low + 0.5, include_low, 'numpy'))
+
+
+@needs_numba
+def test_band_bounds_without_bands():
+    z_sorted = np.linspace(0, 1, 10)
+    _equal(Kernels.band_bounds(z_sorted, np.empty(0), np.empty(0), True, 'numba'),
+           Kernels.band_bounds(z_sorted, np.empty(0), np.empty(0), True, 'numpy'))
@@ -0,0 +1,79 @@
+import numpy as np
+
+from Geometry4 import GeometryImport
+from RobotKinematics import IRB4600, JOINT_LIMITS
+
+
+def _random_joints(n, seed=0):
+    # Joint positions inside the limits, away from the wrist singularity
+    rng = np.random.default_rng(seed)
+    low, high = np.degrees(JOINT_LIMITS[:, 0]) + 1, np.degrees(JOINT_LIMITS[:, 1]) - 1
+    high[[3, 5]], low[[3, 5]] = 179.0, -179.0
+    joints = rng.uniform(low, high, (n, 6))
+    joints[:, 4] = np.where(joints[:, 4] < 0, np.minimum(joints[:, 4], -10), np.maximum(joints[:, 4], 10))
+    return joints
+
+
+def _targets(robot, joints):
+    position, orientation = robot.forward(joints)
+    return position, GeometryImport._matrix_to_quaternion(orientation)
+
+
+def _angle_difference(a, b):
+    return np.abs((a - b + 180) % 360 - 180)
+
+
+def _matching_solution(solutions, joints):
+    # Index of the solution of every target that equals the joints it was computed from
+    difference = np.nan_to_num(_angle_difference(solutions, joints[:, None, :]), nan=np.inf).max(axis=2)
+    return np.argmin(difference, axis=1), difference.min(axis=1)
+
+
+def test_forward_inverse_round_trip():
+    robot = IRB4600()
+    joints = _random_joints(500)
+    position, quaternion = _targets(robot, joints)
+    solutions, within = robot.inverse(position, quaternion)
+    index, difference = _matching_solution(solutions, joints)
+    assert difference.max() < 1e-6
+    assert np.all(within[np.arange(len(joints)), index])
+
+    # Every solution the solver returns reaches the target
+    target, configuration = np.nonzero(~np.isnan(solutions).any(axis=2))
+    reached, reached_orientation = robot.forward(solutions[target, configuration])
+    np.testing.assert_allclose(reached, position[target], atol=1e-6)
+    _, orientation = robot.forward(joints)
+    np.testing.assert_allclose(reached_orientation, orientation[target], atol=1e-9)
+
+
+def test_joint_limits_reject_solutions():
+    robot = IRB4600()
+    joints = np.array([[0.0, 20.0, 80.0, 0.0, 40.0, 0.0], [0.0, 20.0, -20.0, 0.0, 40.0, 0.0]])
+    solutions, within = robot.inverse(*_targets(robot, joints))
+    index, difference = _matching_solution(solutions, joints)
+    assert difference.max() < 1e-6
+    # Axis 3 at 80 degrees is beyond its limit of 75 degrees
+    assert not within[0, index[0]] and within[1, index[1]]
+
+    # 5 m away from the base is out of reach of every configuration
+    far, quaternion = np.array([[5000.0, 0.0, 1000.0]]), np.array([0.0, 0.0, 1.0, 0.0])
+    solutions, within = robot.inverse(far, quaternion)
+    assert np.isnan(solutions).any(axis=2).all() and not within.any()
+    result = robot.check_path(far, quaternion)
+    assert result['unreachable_segments'] == [(0, 0)] and not result['reachable_any'][0]
+
+
+def test_confdata_quadrants_follow_the_joints():
+    robot = IRB4600()
+    joints = np.array([[100.0, 10.0, -10.0, -30.0, 45.0, 170.0], [-100.0, 10.0, -10.0, 95.0, -45.0, -10.0],
+                       [10.0, 10.0, -10.0, 200.0, 45.0, -250.0]])
+    position, quaternion = _targets(robot, joints)
+    solutions, _ = robot.inverse(position, quaternion)
+    index, _ = _matching_solution(solutions, joints)
+    for target, cfx in enumerate(index):
+        result = robot.configure(position[[target]], quaternion[[target]], cfx=int(cfx))
+        expected = joints[target, [0, 3, 5]]
+        # Axes 4 and 6 come back in the turn closest to 0
+        expected = (expected + 180) % 360 - 180
+        np.testing.assert_array_equal(result['confdata'][0], np.append(np.floor(expected / 90), cfx))
+        np.testing.assert_allclose(_angle_difference(result['joints'][0], joints[target]), 0, atol=1e-6)
@@ -0,0 +1,38 @@
+import numpy as np
+
+from Geometry4 import GeometryImport
+
+
+def _wall_ring(n=100, tilt=0.02, outward=True):
+    # A ring on a nearly vertical wall whose normals alternate slightly above and below the horizontal, like the
+    # noisy normals of a scanned wall
+    angle = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    coordinates = np.column_stack((30 * np.cos(angle), 30 * np.sin(angle), np.zeros(n)))
+    nz = np.where(np.arange(n) % 2 == 0, tilt, -tilt)
+    normals = np.column_stack((np.cos(angle), np.sin(angle), nz + 0.1))
+    return coordinates, normals if outward else -normals
+
+
+def _tool_axes(q):
+    # Third column of the rotation matrix of the RAPID quaternions [q1, q2, q3, q4] = [w, x, y, z]
+    w, x, y, z = q.T
+    return np.column_stack((2 * (x * z + w * y), 2 * (y * z - w * x), 1 - 2 * (x * x + y * y)))
+
+
+def test_neighbouring_targets_keep_the_tool_side():
+    coordinates, normals = _wall_ring(tilt=0.2)
+    for smoothing in (0, 2):
+        axes = _tool_axes(GeometryImport.rot_T_ROB1(coordinates, normals, smoothing=smoothing))
+        # The tool axis points into the wall on every target and never turns over between neighbours
+        assert np.all(np.einsum('ij,ij->i', axes, normals) < 0)
+        assert np.all(np.einsum('ij,ij->i', axes, np.roll(axes, 1, axis=0)) > 0.5)
+
+
+def test_the_side_follows_the_reference_for_the_whole_path():
+    coordinates, normals = _wall_ring(outward=False)
+    up = GeometryImport.orient_normals(normals)
+    assert np.all(np.einsum('ij,ij->i', up, -normals) > 0)
+    down = GeometryImport.orient_normals(normals, reference=(0, 0, -1))
+    np.testing.assert_allclose(down, normals / np.linalg.norm(normals, axis=1, keepdims=True))
+    offset = GeometryImport.offset_along_normals(coordinates, normals, 2.0)
+    np.testing.assert_allclose(np.linalg.norm(offset[:, :2], axis=1), 30 + 2 * np.linalg.norm(up[:, :2], axis=1))
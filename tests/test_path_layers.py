@@ -0,0 +1,47 @@
+import numpy as np
+
+from CycleTime import estimate_cycle_time
+from Geometry4 import GeometryImport
+from PathResampling import is_spiral_path, path_layers
+from RAPIDCodeGenerator import RAPIDGenerator
+
+
+def _layered(layers=5, n=60):
+    # Closed rings of a funnel whose radius shrinks with z, slightly off the origin
+    angle = np.linspace(0, 2 * np.pi, n)
+    return np.vstack([np.column_stack((3 + (40 - 2 * layer) * np.cos(angle), -2 + (40 - 2 * layer) * np.sin(angle),
+                                       np.full(n, 0.5 * layer))) for layer in range(layers)])
+
+
+def test_layered_path_keeps_its_layers_and_stops():
+    path = _layered()
+    assert not is_spiral_path(path)
+    np.testing.assert_array_equal(path_layers(path), np.repeat(np.arange(5), 60))
+    stops = RAPIDGenerator.layer_stops(path)
+    np.testing.assert_array_equal(np.flatnonzero(stops), np.arange(59, 300, 60))
+
+
+def test_spiral_path_stops_at_its_end_and_splits_into_turns():
+    spiral = GeometryImport.spiral_toolpath(_layered(), points_per_layer=100)
+    n = len(spiral)
+    assert is_spiral_path(spiral)
+    # Five turns of 100 points, the last one flat and closed by the last target
+    np.testing.assert_array_equal(path_layers(spiral), np.minimum(np.arange(n) // 100, 4))
+    np.testing.assert_array_equal(np.flatnonzero(RAPIDGenerator.layer_stops(spiral)), [n - 1])
+
+    module = RAPIDGenerator().MoveL(spiral)
+    assert module.count(', fine,') == 1
+    modules = RAPIDGenerator().LayerModules(spiral)
+    assert len(modules) == 5 + 1
+    estimate = estimate_cycle_time(spiral)
+    # The robot starts from rest and stops once, at the end of the path
+    assert estimate['fine_points'] == 2
+    assert len(estimate['layers']) == 5
+
+
+def test_clockwise_spiral_turns_are_counted():
+    spiral = GeometryImport.spiral_toolpath(_layered(), points_per_layer=100)[::-1]
+    layers = path_layers(spiral)
+    assert layers[0] == 0 and layers[-1] == 4
+    assert np.all(np.diff(layers) >= 0)
+    np.testing.assert_array_equal(np.bincount(layers)[1:4], [100, 100, 100])
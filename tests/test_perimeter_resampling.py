@@ -0,0 +1,26 @@
+import numpy as np
+import shapely
+
+from Geometry import GeometryImport
+
+
+def test_concave_layer_is_resampled_on_its_contour():
+    # Points on the outline of an L shaped wall in two bands, the contour the resampled points have to follow
+    l_shape = shapely.Polygon([(0, 0), (40, 0), (40, 15), (15, 15), (15, 40), (0, 40)])
+    rng = np.random.default_rng(0)
+    outline = shapely.line_interpolate_point(l_shape.exterior, rng.uniform(0, l_shape.length, 5000))
+    data = np.tile(shapely.get_coordinates(outline), (2, 1))
+    lower, upper = np.array([0, 5000]), np.array([5000, 10000])
+    resampled = GeometryImport.resample_perimeters(data, lower, upper, np.array([0.0, 1.0]), 55, 2.0,
+                                                   alpha_value=0.5)
+
+    assert set(np.unique(resampled[:, 2])) == {0.0, 1.0}
+    distance = shapely.distance(l_shape.exterior, shapely.points(resampled[:, :2]))
+    # The convex hull would miss the inner corner by 17.7 mm
+    assert distance.max() < 1.5
+    for z in (0.0, 1.0):
+        ring = resampled[resampled[:, 2] == z]
+        np.testing.assert_array_equal(ring[0], ring[-1])
+        steps = np.linalg.norm(np.diff(ring[:, :2], axis=0), axis=1)
+        assert abs(steps.sum() - l_shape.length) < 2.0
+        assert steps.max() < 2.0 + 1e-9
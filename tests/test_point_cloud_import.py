@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from PointCloudImport import iter_point_chunks
+
+
+def _read(path):
+    chunks = list(iter_point_chunks(str(path)))
+    points = np.vstack([points for points, _ in chunks])
+    normals = [normals for _, normals in chunks]
+    return points, None if any(n is None for n in normals) else np.vstack(normals)
+
+
+def _cloud(n=50):
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-10, 10, (n, 3))
+    normals = points / np.linalg.norm(points, axis=1, keepdims=True)
+    colours = rng.integers(0, 256, (n, 3)).astype(float)
+    return points, normals, colours
+
+
+def test_colour_columns_are_not_read_as_normals(tmp_path):
+    points, _, colours = _cloud()
+    path = tmp_path / 'scan.csv'
+    np.savetxt(path, np.hstack((points, colours)), delimiter=',', header='x,y,z,red,green,blue', comments='',
+               fmt='%.6f')
+    read, normals = _read(path)
+    np.testing.assert_allclose(read, points, atol=1e-6)
+    assert normals is None
+
+
+def test_columns_are_found_by_header_name(tmp_path):
+    points, normals, colours = _cloud()
+    path = tmp_path / 'scan.txt'
+    # CloudCompare order and spelling
+    np.savetxt(path, np.hstack((points, colours, normals)), delimiter=',', header='//X,Y,Z,R,G,B,Nx,Ny,Nz',
+               comments='', fmt='%.6f')
+    read, read_normals = _read(path)
+    np.testing.assert_allclose(read, points, atol=1e-6)
+    np.testing.assert_allclose(read_normals, normals, atol=1e-6)
+
+
+def test_headerless_file_has_no_normals(tmp_path):
+    points, _, colours = _cloud()
+    path = tmp_path / 'scan.xyz'
+    np.savetxt(path, np.hstack((points, colours)), fmt='%.6f')
+    read, normals = _read(path)
+    np.testing.assert_allclose(read, points, atol=1e-6)
+    assert normals is None
+
+
+def test_header_without_coordinates_is_rejected(tmp_path):
+    path = tmp_path / 'scan.csv'
+    np.savetxt(path, np.ones((3, 3)), delimiter=',', header='a,b,c', comments='')
+    with pytest.raises(ValueError):
+        _read(path)
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+import trimesh
+
+from PointStore import PointStore
+
+
+def test_default_sampling_is_chunked():
+    mesh = trimesh.creation.box((20, 20, 5))
+    store = PointStore.from_mesh(mesh, 200_000, seed=0)
+    assert store.chunk_size() < len(store.points)
+    # The temporaries of one chunk, not of all 200000 points
+    assert store.estimated_peak_bytes < store.nbytes + 160 * 100_000
+    assert np.all(np.abs(store.points) <= np.array([10, 10, 2.5]) + 1e-9)
+    np.testing.assert_array_equal(np.linalg.norm(store.normals, axis=1).round(12), 1.0)
+
+
+def test_budget_too_small_is_rejected():
+    with pytest.raises(ValueError):
+        PointStore(100_000, memory_budget=100_000 * 24)
+    store = PointStore(100_000, dtype=np.float32, memory_budget=100_000 * 48)
+    assert store.chunk_size() == (100_000 * 48 - store.nbytes) // 160
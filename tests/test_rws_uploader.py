@@ -0,0 +1,49 @@
+import re
+import urllib.error
+
+import numpy as np
+import pytest
+
+from RAPIDCodeGenerator import RAPIDGenerator
+from RWSUploader import ModuleUploader, RWSClient, StandInRWS
+
+
+def _path(layers=3):
+    square = np.array([[1, 0], [0, 1], [-1, 0], [0, -1]]) * 50.0
+    return np.vstack([np.column_stack((square, np.full(4, 0.5 * layer))) for layer in range(layers)])
+
+
+def test_routines_are_not_named_like_their_modules():
+    modules = RAPIDGenerator().LayerModules(_path())
+    for name, text in modules.items():
+        routines = re.findall(r'PROC (\w+)\(\)', text)
+        assert name not in routines
+    assert re.findall(r'PROC (\w+)\(\)', modules['Layer_002']) == ['Path_002']
+    assert re.findall(r'^    (\w+); $', modules['Module1'], flags=re.M) == ['Path_001', 'Path_002', 'Path_003']
+    with pytest.raises(ValueError):
+        RAPIDGenerator().LayerModules(_path(), prefix='Layer', routine_prefix='Layer')
+
+
+def test_stale_modules_are_unloaded_with_the_rws_1_request(tmp_path):
+    generator = RAPIDGenerator()
+    manifest = str(tmp_path / 'manifest.json')
+    with StandInRWS() as server:
+        ModuleUploader(RWSClient(server.url), manifest_path=manifest).upload(generator.LayerModules(_path(3)))
+        shorter = generator.LayerModules(_path(2))
+        report = ModuleUploader(RWSClient(server.url), manifest_path=manifest).upload(shorter)
+        assert report['unloaded'] == ['Layer_003']
+        assert server.modules == shorter
+        unload = server.requests[-1]
+        assert unload['path'] == '/rw/rapid/tasks/T_ROB1'
+        assert unload['query']['action'] == 'unloadmod' and unload['form'] == {'module': 'Layer_003'}
+
+
+def test_stand_in_rejects_unknown_requests():
+    with StandInRWS() as server:
+        client = RWSClient(server.url)
+        # The RWS 2.0 form of unloadmod is not a request of RWS 1.0
+        with pytest.raises(urllib.error.HTTPError) as error:
+            client._do_post('rw/rapid/tasks/T_ROB1/unloadmod', payload={'module': 'Layer_001'})
+        assert error.value.code == 400
+        with pytest.raises(urllib.error.HTTPError):
+            client._do_post('rw/rapid/modules/Layer_001?task=T_ROB1&action=set-text', payload={'text': ''})
@@ -0,0 +1,18 @@
+import trimesh
+
+from SlicingService import SlicingService
+
+
+def test_finished_jobs_are_forgotten(tmp_path):
+    part = str(tmp_path / 'box.stl')
+    trimesh.creation.box((20, 20, 5)).export(part)
+    service = SlicingService(processes=1, jobs=1, max_jobs=2)
+    params = {'number_sampling_points': 5_000, 'layer_height': 1.0}
+    jobs = [service.submit(part, params) for _ in range(4)]
+    for job in jobs:
+        events = list(job.follow())
+        assert events[-1]['event'] == 'done'
+    service.executor.shutdown(wait=True)
+    # Only the two most recent finished jobs are kept
+    assert list(service.jobs) == [jobs[2].id, jobs[3].id]
+    assert service.health()['jobs'] == 2
@@ -0,0 +1,43 @@
+import numpy as np
+
+from Telemetry import path_deviation
+
+
+def _brute_force(actual, planned):
+    start, direction = planned[:-1], np.diff(planned, axis=0)
+    lengths = np.einsum('ij,ij->i', direction, direction)
+    offset = actual[:, None, :] - start[None, :, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.clip(np.nan_to_num(np.einsum('mnk,nk->mn', offset, direction) / lengths), 0, 1)
+    closest = start[None] + t[..., None] * direction[None]
+    return np.linalg.norm(actual[:, None, :] - closest, axis=2).min(axis=1)
+
+
+def _layers_with_approach(points_per_layer=200, layers=3):
+    angle = np.linspace(0, 2 * np.pi, points_per_layer)
+    rings = [np.column_stack((40 * np.cos(angle), 40 * np.sin(angle), np.full_like(angle, -0.5 * layer)))
+             for layer in range(layers)]
+    # A 300 mm approach move from above the part, then the layers with their steps down
+    return np.vstack([[[40.0, 0.0, 300.0]]] + rings)
+
+
+def test_deviation_with_approach_and_layer_change_matches_brute_force():
+    planned = _layers_with_approach()
+    rng = np.random.default_rng(0)
+    # Points on the approach move, on the layer changes and on the rings, with noise
+    parameter = rng.uniform(0, len(planned) - 1, 2000)
+    index = np.minimum(parameter.astype(int), len(planned) - 2)
+    actual = planned[index] + (parameter - index)[:, None] * (planned[index + 1] - planned[index])
+    actual += rng.normal(0, 0.2, actual.shape)
+
+    result = path_deviation(actual, planned)
+    np.testing.assert_allclose(result['distance'], _brute_force(actual, planned), atol=1e-9)
+    on_segment = np.linalg.norm(actual - result['closest'], axis=1)
+    np.testing.assert_allclose(on_segment, result['distance'], atol=1e-9)
+
+
+def test_long_approach_does_not_grow_the_candidates():
+    planned = _layers_with_approach(points_per_layer=4000, layers=4)
+    actual = planned[1:] + np.random.default_rng(1).normal(0, 0.05, planned[1:].shape)
+    result = path_deviation(actual, planned)
+    assert result['max'] < 0.5
@@ -0,0 +1,62 @@
+import numpy as np
+import shapely
+
+from Geometry4 import GeometryImport
+from PathResampling import contour_ring_ids, ring_bounds
+
+
+def _cone_ring(radius, wall_angle, z=0.0, n=720):
+    # A counterclockwise ring of a cone wall with outward normals, the wall at wall_angle degrees from horizontal
+    angle = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    slope = np.radians(wall_angle)
+    ring = np.column_stack((radius * np.cos(angle), radius * np.sin(angle), np.full(n, z),
+                            np.sin(slope) * np.cos(angle), np.sin(slope) * np.sin(angle), np.full(n, np.cos(slope))))
+    return np.vstack((ring, ring[:1]))
+
+
+def _polygon_ring(xy, z=0.0):
+    # Closed ring of a prism with vertical walls; the normal of every point is the one of the edge starting there
+    xy = np.asarray(xy, dtype=float)
+    edges = np.roll(xy, -1, axis=0) - xy
+    normals = np.column_stack((edges[:, 1], -edges[:, 0], np.zeros(len(xy))))
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    ring = np.column_stack((xy, np.full(len(xy), z), normals))
+    return np.vstack((ring, ring[:1]))
+
+
+def test_sloped_wall_is_offset_to_the_section_of_the_offset_surface():
+    contours = np.vstack((_cone_ring(40.0, 90.0, z=0.0), _cone_ring(40.0, 45.0, z=1.0)))
+    offset = GeometryImport.offset_contours_along_normals(contours, 3.0)
+    radius = np.linalg.norm(offset[:, :2], axis=1)
+    # Vertical wall: the flat offset. 45 degrees: the ball centre at p + r n lies 3 / sqrt(2) above the layer,
+    # in the layer plane the offset surface is 3 sqrt(2) away
+    np.testing.assert_allclose(radius[offset[:, 2] == 0.0], 43.0, atol=0.01)
+    np.testing.assert_allclose(radius[offset[:, 2] == 1.0], 40.0 + 3.0 * np.sqrt(2), atol=0.01)
+    # Layers stay in their planes and keep their normals
+    assert set(np.unique(offset[:, 2])) == {0.0, 1.0}
+    assert offset.shape[1] == 6
+
+
+def test_vertical_prism_matches_the_flat_buffer():
+    square = [(0, 0), (20, 0), (20, 20), (0, 20)]
+    offset = GeometryImport.offset_contours_along_normals(_polygon_ring(square), 2.0)
+    expected = shapely.Polygon(square).buffer(2.0, quad_segs=8)
+    result = shapely.Polygon(offset[:, :2])
+    assert result.is_valid
+    assert abs(result.area - expected.area) / expected.area < 1e-3
+    assert result.symmetric_difference(expected).area < 0.05
+
+
+def test_concave_corner_loop_and_collapsed_island_are_removed():
+    l_shape = [(0, 0), (10, 0), (10, 4), (4, 4), (4, 10), (0, 10)]
+    small = [(30, 0), (31, 0), (31, 1), (30, 1)]
+    contours = np.vstack((_polygon_ring(l_shape), _polygon_ring(small)))
+    inside = GeometryImport.offset_contours_along_normals(contours, -1.0)
+    starts, counts = ring_bounds(contour_ring_ids(inside))
+    # The unit square shrinks away, the L keeps one ring without the loops of its concave corner
+    assert len(starts) == 1
+    result = shapely.Polygon(inside[:, :2])
+    assert result.is_valid
+    np.testing.assert_allclose(result.area, shapely.Polygon(l_shape).buffer(-1.0, quad_segs=8).area, rtol=1e-3)
+    outside = GeometryImport.offset_contours_along_normals(_polygon_ring(l_shape), 1.0)
+    assert shapely.Polygon(outside[:, :2]).is_valid